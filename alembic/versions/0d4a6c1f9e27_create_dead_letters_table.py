@@ -0,0 +1,39 @@
+"""CREATE DEAD LETTERS TABLE
+
+Revision ID: 0d4a6c1f9e27
+Revises: b6d2e8f04a13
+Create Date: 2026-10-18 17:05:13.447102
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0d4a6c1f9e27'
+down_revision: Union[str, Sequence[str], None] = 'b6d2e8f04a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'dead_letters',
+        sa.Column('notification_id', sa.Uuid(as_uuid=False), nullable=False),
+        sa.Column('channel', sa.String(), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('error_class', sa.String(length=255), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('failed_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()'), nullable=False),
+        sa.PrimaryKeyConstraint('notification_id', 'channel')
+    )
+    op.create_index('ix_dead_letters_channel_failed_at', 'dead_letters', ['channel', 'failed_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_dead_letters_channel_failed_at', table_name='dead_letters')
+    op.drop_table('dead_letters')
@@ -0,0 +1,37 @@
+"""CREATE NOTIFICATION DELIVERIES TABLE
+
+Revision ID: 153c5adbeb30
+Revises: a521f97880bc
+Create Date: 2026-10-18 10:02:47.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '153c5adbeb30'
+down_revision: Union[str, Sequence[str], None] = 'a521f97880bc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'notification_deliveries',
+        sa.Column('notification_id', sa.String(), sa.ForeignKey('notifications.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('channel', sa.String(), primary_key=True),
+        sa.Column('status', sa.String(), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default=sa.text('0')),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()')),
+        sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('notification_deliveries')
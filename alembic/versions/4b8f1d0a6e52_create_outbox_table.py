@@ -0,0 +1,34 @@
+"""CREATE OUTBOX TABLE
+
+Revision ID: 4b8f1d0a6e52
+Revises: 7d3e9c21b4f6
+Create Date: 2026-10-18 11:52:31.604417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b8f1d0a6e52'
+down_revision: Union[str, Sequence[str], None] = '7d3e9c21b4f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'outbox',
+        sa.Column('id', sa.BigInteger(), primary_key=True, autoincrement=True),
+        sa.Column('notification_id', sa.String(), nullable=False),
+        sa.Column('channels', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()'))
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('outbox')
@@ -0,0 +1,34 @@
+"""CREATE IDEMPOTENCY KEYS TABLE
+
+Revision ID: 7d3e9c21b4f6
+Revises: 153c5adbeb30
+Create Date: 2026-10-18 11:14:05.318220
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d3e9c21b4f6'
+down_revision: Union[str, Sequence[str], None] = '153c5adbeb30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('user_id', sa.Integer(), primary_key=True),
+        sa.Column('key', sa.String(length=255), primary_key=True),
+        sa.Column('notification_id', sa.String(), sa.ForeignKey('notifications.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()'))
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('idempotency_keys')
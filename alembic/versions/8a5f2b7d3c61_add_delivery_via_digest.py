@@ -0,0 +1,32 @@
+"""ADD DELIVERY VIA DIGEST
+
+Revision ID: 8a5f2b7d3c61
+Revises: 0d4a6c1f9e27
+Create Date: 2026-10-18 18:21:37.902615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a5f2b7d3c61'
+down_revision: Union[str, Sequence[str], None] = '0d4a6c1f9e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A constant default is a catalog-only change on PostgreSQL 11+, no rewrite
+    op.add_column(
+        'notification_deliveries',
+        sa.Column('via_digest', sa.Boolean(), server_default=sa.false(), nullable=False)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('notification_deliveries', 'via_digest')
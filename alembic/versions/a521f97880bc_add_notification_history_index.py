@@ -0,0 +1,41 @@
+"""ADD NOTIFICATION HISTORY INDEX
+
+Revision ID: a521f97880bc
+Revises: a1ff5f8524cb
+Create Date: 2026-10-18 09:40:12.418733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a521f97880bc'
+down_revision: Union[str, Sequence[str], None] = 'a1ff5f8524cb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Serves keyset pagination of a user's history: WHERE user_id = ? AND (created_at, id) < (?, ?)
+    # Built concurrently so large tables stay writable during the migration
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_notifications_user_created_id',
+            'notifications',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_notifications_user_created_id',
+            table_name='notifications',
+            postgresql_concurrently=True,
+        )
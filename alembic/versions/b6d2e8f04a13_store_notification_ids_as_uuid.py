@@ -0,0 +1,52 @@
+"""STORE NOTIFICATION IDS AS UUID
+
+Revision ID: b6d2e8f04a13
+Revises: f3c81d9a5b07
+Create Date: 2026-10-18 16:12:40.518327
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d2e8f04a13'
+down_revision: Union[str, Sequence[str], None] = 'f3c81d9a5b07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Every column holding a notification id. Existing uuid4 strings convert as
+# they are; new ids are UUIDv7. Each ALTER rewrites its table (and, for
+# notifications, every attached partition) under an exclusive lock, so run
+# this in a maintenance window on large deployments.
+ID_COLUMNS = (
+    ("notifications", "id"),
+    ("notification_deliveries", "notification_id"),
+    ("idempotency_keys", "notification_id"),
+    ("outbox", "notification_id"),
+    ("scheduled_notifications", "notification_id"),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, column in ID_COLUMNS:
+        op.alter_column(
+            table, column,
+            type_=sa.Uuid(as_uuid=False),
+            existing_type=sa.String(),
+            postgresql_using=f"{column}::uuid",
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, column in ID_COLUMNS:
+        op.alter_column(
+            table, column,
+            type_=sa.String(),
+            existing_type=sa.Uuid(as_uuid=False),
+            postgresql_using=f"{column}::text",
+        )
@@ -0,0 +1,37 @@
+"""ADD NOTIFICATION SCHEDULING
+
+Revision ID: c92a5e7f13d8
+Revises: 4b8f1d0a6e52
+Create Date: 2026-10-18 12:40:09.527716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c92a5e7f13d8'
+down_revision: Union[str, Sequence[str], None] = '4b8f1d0a6e52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable with no default: a metadata-only change, no table rewrite
+    op.add_column('notifications', sa.Column('scheduled_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_table(
+        'scheduled_notifications',
+        sa.Column('notification_id', sa.String(), primary_key=True),
+        sa.Column('due_at', sa.DateTime(timezone=True), nullable=False)
+    )
+    op.create_index('ix_scheduled_notifications_due_at', 'scheduled_notifications', ['due_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_scheduled_notifications_due_at', table_name='scheduled_notifications')
+    op.drop_table('scheduled_notifications')
+    op.drop_column('notifications', 'scheduled_at')
@@ -0,0 +1,44 @@
+"""ADD UNFINISHED NOTIFICATIONS INDEX
+
+Revision ID: d4e6a9b2c715
+Revises: 8a5f2b7d3c61
+Create Date: 2026-10-18 21:04:12.318840
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4e6a9b2c715'
+down_revision: Union[str, Sequence[str], None] = '8a5f2b7d3c61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UNFINISHED = "status IN ('PENDING', 'RETRYING')"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Serves the pending_notifications gauge, a count of the few unfinished notifications.
+    # A partitioned index can't be built concurrently: create it on the parent
+    # only, build each partition's concurrently, then attach them
+    op.execute(f"CREATE INDEX ix_notifications_unfinished ON ONLY notifications (scheduled_at) WHERE {UNFINISHED}")
+    partitions = op.get_bind().execute(sa.text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'notifications'::regclass"
+    )).scalars().all()
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_unfinished_idx "
+                f"ON {partition} (scheduled_at) WHERE {UNFINISHED}"
+            )
+            op.execute(f"ALTER INDEX ix_notifications_unfinished ATTACH PARTITION {partition}_unfinished_idx")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Drops the partitions' indexes with it
+    op.drop_index('ix_notifications_unfinished', table_name='notifications')
@@ -0,0 +1,56 @@
+"""CREATE TEMPLATES TABLES
+
+Revision ID: e5a0b7c4d219
+Revises: c92a5e7f13d8
+Create Date: 2026-10-18 13:21:44.805391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a0b7c4d219'
+down_revision: Union[str, Sequence[str], None] = 'c92a5e7f13d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'templates',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(), nullable=False, unique=True),
+        sa.Column('version', sa.Integer(), nullable=False, server_default=sa.text('1')),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()')),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True)
+    )
+    op.create_index('ix_templates_id', 'templates', ['id'])
+    op.create_table(
+        'template_versions',
+        sa.Column('template_id', sa.Integer(), sa.ForeignKey('templates.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('version', sa.Integer(), primary_key=True),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()'))
+    )
+    op.add_column('notifications', sa.Column('template_id', sa.Integer(), sa.ForeignKey('templates.id'), nullable=True))
+    op.add_column('notifications', sa.Column('template_version', sa.Integer(), nullable=True))
+    op.add_column('notifications', sa.Column('variables', sa.JSON(), nullable=True))
+    op.alter_column('notifications', 'title', existing_type=sa.String(), nullable=True)
+    op.alter_column('notifications', 'message', existing_type=sa.String(), nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column('notifications', 'message', existing_type=sa.String(), nullable=False)
+    op.alter_column('notifications', 'title', existing_type=sa.String(), nullable=False)
+    op.drop_column('notifications', 'variables')
+    op.drop_column('notifications', 'template_version')
+    op.drop_column('notifications', 'template_id')
+    op.drop_table('template_versions')
+    op.drop_index('ix_templates_id', table_name='templates')
+    op.drop_table('templates')
@@ -0,0 +1,94 @@
+"""PARTITION NOTIFICATIONS BY MONTH
+
+Revision ID: f3c81d9a5b07
+Revises: e5a0b7c4d219
+Create Date: 2026-10-18 14:36:52.190284
+
+"""
+from typing import Sequence, Union
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c81d9a5b07'
+down_revision: Union[str, Sequence[str], None] = 'e5a0b7c4d219'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Empty monthly partitions created up front; the beat task keeps this many ahead
+MONTHS_AHEAD = 3
+
+
+def month_start(moment: datetime, offset: int = 0) -> datetime:
+    month_index = moment.year * 12 + moment.month - 1 + offset
+    return datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The existing table becomes the partition for everything before next month,
+    # attached in place: no rows are copied.
+    now = datetime.now(timezone.utc)
+    boundary = month_start(now, 1).isoformat()
+
+    # Slow parts first, without blocking writes
+    with op.get_context().autocommit_block():
+        op.execute("UPDATE notifications SET created_at = NOW() WHERE created_at IS NULL")
+        op.execute(
+            "ALTER TABLE notifications ADD CONSTRAINT notifications_legacy_range "
+            f"CHECK (created_at IS NOT NULL AND created_at < '{boundary}') NOT VALID"
+        )
+        op.execute("ALTER TABLE notifications VALIDATE CONSTRAINT notifications_legacy_range")
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY notifications_legacy_pkey_new "
+            "ON notifications (id, created_at)"
+        )
+
+    # Then a short, metadata-only swap
+    op.execute("ALTER TABLE notifications ALTER COLUMN created_at SET NOT NULL")  # Proven by the check
+    op.execute("ALTER TABLE notification_deliveries DROP CONSTRAINT IF EXISTS notification_deliveries_notification_id_fkey")
+    op.execute("ALTER TABLE idempotency_keys DROP CONSTRAINT IF EXISTS idempotency_keys_notification_id_fkey")
+    op.execute("ALTER TABLE notifications DROP CONSTRAINT notifications_pkey")
+    op.execute("ALTER TABLE notifications ADD CONSTRAINT notifications_legacy_pkey PRIMARY KEY USING INDEX notifications_legacy_pkey_new")
+    op.execute("ALTER INDEX ix_notifications_user_created_id RENAME TO notifications_legacy_user_created_id_idx")
+    op.execute("ALTER TABLE notifications RENAME TO notifications_legacy")
+
+    op.execute("CREATE TABLE notifications (LIKE notifications_legacy INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+    op.execute("ALTER TABLE notifications ADD CONSTRAINT notifications_pkey PRIMARY KEY (id, created_at)")
+    op.execute("ALTER TABLE notifications ADD FOREIGN KEY (user_id) REFERENCES users (id)")
+    op.execute("ALTER TABLE notifications ADD FOREIGN KEY (template_id) REFERENCES templates (id)")
+    op.execute("CREATE INDEX ix_notifications_user_created_id ON notifications (user_id, created_at DESC, id DESC)")
+    # Matching indexes already exist on the legacy table, so attaching builds nothing
+    op.execute(f"ALTER TABLE notifications ATTACH PARTITION notifications_legacy FOR VALUES FROM (MINVALUE) TO ('{boundary}')")
+    op.execute("ALTER TABLE notifications_legacy DROP CONSTRAINT notifications_legacy_range")
+
+    for offset in range(1, MONTHS_AHEAD + 2):
+        start, end = month_start(now, offset), month_start(now, offset + 1)
+        op.execute(
+            f"CREATE TABLE notifications_p{start.year:04d}_{start.month:02d} PARTITION OF notifications "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Copies every row back into a single heap
+    op.execute("CREATE TABLE notifications_unpartitioned (LIKE notifications INCLUDING DEFAULTS)")
+    op.execute("INSERT INTO notifications_unpartitioned SELECT * FROM notifications")
+    op.execute("DROP TABLE notifications CASCADE")
+    op.execute("ALTER TABLE notifications_unpartitioned RENAME TO notifications")
+    op.execute("ALTER TABLE notifications ADD PRIMARY KEY (id)")
+    op.execute("ALTER TABLE notifications ADD FOREIGN KEY (user_id) REFERENCES users (id)")
+    op.execute("ALTER TABLE notifications ADD FOREIGN KEY (template_id) REFERENCES templates (id)")
+    op.execute("CREATE INDEX ix_notifications_user_created_id ON notifications (user_id, created_at DESC, id DESC)")
+    op.execute(
+        "ALTER TABLE notification_deliveries ADD FOREIGN KEY (notification_id) "
+        "REFERENCES notifications (id) ON DELETE CASCADE"
+    )
+    op.execute(
+        "ALTER TABLE idempotency_keys ADD FOREIGN KEY (notification_id) "
+        "REFERENCES notifications (id) ON DELETE CASCADE"
+    )
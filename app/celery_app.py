@@ -1,4 +1,6 @@
 from celery import Celery
+from kombu import Queue
+from celery.signals import worker_init, task_prerun, worker_process_shutdown
 import os
 from dotenv import load_dotenv
 
@@ -20,4 +22,73 @@ app.conf.update(
     enable_utc=True,
 ) 
 
+# Each channel is delivered from its own queue so a slow provider only backs up
+# its own pool. Run one worker per queue with its own concurrency and prefetch, e.g.
+#   celery -A app.celery_app worker -Q email -c 32 --prefetch-multiplier 1 -n email@%h
+#   celery -A app.celery_app worker -Q in_app -c 8 --prefetch-multiplier 16 -n in_app@%h
+#   celery -A app.celery_app worker -Q celery -n dispatch@%h   (fan-out tasks)
+CHANNEL_QUEUES = ("email", "sms", "push", "in_app")
+
+# Per-worker task rate limits, e.g. EMAIL_RATE_LIMIT=50/s (unset = unlimited)
+CHANNEL_RATE_LIMITS = {
+    channel: os.getenv(f"{channel.upper()}_RATE_LIMIT") for channel in CHANNEL_QUEUES
+}
+
+app.conf.task_queues = [Queue("celery")] + [Queue(channel) for channel in CHANNEL_QUEUES]
+app.conf.task_routes = {
+    f"app.workers.notification_tasks.deliver_{channel}": {"queue": channel}
+    for channel in CHANNEL_QUEUES
+}
+
+# Periodic maintenance; run one scheduler with: celery -A app.celery_app beat
+app.conf.beat_schedule = {
+    "maintain-notification-partitions": {
+        "task": "app.workers.retention.maintain_partitions",
+        "schedule": 6 * 3600,
+    },
+    "archive-expired-notification-partitions": {
+        "task": "app.workers.retention.archive_expired_partitions",
+        "schedule": 24 * 3600,
+    },
+    "flush-notification-digests": {
+        "task": "app.workers.digests.flush_digests",
+        "schedule": float(os.getenv("DIGEST_FLUSH_INTERVAL_SECONDS", 10)),
+    },
+    "measure-pending-notifications": {
+        "task": "app.workers.notification_tasks.measure_pending_notifications",
+        "schedule": float(os.getenv("PENDING_GAUGE_INTERVAL_SECONDS", 30)),
+    },
+}
+
+# Metrics are exported off the delivery path. In multiprocess mode the pool
+# parent exports the aggregate; otherwise each task-running process exports its own.
+@worker_init.connect
+def _start_worker_metrics(**kwargs):
+    from app.services.metrics import ensure_metrics_exporter
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        ensure_metrics_exporter()
+
+@task_prerun.connect
+def _start_process_metrics(**kwargs):
+    from app.services.metrics import ensure_metrics_exporter
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        ensure_metrics_exporter()
+
+# Cached user routing data follows updates made through the API
+@task_prerun.connect
+def _start_invalidation_listener(**kwargs):
+    from app.services.user_cache import ensure_invalidation_listener
+    ensure_invalidation_listener()
+
+# A recycled pool child leaves neither live gauges nor a Pushgateway group behind
+@worker_process_shutdown.connect
+def _mark_metrics_process_dead(pid=None, **kwargs):
+    from app.services.metrics import mark_process_dead, delete_pushed_metrics
+    mark_process_dead(pid)
+    delete_pushed_metrics()
+
+# Modules that only register maintenance tasks are loaded by the worker at
+# startup; importing them here would cycle back into notification_tasks
+app.conf.include = ["app.workers.retention", "app.workers.dead_letters", "app.workers.digests"]
+
 from app.workers import notification_tasks
\ No newline at end of file
@@ -1,18 +1,81 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker, Session
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# The API runs on asyncpg; derive its URL from DATABASE_URL unless given explicitly
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or make_url(DATABASE_URL).set(
+    drivername="postgresql+asyncpg"
+)
 
-engine = create_engine(DATABASE_URL)
+# Pool sizing (per process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+
+pool_settings = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+)
+
+# Sync engine: Celery workers and Alembic
+engine = create_engine(DATABASE_URL, **pool_settings)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+_engine_pid = os.getpid()
+_worker_sessions = threading.local()
+
+def get_worker_session() -> Session:
+    """
+    Long-lived session for the calling worker thread, bound to one connection
+    held for the life of the thread: tasks skip pool checkout and its pre-ping
+    round trip. The connection is in autocommit mode, so every statement
+    commits on its own (no BEGIN/COMMIT round trips) and no transaction stays
+    open while a provider call is in flight. Recreated after fork and every
+    DB_POOL_RECYCLE seconds.
+    """
+    global _engine_pid
+    if _engine_pid != os.getpid():
+        # Forked pool child: never share the parent's connections
+        engine.dispose(close=False)
+        _engine_pid = os.getpid()
+        _worker_sessions.__dict__.clear()
+    session = getattr(_worker_sessions, "session", None)
+    if session is not None and time.monotonic() - _worker_sessions.opened_at > DB_POOL_RECYCLE:
+        session.close()
+        session.bind.close()
+        session = None
+    if session is None:
+        connection = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        session = Session(bind=connection, autoflush=False, expire_on_commit=False)
+        _worker_sessions.session = session
+        _worker_sessions.opened_at = time.monotonic()
+    return session
+
+# Async engine: FastAPI routers
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_settings)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,27 +1,46 @@
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import asyncio
 from app.database import engine
 from app import models
-from app.routers import notifications,users,auth
+from app.routers import notifications,users,auth,templates,admin
 from prometheus_client import generate_latest, CollectorRegistry, REGISTRY
 from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+from app.services.user_cache import listen_for_invalidations
+from app.services.ws_hub import notification_hub
+from app.utils import HashingPoolSaturated
+from fastapi.responses import JSONResponse
 
 
 # Create tables
 #models.Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Drop cached users when any replica updates them
+    invalidation_listener = asyncio.create_task(listen_for_invalidations())
+    # One Redis pattern subscription feeds every WebSocket in this process
+    notification_hub.start()
+    yield
+    await notification_hub.stop()
+    invalidation_listener.cancel()
+
 app = FastAPI(
     title="NotifyX",  
     description="Multi-channel notification infrastructure",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
-#  ADD RATE LIMITER
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# Rate limits are per endpoint dependencies (app.services.rate_limiter), shared through Redis
+async def _hashing_pool_saturated_handler(request, exc):
+    """Shed password work quickly instead of queueing it behind a full pool"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Authentication is busy, retry shortly"},
+        headers={"Retry-After": "1"}
+    )
+app.add_exception_handler(HashingPoolSaturated, _hashing_pool_saturated_handler)
 # CORS Middleware 
 app.add_middleware(
     CORSMiddleware,
@@ -36,6 +55,8 @@ app.add_middleware(
 app.include_router(notifications.router)
 app.include_router(users.router)
 app.include_router(auth.router)
+app.include_router(templates.router)
+app.include_router(admin.router)
 @app.get("/metrics")
 def metrics():
     """Prometheus metrics endpoint"""
@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Enum as SQLEnum,ForeignKey,Boolean,JSON
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, Enum as SQLEnum,ForeignKey,Boolean,JSON,Index,Uuid
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from datetime import datetime
+from datetime import datetime, timezone
 import enum
 
 Base = declarative_base()
@@ -41,16 +41,129 @@ class User(Base):
 class Notification(Base):
     __tablename__ = "notifications"
     
-    id = Column(String, primary_key=True, index=True)
+    # Time-ordered UUIDv7 (app.services.ids), handled as a string by the app
+    id = Column(Uuid(as_uuid=False), primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)  # Fixed!
-    title = Column(String, nullable=False)
-    message = Column(String, nullable=False)
+    title = Column(String, nullable=True)  # None when rendered from a template
+    message = Column(String, nullable=True)
+    template_id = Column(Integer, ForeignKey("templates.id"), nullable=True)
+    template_version = Column(Integer, nullable=True)
+    variables = Column(JSON, nullable=True)  # Per-recipient template data
     channels = Column(JSON, nullable=False)  # ["email", "sms", "push", "in_app"]
-    status = Column(SQLEnum(NotificationStatus), default=NotificationStatus.PENDING)
+    # Type created by migration a1ff5f8524cb
+    status = Column(SQLEnum(NotificationStatus, name="notificationstatusenum"), default=NotificationStatus.PENDING)
    # metadata = Column(JSON, default={})
+    scheduled_at = Column(DateTime(timezone=True), nullable=True)  # None = send immediately
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Partition key: part of the primary key because PostgreSQL requires it.
+    # Set client-side so the full key is known without a round trip.
+    created_at = Column(
+        DateTime(timezone=True), primary_key=True,
+        default=lambda: datetime.now(timezone.utc), server_default=func.now()
+    )
     sent_at = Column(DateTime(timezone=True), nullable=True)
     
     # Relationship
-    user = relationship("User", back_populates="notifications")
\ No newline at end of file
+    user = relationship("User", back_populates="notifications")
+    
+    __table_args__ = (
+        # Keyset pagination of a user's history (newest first)
+        Index("ix_notifications_user_created_id", user_id, created_at.desc(), id.desc()),
+        # Counting unfinished notifications for the pending_notifications gauge
+        Index(
+            "ix_notifications_unfinished", scheduled_at,
+            postgresql_where=status.in_([NotificationStatus.PENDING, NotificationStatus.RETRYING]),
+        ),
+        # Monthly partitions, see app.services.partitions
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+class Template(Base):
+    """Named notification template; every update adds a TemplateVersion"""
+    __tablename__ = "templates"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)
+    version = Column(Integer, nullable=False, default=1)  # Current version
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class TemplateVersion(Base):
+    """Immutable content of one template version; notifications pin the version they were created with"""
+    __tablename__ = "template_versions"
+    
+    template_id = Column(Integer, ForeignKey("templates.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, primary_key=True)
+    title = Column(String, nullable=False)
+    message = Column(Text, nullable=False)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# Delivery-only status: a worker has claimed the delivery and is sending it
+DELIVERY_SENDING = "sending"
+
+class NotificationDelivery(Base):
+    """Delivery state of one channel of a notification, so retries only re-run that channel"""
+    __tablename__ = "notification_deliveries"
+    
+    # No foreign key: notifications is partitioned; rows go with the archived partition
+    notification_id = Column(Uuid(as_uuid=False), primary_key=True)
+    channel = Column(String, primary_key=True)  # "email", "sms", "push", "in_app"
+    status = Column(String, nullable=False, default=NotificationStatus.PENDING.value)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    via_digest = Column(Boolean, nullable=False, default=False)  # Delivered inside a combined digest message
+    
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+class IdempotencyKey(Base):
+    """Idempotency-Key sent with POST /notifications/, unique per caller"""
+    __tablename__ = "idempotency_keys"
+    
+    user_id = Column(Integer, primary_key=True)  # The authenticated caller
+    key = Column(String(255), primary_key=True)
+    notification_id = Column(Uuid(as_uuid=False), nullable=False)  # No foreign key, see NotificationDelivery
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class OutboxEntry(Base):
+    """Notification waiting to be published to the broker, written in the same transaction as it"""
+    __tablename__ = "outbox"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    notification_id = Column(Uuid(as_uuid=False), nullable=False)
+    channels = Column(JSON, nullable=False)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ScheduledNotification(Base):
+    """Notification held back until due_at; the scheduler moves it to the outbox"""
+    __tablename__ = "scheduled_notifications"
+    
+    notification_id = Column(Uuid(as_uuid=False), primary_key=True)
+    due_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class DeadLetter(Base):
+    """Delivery that exhausted its retries, kept with the reason until it is replayed"""
+    __tablename__ = "dead_letters"
+    
+    notification_id = Column(Uuid(as_uuid=False), primary_key=True)  # No foreign key, see NotificationDelivery
+    channel = Column(String, primary_key=True)
+    error = Column(Text, nullable=True)  # Last error seen
+    error_class = Column(String(255), nullable=True)  # Exception type name, e.g. SMTPServerDisconnected
+    attempts = Column(Integer, nullable=False, default=0)
+    
+    failed_at = Column(
+        DateTime(timezone=True), nullable=False,
+        default=lambda: datetime.now(timezone.utc), server_default=func.now()
+    )
+    
+    __table_args__ = (
+        # Replays and listings filter by channel and failure window
+        Index("ix_dead_letters_channel_failed_at", channel, failed_at),
+    )
@@ -1,9 +1,12 @@
 from jose import JWTError,jwt
 from datetime import datetime,timedelta
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from fastapi import HTTPException,status,Depends
-from app.schemas import TokenData
+from app.schemas import TokenData, Principal
+from app.services.user_cache import principal_cache, claims_trusted
+from app.services.metrics import principal_cache_requests
 from fastapi.security import OAuth2PasswordBearer
 import os
 from dotenv import load_dotenv
@@ -14,6 +17,10 @@ load_dotenv()
 ACCESS_TOKEN_EXPIRE_MINUTES=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 ALGORITHM=os.getenv("ALGORITHM", "HS256")
 SECRET_KEY=os.getenv("SECRET_KEY")
+# Embed is_active in tokens so most requests need neither the cache nor the DB
+JWT_EMBED_PRINCIPAL=os.getenv("JWT_EMBED_PRINCIPAL", "false").lower() == "true"
+# Users allowed on /admin, e.g. ADMIN_USER_IDS=1,42 (unset = nobody)
+ADMIN_USER_IDS={int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()}
 oauth2_scheme=OAuth2PasswordBearer(tokenUrl='login')
 # Function to create access token
 def create_access_token(data:dict):
@@ -21,10 +28,20 @@ def create_access_token(data:dict):
     Create a JWT access token.
     """
     to_encode=data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp":expire})
+    now = datetime.now(timezone.utc)
+    expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp":expire,"iat":now})
     encoded_jwt=jwt.encode(to_encode,SECRET_KEY,algorithm=ALGORITHM)
     return encoded_jwt
+# Claims describing the user, embedded only when JWT_EMBED_PRINCIPAL is on
+def principal_claims(user)->dict:
+    """
+    Build the principal claims for a token. The token's iat acts as the
+    claims version: an invalidation of the user after iat voids them.
+    """
+    if not JWT_EMBED_PRINCIPAL:
+        return {}
+    return {"active":user.is_active}
 # Function to verify access token
 def verify_access_token(token:str,credentials_exception):
     """
@@ -36,19 +53,53 @@ def verify_access_token(token:str,credentials_exception):
         if id is None:
             raise credentials_exception
         id_=int(id)
-        token_data=TokenData(id=id_)
+        token_data=TokenData(id=id_,active=payload.get("active"),issued_at=payload.get("iat"))
         return token_data
     except JWTError:
         raise credentials_exception
 # Dependency to get the current authenticated user
-def get_current_user(token:str=Depends(oauth2_scheme),db: Session = Depends(get_db)):
+async def get_current_user(token:str=Depends(oauth2_scheme),db: AsyncSession = Depends(get_async_db)):
     """
     Retrieve the current authenticated user based on the access token.
     """
     credentials_exception=HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="Could not validate credentials",headers={"WWW-Authenticate":"Bearer"})
     token=verify_access_token(token,credentials_exception)
-    current_user = db.query(app.models.User).filter(app.models.User.id == token.id).first()
-    if current_user is None:
+    current_user=await load_principal(token,db,credentials_exception)
+    # Every path, embedded claims included, refuses deactivated users
+    if not current_user.is_active:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="Inactive user",headers={"WWW-Authenticate":"Bearer"})
+    return current_user
+# The principal behind a verified token: its claims, the cache or the DB
+async def load_principal(token:TokenData,db:AsyncSession,credentials_exception)->Principal:
+    """
+    Trust the token's embedded claims unless the user was invalidated after
+    it was issued; otherwise use the principal cache, then the DB. Users
+    are deactivated, never deleted, and every change invalidates them, so
+    the user behind trusted claims exists.
+    """
+    if JWT_EMBED_PRINCIPAL and token.active is not None and await claims_trusted(token.id,token.issued_at):
+        principal_cache_requests.labels(result="claims").inc()
+        return Principal(id=token.id,is_active=token.active)
+    current_user = principal_cache.get(token.id)
+    if current_user is not None:
+        principal_cache_requests.labels(result="hit").inc()
+        return current_user
+    principal_cache_requests.labels(result="miss").inc()
+    result = await db.execute(
+        select(app.models.User.id,app.models.User.email,app.models.User.is_active)
+        .where(app.models.User.id == token.id)
+    )
+    row = result.first()
+    if row is None:
         raise credentials_exception
+    current_user = Principal(id=row.id,email=row.email,is_active=row.is_active)
+    principal_cache.set(token.id,current_user)
+    return current_user
+# Dependency for operator-only endpoints
+async def get_admin_user(current_user=Depends(get_current_user)):
+    """
+    The current user, if listed in ADMIN_USER_IDS.
+    """
+    if current_user.id not in ADMIN_USER_IDS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,detail="Admin access required")
     return current_user
-
@@ -0,0 +1,53 @@
+from fastapi import HTTPException
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Optional
+import base64
+import json
+from app import models
+from app.services.ids import is_valid_id
+
+
+def encode_cursor(created_at: datetime, notification_id: str) -> str:
+    """Opaque cursor pointing just after (created_at, id)"""
+    raw = json.dumps([created_at.isoformat(), notification_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, notification_id = json.loads(base64.urlsafe_b64decode(padded))
+        if not is_valid_id(notification_id):
+            raise ValueError(notification_id)
+        return datetime.fromisoformat(created_at), notification_id
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def notification_page(db: AsyncSession, user_id: int, cursor: Optional[str], limit: int) -> dict:
+    """
+    One page of a user's notifications, newest first. Seeks with a row
+    comparison on (created_at, id) so every page costs the same, however deep.
+    """
+    query = select(models.Notification).where(models.Notification.user_id == user_id)
+    if cursor:
+        created_at, notification_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(models.Notification.created_at, models.Notification.id) < (created_at, notification_id),
+            # Implied by the row comparison, but only a plain bound lets the planner prune partitions
+            models.Notification.created_at <= created_at,
+        )
+    query = query.order_by(
+        models.Notification.created_at.desc(), models.Notification.id.desc()
+    ).limit(limit + 1)  # One extra row tells us whether another page exists
+
+    result = await db.execute(query)
+    items = result.scalars().all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,91 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from app.oauth2 import get_admin_user
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
+from app import models, schemas
+from app.celery_app import app as celery_app, CHANNEL_QUEUES
+from app.services.dead_letters import dead_letter_filters, REPLAY_TASK
+from typing import List, Literal, Optional
+from datetime import datetime
+import asyncio
+import logging
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+logger = logging.getLogger(__name__)
+
+Channel = Literal[CHANNEL_QUEUES]
+
+#============ DEAD LETTER ROUTES =============
+#***********LIST DEAD LETTERS ********************************************
+@router.get("/dead-letters", response_model=List[schemas.DeadLetterResponse])
+async def list_dead_letters(
+    channel: Optional[Channel] = None,
+    error_class: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    admin: schemas.Principal = Depends(get_admin_user)
+):
+    """Most recent failures first, filtered by channel, error class and window [since, until)"""
+    result = await db.execute(
+        select(models.DeadLetter)
+        .where(*dead_letter_filters(channel, error_class, since, until))
+        .order_by(models.DeadLetter.failed_at.desc())
+        .limit(limit)
+    )
+    return result.scalars().all()
+#***********SUMMARIZE DEAD LETTERS ********************************************
+@router.get("/dead-letters/summary", response_model=List[schemas.DeadLetterSummary])
+async def summarize_dead_letters(
+    channel: Optional[Channel] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+    admin: schemas.Principal = Depends(get_admin_user)
+):
+    """Count, oldest and newest failure per channel and error class"""
+    result = await db.execute(
+        select(
+            models.DeadLetter.channel,
+            models.DeadLetter.error_class,
+            func.count().label("count"),
+            func.min(models.DeadLetter.failed_at).label("oldest"),
+            func.max(models.DeadLetter.failed_at).label("newest"),
+        )
+        .where(*dead_letter_filters(channel, None, since, until))
+        .group_by(models.DeadLetter.channel, models.DeadLetter.error_class)
+        .order_by(func.count().desc())
+    )
+    return [schemas.DeadLetterSummary(**row._mapping) for row in result]
+#***********REPLAY DEAD LETTERS ********************************************
+@router.post("/dead-letters/replay", response_model=schemas.DeadLetterReplayResponse, status_code=status.HTTP_202_ACCEPTED)
+async def replay_dead_letters(
+    replay: schemas.DeadLetterReplay,
+    db: AsyncSession = Depends(get_async_db),
+    admin: schemas.Principal = Depends(get_admin_user)
+):
+    """
+    Hand matching dead letters back to their channel queues, in throttled
+    steps run by the workers (app.workers.dead_letters). Returns at once
+    with the number matched so far.
+    """
+    if replay.channel is not None and replay.channel not in CHANNEL_QUEUES:
+        raise HTTPException(status_code=400, detail=f"Unknown channel {replay.channel}")
+    filters = dead_letter_filters(replay.channel, replay.error_class, replay.since, replay.until)
+    matched = (await db.execute(select(func.count()).select_from(models.DeadLetter).where(*filters))).scalar()
+
+    result = await asyncio.to_thread(
+        celery_app.send_task,
+        REPLAY_TASK,
+        kwargs={
+            "channel": replay.channel,
+            "error_class": replay.error_class,
+            "since": replay.since.isoformat() if replay.since else None,
+            "until": replay.until.isoformat() if replay.until else None,
+            "rate": replay.rate,
+        },
+    )
+    logger.info(f"User {admin.id} started dead letter replay {result.id} ({matched} matched)")
+    return schemas.DeadLetterReplayResponse(matched=matched, task_id=result.id)
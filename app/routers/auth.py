@@ -1,14 +1,14 @@
-from fastapi import FastAPI, HTTPException, Depends, status, APIRouter, Request
-from app.database import get_db
+from fastapi import HTTPException, Depends, status, APIRouter
+from app.database import get_async_db
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 import app.models
-from app.schemas import UserLogin, Token
-from app.utils import verify, hash  
-from app.oauth2 import create_access_token
-from slowapi import Limiter  
-from slowapi.util import get_remote_address  
+from app.schemas import Token
+from app.utils import verify_and_update_async, HashingPoolSaturated
+from app.oauth2 import create_access_token, principal_claims
+from app.services.rate_limiter import RateLimit
 import logging
 import traceback
 
@@ -16,14 +16,11 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
 router = APIRouter(tags=["Authentication"])
-limiter = Limiter(key_func=get_remote_address)
 
-@router.post("/login", response_model=Token)
-@limiter.limit("5/minute")
+@router.post("/login", response_model=Token, dependencies=[Depends(RateLimit("login"))])
 async def login(
-    request: Request,
     user_credentials: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Token:
     """Authenticate a user and generate an access token."""
     
@@ -31,9 +28,10 @@ async def login(
         logger.info(f"Login attempt for email: {user_credentials.username}")
         
         # Step 1: Find user
-        user = db.query(app.models.User).filter(
+        result = await db.execute(select(app.models.User).where(
             app.models.User.email == user_credentials.username
-        ).first()
+        ))
+        user = result.scalars().first()
         
         if not user:
             logger.warning(f"User not found: {user_credentials.username}")
@@ -49,7 +47,9 @@ async def login(
         # Step 2: Verify password
         logger.info("Verifying password...")
         
-        is_password_valid = verify(user_credentials.password, user.password)
+        is_password_valid, new_hash = await verify_and_update_async(
+            user_credentials.password, user.password
+        )
         
         logger.info(f" Password verification result: {is_password_valid}")
         
@@ -60,9 +60,15 @@ async def login(
                 detail="Invalid Credentials"
             )
         
+        # Transparently upgrade hashes made with a different work factor
+        if new_hash:
+            user.password = new_hash
+            await db.commit()
+            logger.info(f" Rehashed password for user {user.id}")
+        
         # Step 3: Create token
         logger.info(f" Creating access token for user {user.id}")
-        access_token = create_access_token(data={"user_id": user.id})
+        access_token = create_access_token(data={"user_id": user.id, **principal_claims(user)})
         
         logger.info(f" Login successful for: {user_credentials.username}")
         return {"access_token": access_token, "token_type": "bearer"}
@@ -71,6 +77,9 @@ async def login(
         logger.error(f"HTTP Exception: {e.detail}")
         raise e
     
+    except HashingPoolSaturated:
+        raise
+    
     except SQLAlchemyError as e:
         logger.error(f"Database error: {str(e)}")
         logger.error(traceback.format_exc())
@@ -1,94 +1,397 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Request
-from app.oauth2 import get_current_user
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, status, Request
+from app.oauth2 import get_current_user, ADMIN_USER_IDS
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models, schemas
-from app.database import get_db
-from app.workers.notification_tasks import send_notification
-from fastapi import WebSocket
-import asyncio
-import uuid
+from app.database import get_async_db, AsyncSessionLocal
+from app.pagination import notification_page
+from typing import Optional
+from datetime import datetime
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from app.services.ws_hub import notification_hub
+from app.services.rate_limiter import RateLimit
+from app.services import idempotency
+from app.services.schedule import due_time, index_scheduled
+from app.services.templates import current_templates
+from app.services.user_cache import get_user_routing, get_user_routings
+from app.services.ids import uuid7, is_valid_id, created_at_bounds
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+import csv
+import io
 import json
 import logging
-from slowapi import Limiter  
-from slowapi.util import get_remote_address  
+import os
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/notifications", tags=["notifications"])
-limiter = Limiter(key_func=get_remote_address)# Rate limiter instance
+
+# Upper bound on items accepted by a single batch request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 10000))
+# And on its body, enforced while it is read so an oversized one is never buffered
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", 10 * 1024 * 1024))
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+# Rows fetched per round trip from the server-side cursor during exports
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_COLUMNS = ("id", "user_id", "title", "message", "channels", "status", "created_at", "sent_at")
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def filter_channels(channels, preferences):
+    """Keep only the channels the user has not disabled"""
+    user_prefs = preferences or {}
+    return [
+        channel for channel in channels
+        if user_prefs.get(channel, True)  # Default to True if not set
+    ]
+
+
+def template_error(templates: dict, notification) -> Optional[str]:
+    """Why a templated notification cannot be rendered, or None if it can"""
+    if notification.template_id is None:
+        return None
+    current = templates.get(notification.template_id)
+    if current is None:
+        return "Template not found"
+    missing = current[1].missing(notification.variables)
+    if missing:
+        return f"Missing template variables: {', '.join(missing)}"
+    return None
+
+
+def template_version(templates: dict, notification) -> Optional[int]:
+    """Current version of the notification's template, pinned at creation"""
+    if notification.template_id is None:
+        return None
+    return templates[notification.template_id][0]
+
+
+async def read_batch_items(request: Request) -> list:
+    """Parse a batch body sent either as a JSON array or as NDJSON"""
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Batch body exceeds {BATCH_MAX_BYTES} bytes"
+    )
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > BATCH_MAX_BYTES:
+        raise too_large
+    # Chunked bodies carry no length; count while reading
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > BATCH_MAX_BYTES:
+            raise too_large
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        if content_type in NDJSON_CONTENT_TYPES:
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed batch body")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Batch body must be a JSON array or NDJSON")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {BATCH_MAX_ITEMS} items"
+        )
+    return items
 
 #============ NOTIFICATION ROUTES =============
 #***********CREATE NOTIFICATION ********************************************
-@router.post("/", response_model=schemas.NotificationResponse, status_code=status.HTTP_202_ACCEPTED)
-@limiter.limit("10/minute")# Rate limit: 10 requests per minute
+@router.post("/", response_model=schemas.NotificationResponse, status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(RateLimit("notifications:create"))])
 async def create_notification(
-    request: Request,
     notification: schemas.NotificationCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    current_user:schemas.TokenData= Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(
+        None, alias="Idempotency-Key", max_length=idempotency.IDEMPOTENCY_KEY_MAX_LENGTH
+    )
+):
+    """
+    Create and queue notification. Retries carrying the same Idempotency-Key
+    get the original response back instead of a second notification.
+    """
+    if idempotency_key:
+        stored = await idempotency.claim(current_user.id, idempotency_key)
+        if stored == idempotency.IN_PROGRESS:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still in progress"
+            )
+        if stored:
+            return idempotency.replay(stored)
+    
+    committed = False
+    try:
+        #  Validate user exists (cached routing data, not the full row)
+        user = await get_user_routing(db, notification.user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        #  Check if user is active
+        if not user.is_active:
+            raise HTTPException(status_code=400, detail="User is inactive")
+        
+        # Respect user preferences (filter channels)
+        allowed_channels = filter_channels(notification.channels, user.preferences)
+        
+        if not allowed_channels:
+            raise HTTPException(
+                status_code=400,
+                detail="All requested channels are disabled in user preferences"
+            )
+        
+        # Templates are rendered by the workers; only check that this one can be
+        templates = await current_templates(db, [notification.template_id] if notification.template_id else [])
+        error = template_error(templates, notification)
+        if error:
+            raise HTTPException(status_code=404 if error == "Template not found" else 400, detail=error)
+        
+        notification_id = uuid7()
+        due_at = due_time(notification.scheduled_at)
+        
+        db_notification = models.Notification(
+            id=notification_id,
+            user_id=notification.user_id,
+            title=notification.title,
+            message=notification.message,
+            template_id=notification.template_id,
+            template_version=template_version(templates, notification),
+            variables=notification.variables,
+            channels=allowed_channels,
+            status="pending",
+            scheduled_at=due_at,
+           # metadata=notification.metadata
+        )
+        db.add(db_notification)
+        if due_at:
+            # Held back until the scheduler finds it due
+            db.add(models.ScheduledNotification(notification_id=notification_id, due_at=due_at))
+        else:
+            # Published by the outbox relay once this transaction commits
+            db.add(models.OutboxEntry(notification_id=notification_id, channels=allowed_channels))
+        if idempotency_key:
+            db.add(models.IdempotencyKey(
+                user_id=current_user.id, key=idempotency_key, notification_id=notification_id
+            ))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Redis forgot the key (eviction, restart) but the DB did not
+            await db.rollback()
+            existing = await idempotency.find_notification(db, current_user.id, idempotency_key) if idempotency_key else None
+            if existing is None:
+                raise
+            committed = True
+            body = schemas.NotificationResponse.model_validate(existing).model_dump_json()
+            await idempotency.store_response(current_user.id, idempotency_key, body)
+            return idempotency.replay(body)
+        committed = True
+        await db.refresh(db_notification)
+    finally:
+        if idempotency_key and not committed:
+            await idempotency.release(current_user.id, idempotency_key)
+    
+    if due_at:
+        await index_scheduled([(notification_id, due_at)])
+    if idempotency_key:
+        await idempotency.store_response(
+            current_user.id, idempotency_key,
+            schemas.NotificationResponse.model_validate(db_notification).model_dump_json()
+        )
+    logger.info(f"Queued notification {notification_id} for user {notification.user_id}")
+    return db_notification
+#***********CREATE NOTIFICATIONS IN BULK ********************************************
+@router.post("/batch", response_model=schemas.NotificationBatchResponse, status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(RateLimit("notifications:batch"))])
+async def create_notifications_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_user:schemas.TokenData= Depends(get_current_user)
 ):
-    """Create and queue notification"""
-    #  Validate user exists
-    user = db.query(models.User).filter(models.User.id == notification.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    #  Check if user is active
-    if not user.is_active:
-        raise HTTPException(status_code=400, detail="User is inactive")
-    
-    # Respect user preferences (filter channels)
-    user_prefs = user.preferences or {}
-    allowed_channels = [
-        channel for channel in notification.channels 
-        if user_prefs.get(channel, True)  # Default to True if not set
-    ]
+    """Create and queue many notifications (JSON array or NDJSON body)"""
+    items = await read_batch_items(request)
+    results = [None] * len(items)
     
-    if not allowed_channels:
-        raise HTTPException(
-            status_code=400,
-            detail="All requested channels are disabled in user preferences"
+    # Validate every item up front; bad items are rejected individually
+    valid = []
+    for index, raw in enumerate(items):
+        try:
+            valid.append((index, schemas.NotificationCreate.model_validate(raw)))
+        except ValidationError as e:
+            results[index] = schemas.NotificationBatchItemResult(
+                index=index, accepted=False, error=str(e.errors()[0]["msg"])
+            )
+    
+    # Resolve all target users from the routing cache; misses cost a single IN query
+    users = await get_user_routings(db, {notification.user_id for _, notification in valid})
+    
+    # And every referenced template with one more
+    templates = await current_templates(
+        db, {notification.template_id for _, notification in valid if notification.template_id}
+    )
+    
+    rows = []
+    for index, notification in valid:
+        user = users.get(notification.user_id)
+        error = None
+        if user is None:
+            error = "User not found"
+        elif not user.is_active:
+            error = "User is inactive"
+        else:
+            allowed_channels = filter_channels(notification.channels, user.preferences)
+            if not allowed_channels:
+                error = "All requested channels are disabled in user preferences"
+            else:
+                error = template_error(templates, notification)
+        if error:
+            results[index] = schemas.NotificationBatchItemResult(index=index, accepted=False, error=error)
+            continue
+        
+        notification_id = uuid7()
+        rows.append({
+            "id": notification_id,
+            "user_id": notification.user_id,
+            "title": notification.title,
+            "message": notification.message,
+            "template_id": notification.template_id,
+            "template_version": template_version(templates, notification),
+            "variables": notification.variables,
+            "channels": allowed_channels,
+            "status": models.NotificationStatus.PENDING,
+            "scheduled_at": due_time(notification.scheduled_at),
+        })
+        results[index] = schemas.NotificationBatchItemResult(
+            index=index, accepted=True, notification_id=notification_id
         )
     
-    notification_id = str(uuid.uuid4())
+    if rows:
+        # Multi-row INSERTs, one commit for the whole batch and its outbox/schedule entries
+        scheduled = [(row["id"], row["scheduled_at"]) for row in rows if row["scheduled_at"]]
+        immediate = [row for row in rows if not row["scheduled_at"]]
+        await db.execute(insert(models.Notification), rows)
+        if immediate:
+            await db.execute(insert(models.OutboxEntry), [
+                {"notification_id": row["id"], "channels": row["channels"]} for row in immediate
+            ])
+        if scheduled:
+            await db.execute(insert(models.ScheduledNotification), [
+                {"notification_id": notification_id, "due_at": due_at} for notification_id, due_at in scheduled
+            ])
+        await db.commit()
+        await index_scheduled(scheduled)
     
-    db_notification = models.Notification(
-        id=notification_id,
-        user_id=notification.user_id,
-        title=notification.title,
-        message=notification.message,
-        channels=allowed_channels,
-        status="pending",
-       # metadata=notification.metadata
+    logger.info(f"Queued {len(rows)} of {len(items)} batch notifications")
+    return schemas.NotificationBatchResponse(
+        accepted=len(rows),
+        rejected=len(items) - len(rows),
+        results=results
     )
-    db.add(db_notification)
-    db.commit()
-    db.refresh(db_notification)
+#***********EXPORT NOTIFICATION HISTORY ********************************************
+def export_record(row) -> dict:
+    record = dict(row._mapping)
+    record["status"] = record["status"].value if record["status"] else None
+    for field in ("created_at", "sent_at"):
+        if record[field] is not None:
+            record[field] = record[field].isoformat()
+    return record
+
+async def stream_export(query, export_format: str):
+    """Encode rows chunk by chunk as they come off a server-side cursor"""
+    # Own session: it has to live as long as the response body is streaming
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+            writer.writeheader()
+            yield buffer.getvalue()
+        async for partition in result.partitions():
+            buffer = io.StringIO()
+            if export_format == "csv":
+                writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+                for row in partition:
+                    record = export_record(row)
+                    record["channels"] = json.dumps(record["channels"])
+                    writer.writerow(record)
+            else:
+                for row in partition:
+                    buffer.write(json.dumps(export_record(row)))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+
+@router.get("/export")
+async def export_notifications(
+    user_id: Optional[int] = None,
+    status: Optional[schemas.NotificationStatus] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user:schemas.TokenData= Depends(get_current_user)
+):
+    """
+    Stream notification history as NDJSON or CSV with constant memory use
+
+    - **user_id**, **status**: optional filters
+    - **since** / **until**: created_at range, inclusive / exclusive
+
+    Admins may export any user's notifications; everyone else only their own.
+    """
+    if current_user.id not in ADMIN_USER_IDS:
+        if user_id is not None and user_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Not allowed to export another user's notifications")
+        user_id = current_user.id
+    query = select(*[getattr(models.Notification, column) for column in EXPORT_COLUMNS])
+    if user_id is not None:
+        query = query.where(models.Notification.user_id == user_id)
+    if status is not None:
+        query = query.where(models.Notification.status == models.NotificationStatus(status.value))
+    if since is not None:
+        query = query.where(models.Notification.created_at >= since)
+    if until is not None:
+        query = query.where(models.Notification.created_at < until)
     
-    send_notification.delay(
-        notification_id
+    return StreamingResponse(
+        stream_export(query, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="notifications.{format}"'}
     )
-    logger.info(f"Queued notification {notification_id} for user {notification.user_id}")
-    return db_notification
 #***********GET NOTIFICATIONS FOR USER ********************************************
-@router.get("/user/{user_id}")
-async def get_user_notifications(user_id: int, db: Session = Depends(get_db),current_user:schemas.TokenData= Depends(get_current_user)):
-    """Get all notifications for a user"""
-    
-    notifications = db.query(models.Notification).filter(
-        models.Notification.user_id == user_id
-    ).all()
+@router.get("/user/{user_id}", response_model=schemas.NotificationPage)
+async def get_user_notifications(
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user:schemas.TokenData= Depends(get_current_user)
+):
+    """Get a user's notifications, newest first; pass next_cursor to fetch the next page"""
     
-    return notifications
+    return await notification_page(db, user_id, cursor, limit)
 
 #***********GET NOTIFICATION STATUS ********************************************
 @router.get("/{notification_id}", response_model=schemas.NotificationResponse)
-async def get_notification(notification_id: str, db: Session = Depends(get_db),current_user:schemas.TokenData= Depends(get_current_user)):
+async def get_notification(notification_id: str, db: AsyncSession = Depends(get_async_db),current_user:schemas.TokenData= Depends(get_current_user)):
     """Get notification status"""
     
-    notification = db.query(models.Notification).filter(
-        models.Notification.id == notification_id
-    ).first()
-    notification.channels = notification.channels  # Deserialize for response
+    if not is_valid_id(notification_id):
+        raise HTTPException(status_code=404, detail="Notification not found")
+    
+    # The primary key is (id, created_at); the id alone is unique, and the
+    # time inside it narrows the lookup to the partition that holds it
+    result = await db.execute(
+        select(models.Notification).where(
+            models.Notification.id == notification_id,
+            *created_at_bounds(models.Notification.created_at, notification_id),
+        )
+    )
+    notification = result.scalars().first()
     
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
@@ -100,24 +403,17 @@ async def get_notification(notification_id: str, db: Session = Depends(get_db),c
 async def websocket_endpoint(websocket: WebSocket, user_id: int):
     await websocket.accept()
     
-    from app.services.redis_pubsub import redis_pubsub
-    
-    # Subscribe to Redis channel
-    pubsub = redis_pubsub.subscribe(user_id)
+    # Messages are pushed by the process-wide hub; no per-socket Redis connection
+    subscriber = notification_hub.register(user_id, websocket)
     
     try:
+        # Nothing is expected from the client; this just waits for the disconnect
         while True:
-            # Listen for messages from Redis
-            message = pubsub.get_message()
-            
-            if message and message["type"] == "message":
-                data = json.loads(message["data"])
-                await websocket.send_json(data)
-            
-            # Small delay to prevent CPU spinning
-            await asyncio.sleep(0.1)
+            await websocket.receive_text()
     
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
     finally:
-        pubsub.close()
\ No newline at end of file
+        notification_hub.unregister(user_id, subscriber)
@@ -0,0 +1,97 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from app.oauth2 import get_current_user
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
+from app import models, schemas
+from app.services.templates import CompiledTemplate
+import logging
+
+router = APIRouter(prefix="/templates", tags=["Templates"])
+logger = logging.getLogger(__name__)
+
+
+def template_response(template: models.Template, content: models.TemplateVersion) -> schemas.TemplateResponse:
+    return schemas.TemplateResponse(
+        id=template.id,
+        name=template.name,
+        version=template.version,
+        title=content.title,
+        message=content.message,
+        variables=sorted(CompiledTemplate(content.title, content.message).variables),
+        created_at=template.created_at,
+        updated_at=template.updated_at,
+    )
+
+#============ TEMPLATE ROUTES =============
+#***********CREATE TEMPLATE ********************************************
+@router.post("/", response_model=schemas.TemplateResponse, status_code=status.HTTP_201_CREATED)
+async def create_template(
+    template: schemas.TemplateCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user:schemas.TokenData= Depends(get_current_user)
+):
+    """
+    Create a template. Title and message may contain {{ variable }}
+    placeholders, filled per recipient when the notification is sent.
+    """
+    result = await db.execute(select(models.Template.id).where(models.Template.name == template.name))
+    if result.first():
+        raise HTTPException(status_code=400, detail="Template name already exists")
+    
+    db_template = models.Template(name=template.name, version=1)
+    db.add(db_template)
+    await db.flush()
+    content = models.TemplateVersion(
+        template_id=db_template.id, version=1, title=template.title, message=template.message
+    )
+    db.add(content)
+    await db.commit()
+    await db.refresh(db_template)
+    
+    logger.info(f"Created template {db_template.id} ({db_template.name})")
+    return template_response(db_template, content)
+#***********GET TEMPLATE ********************************************
+@router.get("/{template_id}", response_model=schemas.TemplateResponse)
+async def get_template(
+    template_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user:schemas.TokenData= Depends(get_current_user)
+):
+    """Get the current version of a template"""
+    template = await db.get(models.Template, template_id)
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    content = await db.get(models.TemplateVersion, (template.id, template.version))
+    return template_response(template, content)
+#***********UPDATE TEMPLATE ********************************************
+@router.put("/{template_id}", response_model=schemas.TemplateResponse)
+async def update_template(
+    template_id: int,
+    template_update: schemas.TemplateUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user:schemas.TokenData= Depends(get_current_user)
+):
+    """
+    Publish a new version of a template. Notifications already created keep
+    rendering with the version they were created with.
+    """
+    # Row lock so concurrent updates get distinct version numbers
+    result = await db.execute(
+        select(models.Template).where(models.Template.id == template_id).with_for_update()
+    )
+    template = result.scalars().first()
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    
+    template.version += 1
+    content = models.TemplateVersion(
+        template_id=template.id, version=template.version,
+        title=template_update.title, message=template_update.message
+    )
+    db.add(content)
+    await db.commit()
+    await db.refresh(template)
+    
+    logger.info(f"Published template {template_id} version {template.version}")
+    return template_response(template, content)
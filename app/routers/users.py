@@ -1,24 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status, Request
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import APIRouter, Depends, HTTPException, Query
 from app.oauth2 import get_current_user
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.database import get_db
-from app.models import User, Notification
-from app.schemas import UserCreate, UserUpdate, UserResponse, NotificationResponse, TokenData
-from app.utils import hash
+from app.database import get_async_db
+from app.models import User
+from app.schemas import UserCreate, UserUpdate, UserResponse, NotificationPage, TokenData
+from app.pagination import notification_page
+from app.utils import hash_async
+from app.services.user_cache import broadcast_user_invalidation
 import logging
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from app.services.rate_limiter import RateLimit
 router = APIRouter(prefix="/users", tags=["Users"])
 logger = logging.getLogger(__name__)
-limiter = Limiter(key_func=get_remote_address)  # Rate limiter instance
 #============ USER ROUTES =============
 
 #***********CREATE USER ********************************************
-@router.post("/", response_model=UserResponse, status_code=201)
-@limiter.limit("5/minute")  # Rate limit: 5 requests per minute
-def create_user(request: Request,user: UserCreate, db: Session = Depends(get_db)):
+@router.post("/", response_model=UserResponse, status_code=201,
+             dependencies=[Depends(RateLimit("users:create"))])
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Create a new user
     
@@ -28,12 +28,13 @@ def create_user(request: Request,user: UserCreate, db: Session = Depends(get_db)
     - **preferences**: Notification preferences (optional)
     """
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user.email).first()
+    result = await db.execute(select(User).where(User.email == user.email))
+    existing_user = result.scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     user_data = user.model_dump()
     
-    user_data['password'] = hash(user_data['password'])  # Hash it
+    user_data['password'] = await hash_async(user_data['password'])  # Hash it in the bcrypt pool
     
     # Convert Pydantic model to dict, handling preferences
     
@@ -42,18 +43,18 @@ def create_user(request: Request,user: UserCreate, db: Session = Depends(get_db)
     
     db_user = User(**user_data)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     logger.info(f"Created user {db_user.id} ({db_user.email})")
     return db_user
 #***********LIST USERS ********************************************
 @router.get("/", response_model=List[UserResponse],)
-def list_users(
+async def list_users(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     is_active: Optional[bool] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     List all users with pagination
@@ -62,29 +63,29 @@ def list_users(
     - **limit**: Maximum number of records to return (default: 100)
     - **is_active**: Filter by active status (optional)
     """
-    query = db.query(User)
+    query = select(User)
     
     if is_active is not None:
-        query = query.filter(User.is_active == is_active)
+        query = query.where(User.is_active == is_active)
     
-    users = query.offset(skip).limit(limit).all()
-    return users
+    result = await db.execute(query.offset(skip).limit(limit))
+    return result.scalars().all()
 #***********GET USER ********************************************
 @router.get("/{user_id}", response_model=UserResponse)
-def get_user(user_id: int, db: Session = Depends(get_db),current_user:TokenData= Depends(get_current_user)):
+async def get_user(user_id: int, db: AsyncSession = Depends(get_async_db),current_user:TokenData= Depends(get_current_user)):
     """
     Get a specific user by ID
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 #***********UPDATE USER ********************************************
 
-@router.put("/{user_id}", response_model=UserResponse)
-@limiter.limit("5/minute")  # Rate limit: 5 requests per minute
-def update_user(request: Request,user_id: int, user_update: UserUpdate, db: Session = Depends(get_db),current_user:TokenData= Depends(get_current_user)):
+@router.put("/{user_id}", response_model=UserResponse,
+            dependencies=[Depends(RateLimit("users:update"))])
+async def update_user(user_id: int, user_update: UserUpdate, db: AsyncSession = Depends(get_async_db),current_user:TokenData= Depends(get_current_user)):
     """
     Update user information
     
@@ -93,7 +94,7 @@ def update_user(request: Request,user_id: int, user_update: UserUpdate, db: Sess
     - **is_active**: Activate/deactivate user
     - **preferences**: Update notification preferences
     """
-    db_user = db.query(User).filter(User.id == user_id).first()
+    db_user = await db.get(User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -107,60 +108,58 @@ def update_user(request: Request,user_id: int, user_update: UserUpdate, db: Sess
     for field, value in update_data.items():
         setattr(db_user, field, value)
     
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    await broadcast_user_invalidation(user_id)
     
     logger.info(f"Updated user {user_id}")
     return db_user
 #***********DELETE USER ********************************************
 @router.delete("/{user_id}", status_code=204)
-def delete_user(user_id: int, db: Session = Depends(get_db),current_user:TokenData= Depends(get_current_user)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db),current_user:TokenData= Depends(get_current_user)):
     """
     Delete a user (soft delete by setting is_active=False)
     """
-    db_user = db.query(User).filter(User.id == user_id).first()
+    db_user = await db.get(User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Soft delete
     db_user.is_active = False
-    db.commit()
+    await db.commit()
+    await broadcast_user_invalidation(user_id)
     
     logger.info(f"Deleted (deactivated) user {user_id}")
     return None
 #***********GET USER NOTIFICATIONS ********************************************
-@router.get("/{user_id}/notifications", response_model=List[NotificationResponse])
-def get_user_notifications(
+@router.get("/{user_id}/notifications", response_model=NotificationPage)
+async def get_user_notifications(
     user_id: int,
-    skip: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user:TokenData= Depends(get_current_user)
 ):
     """
-    Get all notifications for a specific user
+    Get notifications for a specific user, newest first
+    
+    - **cursor**: next_cursor from the previous page (omit for the first page)
+    - **limit**: Maximum number of records to return (default: 100)
     """
     # Check if user exists
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    notifications = db.query(Notification)\
-        .filter(Notification.user_id == user_id)\
-        .order_by(Notification.created_at.desc())\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
-    
-    return notifications
+    return await notification_page(db, user_id, cursor, limit)
 
 #***********GET USER PREFERENCES ********************************************
 @router.get("/{user_id}/preferences", response_model=dict)
-def get_user_preferences(user_id: int, db: Session = Depends(get_db),current_user:TokenData= Depends(get_current_user)):
+async def get_user_preferences(user_id: int, db: AsyncSession = Depends(get_async_db),current_user:TokenData= Depends(get_current_user)):
     """
     Get user's notification preferences
     """
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
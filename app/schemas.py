@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr, Field,field_validator
-from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, EmailStr, Field,field_validator,model_validator
+from typing import Optional, Dict, Any, List, Literal
 from datetime import datetime
 from enum import Enum
 
@@ -9,6 +9,9 @@ class NotificationStatus(str, Enum):
     FAILED = "failed"
     RETRYING = "retrying"
 
+# Channels a notification can be sent on, one delivery task each
+Channel = Literal["email", "sms", "push", "in_app"]
+
 
 # ============= USER SCHEMAS =============
 
@@ -17,6 +20,7 @@ class UserPreferences(BaseModel):
     sms: bool = True
     push: bool = True
     in_app: bool = True
+    digest: bool = False  # Combine bursts of email/SMS into one message per window
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -68,11 +72,23 @@ class UserResponse(BaseModel):
 
 class NotificationCreate(BaseModel):
     user_id: int
-    title: str = Field(..., min_length=1, max_length=200)
-    message: str = Field(..., min_length=1)
-    channels: List[str] = Field(..., min_items=1)
+    # Either literal title and message, or a template rendered with variables
+    title: Optional[str] = Field(None, min_length=1, max_length=200)
+    message: Optional[str] = Field(None, min_length=1)
+    template_id: Optional[int] = None
+    variables: Optional[Dict[str, Any]] = None
+    channels: List[Channel] = Field(..., min_items=1)
+    scheduled_at: Optional[datetime] = None  # Send at this time instead of immediately
    # metadata: Optional[Dict[str, Any]] = {}
     
+    @model_validator(mode='after')
+    def content_source(self):
+        if self.template_id is None and (self.title is None or self.message is None):
+            raise ValueError('Provide title and message, or template_id')
+        if self.template_id is not None and (self.title is not None or self.message is not None):
+            raise ValueError('title and message cannot be combined with template_id')
+        return self
+    
     class Config:
         json_schema_extra = {
             "example": {
@@ -80,6 +96,7 @@ class NotificationCreate(BaseModel):
                 "title": "Welcome!",
                 "message": "Welcome to our platform",
                 "channels": ["email", "in_app"],
+                "scheduled_at": "2030-01-01T09:00:00Z",
                 "metadata": {"campaign": "onboarding"}
             }
         }
@@ -87,17 +104,99 @@ class NotificationCreate(BaseModel):
 class NotificationResponse(BaseModel):
     id: str
     user_id: int
-    title: str
-    message: str
+    title: Optional[str] = None
+    message: Optional[str] = None
+    template_id: Optional[int] = None
+    template_version: Optional[int] = None
+    variables: Optional[Dict[str, Any]] = None
     channels: List[str]
     status: NotificationStatus
     #metadata: Dict[str, Any]
+    scheduled_at: Optional[datetime] = None
     created_at: datetime
     sent_at: Optional[datetime]
     
     class Config:
         from_attributes = True
 
+class NotificationPage(BaseModel):
+    items: List[NotificationResponse]
+    next_cursor: Optional[str] = None
+
+class NotificationBatchItemResult(BaseModel):
+    index: int
+    accepted: bool
+    notification_id: Optional[str] = None
+    error: Optional[str] = None
+
+class NotificationBatchResponse(BaseModel):
+    accepted: int
+    rejected: int
+    results: List[NotificationBatchItemResult]
+
+# ============= TEMPLATE SCHEMAS =============
+
+class TemplateCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    # Text with {{ variable }} placeholders
+    title: str = Field(..., min_length=1, max_length=200)
+    message: str = Field(..., min_length=1)
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "name": "welcome",
+                "title": "Welcome, {{ first_name }}!",
+                "message": "Hi {{ first_name }}, your plan is {{ plan }}."
+            }
+        }
+
+class TemplateUpdate(BaseModel):
+    title: str = Field(..., min_length=1, max_length=200)
+    message: str = Field(..., min_length=1)
+
+class TemplateResponse(BaseModel):
+    id: int
+    name: str
+    version: int
+    title: str
+    message: str
+    variables: List[str]
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+# ============= DEAD LETTER SCHEMAS =============
+
+class DeadLetterResponse(BaseModel):
+    notification_id: str
+    channel: str
+    error: Optional[str] = None
+    error_class: Optional[str] = None
+    attempts: int
+    failed_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class DeadLetterSummary(BaseModel):
+    channel: str
+    error_class: Optional[str] = None
+    count: int
+    oldest: datetime
+    newest: datetime
+
+class DeadLetterReplay(BaseModel):
+    # Every filter is optional; none at all replays every dead letter
+    channel: Optional[str] = None
+    error_class: Optional[str] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    rate: Optional[float] = Field(None, gt=0)  # Dead letters per second, default REPLAY_RATE
+
+class DeadLetterReplayResponse(BaseModel):
+    matched: int
+    task_id: str
+
 # ============= LOGIN SCHEMAS =============
 
 
@@ -108,4 +207,17 @@ class Token(BaseModel):
     access_token:str
     token_type:str
 class TokenData(BaseModel):
-    id:Optional[int]=None
\ No newline at end of file
+    id:Optional[int]=None
+    active:Optional[bool]=None
+    issued_at:Optional[float]=None
+class UserRouting(BaseModel):
+    """What the enqueue and delivery paths need to know about a recipient"""
+    id:int
+    is_active:bool=True
+    preferences:Optional[Dict[str,bool]]=None
+    email:Optional[str]=None
+    phone:Optional[str]=None
+class Principal(BaseModel):
+    id:int
+    email:Optional[str]=None
+    is_active:bool=True
\ No newline at end of file
@@ -0,0 +1,20 @@
+from typing import Optional
+from dotenv import load_dotenv
+import os
+import random
+
+load_dotenv()
+
+# Bounds of the retry delay of a failed send, in seconds
+RETRY_BASE_SECONDS = float(os.getenv("RETRY_BASE_SECONDS", 1))
+RETRY_MAX_SECONDS = float(os.getenv("RETRY_MAX_SECONDS", 300))
+
+
+def decorrelated_jitter(previous: Optional[float] = None) -> float:
+    """
+    Next retry delay given the previous one ("decorrelated jitter"): random
+    between the base and three times the previous delay, capped. Sends that
+    failed together in an outage spread out instead of retrying in lockstep.
+    """
+    previous = max(previous or RETRY_BASE_SECONDS, RETRY_BASE_SECONDS)
+    return min(RETRY_MAX_SECONDS, random.uniform(RETRY_BASE_SECONDS, previous * 3))
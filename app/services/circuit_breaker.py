@@ -0,0 +1,224 @@
+from dotenv import load_dotenv
+from app.services.metrics import circuit_breaker_state, circuit_breaker_trips, circuit_breaker_rejections
+import os
+import logging
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Channels sent through an external provider get a breaker each
+BREAKER_PROVIDERS = ("email", "sms", "push")
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() == "true"
+# Consecutive failed sends that open a closed breaker
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 20))
+# How long an open breaker rejects sends before letting a probe through
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", 30))
+# A half-open probe that has not reported back by then is presumed lost
+BREAKER_PROBE_SECONDS = float(os.getenv("BREAKER_PROBE_SECONDS", 15))
+BREAKER_KEY_PREFIX = "breaker"
+
+STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+# Breaker state lives in one Redis hash per provider (state, failures,
+# open_until, probe_until), so every worker process and host trips and
+# recovers together. Times are Redis server milliseconds.
+
+# Returns {allowed, retry_after_ms, state}. Once an open breaker has cooled
+# down, exactly one caller at a time is let through as the half-open probe.
+ALLOW_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local probe_ms = tonumber(ARGV[1])
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'closed' then
+    return {1, 0, state}
+end
+if state == 'open' then
+    local open_until = tonumber(redis.call('HGET', KEYS[1], 'open_until') or 0)
+    if now < open_until then
+        return {0, open_until - now, state}
+    end
+    redis.call('HSET', KEYS[1], 'state', 'half_open', 'probe_until', now + probe_ms)
+    return {1, 0, 'half_open'}
+end
+local probe_until = tonumber(redis.call('HGET', KEYS[1], 'probe_until') or 0)
+if now < probe_until then
+    return {0, probe_until - now, state}
+end
+redis.call('HSET', KEYS[1], 'probe_until', now + probe_ms)
+return {1, 0, state}
+"""
+
+# Returns {tripped, state}. A failure while half-open reopens at once.
+FAILURE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local threshold = tonumber(ARGV[1])
+local open_ms = tonumber(ARGV[2])
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'open' then
+    return {0, state}
+end
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+if state == 'half_open' or failures >= threshold then
+    redis.call('HSET', KEYS[1], 'state', 'open', 'open_until', now + open_ms, 'failures', 0)
+    return {1, 'open'}
+end
+return {0, state}
+"""
+
+# Returns the state. Closes a half-open breaker; a late success from a send
+# started before the breaker opened leaves it open.
+SUCCESS_SCRIPT = """
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'open' then
+    return state
+end
+if state == 'half_open' or redis.call('HGET', KEYS[1], 'failures') ~= '0' then
+    redis.call('HSET', KEYS[1], 'state', 'closed', 'failures', 0)
+end
+return 'closed'
+"""
+
+
+class CircuitOpenError(Exception):
+    """The provider's breaker rejected the send; try again after retry_after seconds"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"Circuit breaker for {provider} is open")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class ProviderError(Exception):
+    """
+    The provider failed on its side: unreachable, timed out or a 5xx. Only
+    these count against its breaker; a send rejected for its recipient or
+    content (no phone number, invalid address, a 4xx) says nothing about
+    the provider's health.
+    """
+
+
+def state_name(state) -> str:
+    return state.decode() if isinstance(state, bytes) else state
+
+
+class CircuitBreaker:
+    """
+    One provider's breaker, shared through Redis by every worker.
+        breaker.allow()            # raises CircuitOpenError when open
+        ... send ...
+        breaker.record_success() / breaker.record_failure()   # on ProviderError only
+    An unreachable Redis fails open: sends go ahead unguarded.
+    """
+
+    def __init__(self, provider: str, client=None):
+        self.provider = provider
+        self.key = f"{BREAKER_KEY_PREFIX}:{provider}"
+        self._client = client
+        self._scripts = None
+
+    def client(self):
+        if self._client is None:
+            from app.services.redis_pubsub import redis_pubsub
+            self._client = redis_pubsub.redis
+        return self._client
+
+    def scripts(self):
+        if self._scripts is None:
+            client = self.client()
+            self._scripts = (
+                client.register_script(ALLOW_SCRIPT),
+                client.register_script(FAILURE_SCRIPT),
+                client.register_script(SUCCESS_SCRIPT),
+            )
+        return self._scripts
+
+    def _allowed(self, result):
+        allowed, retry_after_ms, state = result
+        circuit_breaker_state.labels(provider=self.provider).set(STATE_VALUES[state_name(state)])
+        if not allowed:
+            circuit_breaker_rejections.labels(provider=self.provider).inc()
+            raise CircuitOpenError(self.provider, int(retry_after_ms) / 1000)
+
+    def _failed(self, result):
+        tripped, state = result
+        circuit_breaker_state.labels(provider=self.provider).set(STATE_VALUES[state_name(state)])
+        if tripped:
+            circuit_breaker_trips.labels(provider=self.provider).inc()
+            logger.warning(f"Circuit breaker for {self.provider} opened for {BREAKER_OPEN_SECONDS}s")
+
+    def _succeeded(self, state):
+        circuit_breaker_state.labels(provider=self.provider).set(STATE_VALUES[state_name(state)])
+
+    def allow(self):
+        if not BREAKER_ENABLED:
+            return
+        try:
+            result = self.scripts()[0](keys=[self.key], args=[int(BREAKER_PROBE_SECONDS * 1000)])
+        except Exception as e:
+            logger.warning(f"Circuit breaker for {self.provider} unavailable: {e}")
+            return
+        self._allowed(result)
+
+    def record_failure(self):
+        if not BREAKER_ENABLED:
+            return
+        try:
+            result = self.scripts()[1](
+                keys=[self.key], args=[BREAKER_FAILURE_THRESHOLD, int(BREAKER_OPEN_SECONDS * 1000)]
+            )
+        except Exception as e:
+            logger.warning(f"Circuit breaker for {self.provider} unavailable: {e}")
+            return
+        self._failed(result)
+
+    def record_success(self):
+        if not BREAKER_ENABLED:
+            return
+        try:
+            state = self.scripts()[2](keys=[self.key])
+        except Exception as e:
+            logger.warning(f"Circuit breaker for {self.provider} unavailable: {e}")
+            return
+        self._succeeded(state)
+
+
+class AsyncCircuitBreaker(CircuitBreaker):
+    """The same breaker over an asyncio Redis client, for app.workers.async_worker"""
+
+    async def allow(self):
+        if not BREAKER_ENABLED:
+            return
+        try:
+            result = await self.scripts()[0](keys=[self.key], args=[int(BREAKER_PROBE_SECONDS * 1000)])
+        except Exception as e:
+            logger.warning(f"Circuit breaker for {self.provider} unavailable: {e}")
+            return
+        self._allowed(result)
+
+    async def record_failure(self):
+        if not BREAKER_ENABLED:
+            return
+        try:
+            result = await self.scripts()[1](
+                keys=[self.key], args=[BREAKER_FAILURE_THRESHOLD, int(BREAKER_OPEN_SECONDS * 1000)]
+            )
+        except Exception as e:
+            logger.warning(f"Circuit breaker for {self.provider} unavailable: {e}")
+            return
+        self._failed(result)
+
+    async def record_success(self):
+        if not BREAKER_ENABLED:
+            return
+        try:
+            state = await self.scripts()[2](keys=[self.key])
+        except Exception as e:
+            logger.warning(f"Circuit breaker for {self.provider} unavailable: {e}")
+            return
+        self._succeeded(state)
+
+
+# Process-wide breakers for the threaded senders
+circuit_breakers = {provider: CircuitBreaker(provider) for provider in BREAKER_PROVIDERS}
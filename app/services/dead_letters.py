@@ -0,0 +1,42 @@
+from datetime import datetime, timezone
+from typing import Optional
+from dotenv import load_dotenv
+from app import models
+import os
+
+load_dotenv()
+
+# Dead letters handed back to the queues per second by one replay, unless overridden
+REPLAY_RATE = float(os.getenv("REPLAY_RATE", 200))
+# Dead letters claimed per replay step (one transaction, one publish round)
+REPLAY_BATCH_SIZE = int(os.getenv("REPLAY_BATCH_SIZE", 500))
+# Replays pause while a target channel queue holds more messages than this
+REPLAY_MAX_QUEUE_DEPTH = int(os.getenv("REPLAY_MAX_QUEUE_DEPTH", 10000))
+
+REPLAY_TASK = "app.workers.dead_letters.replay_dead_letters"
+
+
+def as_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    """Naive means UTC"""
+    if moment is not None and moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+def dead_letter_filters(
+    channel: Optional[str] = None,
+    error_class: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> list:
+    """WHERE clauses selecting dead letters by channel, error class and failure window [since, until)"""
+    filters = []
+    if channel:
+        filters.append(models.DeadLetter.channel == channel)
+    if error_class:
+        filters.append(models.DeadLetter.error_class == error_class)
+    if since:
+        filters.append(models.DeadLetter.failed_at >= as_utc(since))
+    if until:
+        filters.append(models.DeadLetter.failed_at < as_utc(until))
+    return filters
@@ -0,0 +1,69 @@
+from dotenv import load_dotenv
+from typing import Optional
+import os
+import time
+
+load_dotenv()
+
+# Users opt in with {"digest": true} in their preferences
+DIGEST_PREFERENCE = "digest"
+# Channels whose sends are coalesced; each digest costs one provider call
+DIGEST_CHANNELS = tuple(
+    channel.strip() for channel in os.getenv("DIGEST_CHANNELS", "email,sms").split(",") if channel.strip()
+)
+# A user's first buffered notification is flushed this long after it arrived,
+# together with everything that arrived in the meantime
+DIGEST_WINDOW_SECONDS = float(os.getenv("DIGEST_WINDOW_SECONDS", 60))
+# Notifications combined into one digest message; the rest wait for the next
+DIGEST_MAX_ITEMS = int(os.getenv("DIGEST_MAX_ITEMS", 50))
+# Notifications listed in full in a digest; the others are only counted
+DIGEST_MAX_LINES = int(os.getenv("DIGEST_MAX_LINES", 10))
+
+# Sorted set of "<channel>:<user_id>" buffers, scored by flush time
+DIGEST_DUE_KEY = "digests:due"
+DIGEST_KEY_PREFIX = "digest"
+
+# Buffer one notification (scored by arrival) and schedule the buffer's flush
+# unless one is already scheduled. KEYS: buffer, due index.
+# ARGV: now, notification id, due member, window.
+BUFFER_SCRIPT = """
+redis.call('ZADD', KEYS[1], 'NX', ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[2], 'NX', tonumber(ARGV[1]) + tonumber(ARGV[4]), ARGV[3])
+return 1
+"""
+
+
+def digest_member(channel: str, user_id: int) -> str:
+    return f"{channel}:{user_id}"
+
+
+def parse_digest_member(member: str):
+    channel, _, user_id = member.rpartition(":")
+    return channel, int(user_id)
+
+
+def digest_key(channel: str, user_id: int) -> str:
+    return f"{DIGEST_KEY_PREFIX}:{channel}:{user_id}"
+
+
+def wants_digest(preferences: Optional[dict], channel: str) -> bool:
+    return channel in DIGEST_CHANNELS and bool((preferences or {}).get(DIGEST_PREFERENCE, False))
+
+
+def buffer_notification(client, channel: str, user_id: int, notification_id: str):
+    """
+    Add a notification to the user's digest for this channel. Works with a
+    sync or an asyncio Redis client; await the result with the latter.
+    """
+    return client.register_script(BUFFER_SCRIPT)(
+        keys=[digest_key(channel, user_id), DIGEST_DUE_KEY],
+        args=[time.time(), notification_id, digest_member(channel, user_id), DIGEST_WINDOW_SECONDS],
+    )
+
+
+def format_digest(contents: list):
+    """One (title, message) summing up several (title, message) pairs, oldest first"""
+    lines = [f"- {title}: {message}" for title, message in contents[:DIGEST_MAX_LINES]]
+    if len(contents) > DIGEST_MAX_LINES:
+        lines.append(f"...and {len(contents) - DIGEST_MAX_LINES} more")
+    return f"You have {len(contents)} new notifications", "\n".join(lines)
@@ -1,8 +1,13 @@
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from contextlib import contextmanager
 import os
+import queue
+import socket
+import time
 from dotenv import load_dotenv
+from app.services.circuit_breaker import ProviderError
 import logging
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -11,29 +16,189 @@ SMTP_SERVER = os.getenv("SMTP_SERVER")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 SMTP_EMAIL = os.getenv("SMTP_EMAIL")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+
+# Connection pool settings (per worker process)
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 2))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", 100))
+SMTP_KEEPALIVE_SECONDS = float(os.getenv("SMTP_KEEPALIVE_SECONDS", 30))
+
+# Errors that mean the session itself is gone, as opposed to a bad recipient
+CONNECTION_ERRORS = (
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+    ConnectionError,
+    TimeoutError,
+    socket.gaierror,
+)
+
+
+def is_provider_failure(exc: Exception) -> bool:
+    """Whether the server, not the message, is at fault: no session or a transient 4xx reply"""
+    if isinstance(exc, CONNECTION_ERRORS):
+        return True
+    return isinstance(exc, smtplib.SMTPResponseException) and 400 <= exc.smtp_code < 500
+
+
+class PooledSMTPConnection:
+    """One authenticated SMTP session that is reused across messages"""
+
+    def __init__(self):
+        self.server = None
+        self.sent = 0
+        self.last_used = 0.0
+
+    def open(self):
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        try:
+            if SMTP_STARTTLS:
+                server.starttls()  # Secure connection
+            if SMTP_PASSWORD:
+                server.login(SMTP_EMAIL, SMTP_PASSWORD)
+        except Exception:
+            # Never pool a session that is not secured and authenticated
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+            raise
+        self.server = server
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+        self.server = None
+
+    def reconnect(self):
+        self.close()
+        self.open()
+
+    def ensure_alive(self):
+        """Open, recycle or probe the session before it is used"""
+        if self.server is None:
+            self.open()
+        elif self.sent >= SMTP_MAX_MESSAGES_PER_CONNECTION:
+            self.reconnect()
+        elif time.monotonic() - self.last_used > SMTP_KEEPALIVE_SECONDS:
+            try:
+                code, _ = self.server.noop()
+            except CONNECTION_ERRORS:
+                code = None
+            if code != 250:
+                self.reconnect()
+
+    def send(self, message):
+        self.server.send_message(message)
+        self.sent += 1
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool:
+    """Bounded pool of SMTP sessions, rebuilt after a fork"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        for _ in range(self.size):
+            self._idle.put(PooledSMTPConnection())
+
+    @contextmanager
+    def connection(self):
+        # Sessions inherited from a parent process must never be shared
+        if os.getpid() != self._pid:
+            self._reset()
+        conn = self._idle.get()
+        try:
+            conn.ensure_alive()
+            yield conn
+        except CONNECTION_ERRORS:
+            conn.close()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close_all(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+        self._reset()
+
+
+smtp_pool = SMTPConnectionPool(SMTP_POOL_SIZE)
+
+
+def build_message(to_email: str, subject: str, body: str) -> MIMEMultipart:
+    message = MIMEMultipart()
+    message["From"] = SMTP_EMAIL
+    message["To"] = to_email
+    message["Subject"] = subject
+    message.attach(MIMEText(body, "plain"))
+    return message
+
+
+def _send_with_reconnect(conn: PooledSMTPConnection, message):
+    """Send over the pooled session, reconnecting once if it was dropped"""
+    try:
+        conn.send(message)
+    except CONNECTION_ERRORS:
+        conn.reconnect()
+        conn.send(message)
+
 
 def send_email(to_email: str, subject: str, body: str) -> bool:
-    """Send email via Gmail SMTP"""
-    
+    """
+    Send email over a pooled SMTP session. Returns False if the message was
+    rejected; raises ProviderError if the server could not take it.
+    """
+
     try:
-        # Create message
-        message = MIMEMultipart()
-        message["From"] = SMTP_EMAIL
-        message["To"] = to_email
-        message["Subject"] = subject
-        
-        # Add body
-        message.attach(MIMEText(body, "plain"))
-        
-        # Send via SMTP
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()  # Secure connection
-            server.login(SMTP_EMAIL, SMTP_PASSWORD)
-            server.send_message(message)
-        
+        message = build_message(to_email, subject, body)
+        with smtp_pool.connection() as conn:
+            _send_with_reconnect(conn, message)
+
         logger.info(f"Email sent to {to_email}")
         return True
-    
+
     except Exception as e:
         logger.error(f"Failed to send email to {to_email}: {str(e)}")
-        return False
\ No newline at end of file
+        if is_provider_failure(e):
+            raise ProviderError(f"SMTP server unavailable: {str(e)}") from e
+        return False
+
+
+def send_many(emails: list) -> list:
+    """
+    Send (to_email, subject, body) tuples over one authenticated session.
+    Returns one error per email: None if it was sent, a ProviderError if the
+    server could not take it, otherwise why it was rejected. A rejected
+    message only affects itself.
+    """
+    errors = []
+    try:
+        with smtp_pool.connection() as conn:
+            for to_email, subject, body in emails:
+                try:
+                    _send_with_reconnect(conn, build_message(to_email, subject, body))
+                    errors.append(None)
+                except CONNECTION_ERRORS:
+                    # Reconnecting did not help; don't hammer a dead server
+                    raise
+                except Exception as e:
+                    logger.error(f"Failed to send email to {to_email}: {str(e)}")
+                    errors.append(ProviderError(str(e)) if is_provider_failure(e) else e)
+    except Exception as e:
+        logger.error(f"SMTP session failed: {str(e)}")
+        # Anything not attempted because the session was unavailable
+        error = ProviderError(f"SMTP session failed: {str(e)}") if is_provider_failure(e) else e
+        errors.extend([error] * (len(emails) - len(errors)))
+    logger.info(f"Sent {errors.count(None)}/{len(emails)} emails in one session")
+    return errors
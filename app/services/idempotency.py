@@ -0,0 +1,76 @@
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+from app import models
+from app.services.redis_pubsub import get_async_redis
+import os
+import json
+import logging
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# How long Redis remembers a key; the DB constraint covers it after that
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 86400))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# How long an in-progress claim blocks retries if its request never finishes
+# (worker killed mid-request); retries after that fall back to the DB constraint
+IDEMPOTENCY_LOCK_TTL = int(os.getenv("IDEMPOTENCY_LOCK_TTL", 30))
+# Value held while the first request with a key is still being processed
+IN_PROGRESS = "in-progress"
+
+
+def redis_key(user_id: int, key: str) -> str:
+    return f"idempotency:{user_id}:{key}"
+
+
+async def claim(user_id: int, key: str):
+    """
+    Reserve a key in one round trip (SET NX GET, Redis 7+). Returns None when
+    this request owns the key, otherwise what the first request stored:
+    IN_PROGRESS or its serialized response. Fails open when Redis is down;
+    the unique constraint on idempotency_keys still stops the duplicate.
+    """
+    try:
+        return await get_async_redis().set(
+            redis_key(user_id, key), IN_PROGRESS, nx=True, get=True, ex=IDEMPOTENCY_LOCK_TTL
+        )
+    except Exception as e:
+        logger.warning(f"Idempotency lookup failed, falling back to the DB constraint: {e}")
+        return None
+
+
+async def store_response(user_id: int, key: str, body: str):
+    """Remember the response so replays are answered from Redis alone"""
+    try:
+        await get_async_redis().set(redis_key(user_id, key), body, ex=IDEMPOTENCY_KEY_TTL)
+    except Exception as e:
+        logger.warning(f"Failed to cache idempotent response: {e}")
+
+
+async def release(user_id: int, key: str):
+    """Forget a claim whose request failed before anything was written"""
+    try:
+        await get_async_redis().delete(redis_key(user_id, key))
+    except Exception as e:
+        logger.warning(f"Failed to release idempotency key: {e}")
+
+
+async def find_notification(db: AsyncSession, user_id: int, key: str):
+    """The notification created by an earlier request with this key, if any"""
+    result = await db.execute(
+        select(models.Notification)
+        .join(models.IdempotencyKey, models.IdempotencyKey.notification_id == models.Notification.id)
+        .where(models.IdempotencyKey.user_id == user_id, models.IdempotencyKey.key == key)
+    )
+    return result.scalars().first()
+
+
+def replay(body: str) -> JSONResponse:
+    """The original 202 response of the first request with the key"""
+    return JSONResponse(
+        status_code=202,
+        content=json.loads(body),
+        headers={"Idempotent-Replayed": "true"}
+    )
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from dotenv import load_dotenv
+import os
+import secrets
+import threading
+import time
+import uuid
+
+load_dotenv()
+
+# Largest expected gap between an id's embedded time and its row's created_at
+ID_TIME_SKEW = timedelta(seconds=int(os.getenv("ID_TIME_SKEW_SECONDS", 300)))
+
+_lock = threading.Lock()
+_last_ms = 0
+_sequence = 0
+
+
+def uuid7() -> str:
+    """
+    Time-ordered UUID (RFC 9562 version 7): a 48-bit Unix millisecond
+    timestamp, a 12-bit sequence that keeps ids from this process strictly
+    increasing within a millisecond, then 62 random bits that keep replicas
+    and workers from colliding without any coordination.
+    """
+    global _last_ms, _sequence
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            # Random start, with room left for increments
+            _sequence = secrets.randbits(11)
+        else:
+            # Same millisecond, or the clock stepped back: keep counting
+            _sequence += 1
+            if _sequence > 0xFFF:
+                _last_ms += 1
+                _sequence = secrets.randbits(11)
+        value = (_last_ms << 80) | (0x7 << 76) | (_sequence << 64) | (0b10 << 62) | secrets.randbits(62)
+    return str(uuid.UUID(int=value))
+
+
+def is_valid_id(notification_id: str) -> bool:
+    try:
+        uuid.UUID(notification_id)
+        return True
+    except ValueError:
+        return False
+
+
+def id_time(notification_id: str) -> Optional[datetime]:
+    """Creation time embedded in a UUIDv7; None for older uuid4 ids"""
+    try:
+        value = uuid.UUID(notification_id)
+    except ValueError:
+        return None
+    if value.version != 7:
+        return None
+    return datetime.fromtimestamp((value.int >> 80) / 1000, tz=timezone.utc)
+
+
+def created_at_bounds(created_at_column, notification_id: str) -> list:
+    """
+    created_at predicates implied by the id, so lookups by id touch a single
+    partition. Empty for ids that carry no time.
+    """
+    moment = id_time(notification_id)
+    if moment is None:
+        return []
+    return [created_at_column >= moment - ID_TIME_SKEW, created_at_column < moment + ID_TIME_SKEW]
+
+
+def created_at_range(created_at_column, notification_ids) -> list:
+    """
+    created_at_bounds for a set of ids: one range spanning all of them, so a
+    set-based statement only touches their partitions. Empty if any id
+    carries no time.
+    """
+    moments = [id_time(notification_id) for notification_id in notification_ids]
+    if not moments or None in moments:
+        return []
+    return [created_at_column >= min(moments) - ID_TIME_SKEW, created_at_column < max(moments) + ID_TIME_SKEW]
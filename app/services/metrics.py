@@ -1,11 +1,23 @@
-from prometheus_client import Counter, Histogram, Gauge, CollectorRegistry, push_to_gateway
+from prometheus_client import Counter, Histogram, Gauge, CollectorRegistry, REGISTRY, push_to_gateway, delete_from_gateway, start_http_server, multiprocess
+import atexit
 import os
+import socket
+import threading
 import logging
 
 # Configure logging properly
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# How worker processes export metrics:
+#   push   - a background thread pushes to the Pushgateway every METRICS_PUSH_INTERVAL seconds
+#   scrape - Prometheus scrapes WORKER_METRICS_PORT on the worker
+# With a prefork pool, set PROMETHEUS_MULTIPROC_DIR (an empty directory) so that
+# every child writes to shared files and the parent exports the aggregate.
+WORKER_METRICS_MODE = os.getenv("WORKER_METRICS_MODE", "push")
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", 9100))
+METRICS_PUSH_INTERVAL = float(os.getenv("METRICS_PUSH_INTERVAL", 15))
+
 # Separate registry for worker metrics
 worker_registry = CollectorRegistry()
 
@@ -24,44 +36,218 @@ notification_duration = Histogram(
     registry=worker_registry
 )
 
+# Counted from the database by one periodic task (measure_pending_notifications),
+# not tracked by the processes that create and finish deliveries
 pending_notifications = Gauge(
     'pending_notifications',
-    'Number of pending notifications',
+    'Number of due notifications not yet sent or failed',
+    registry=worker_registry,
+    multiprocess_mode='livemax'
+)
+
+task_db_duration = Histogram(
+    'task_db_duration_seconds',
+    'Time a worker task spent in database calls',
+    ['task'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1),
+    registry=worker_registry
+)
+
+outbox_lag = Gauge(
+    'outbox_lag_seconds',
+    'Age of the oldest notification not yet published by the outbox relay',
+    registry=worker_registry,
+    multiprocess_mode='livemax'
+)
+
+outbox_publish_delay = Histogram(
+    'outbox_publish_delay_seconds',
+    'Time from the notification commit to its publish by the outbox relay',
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60),
     registry=worker_registry
 )
 
-def push_metrics():
-    """Push all metrics (counters, histograms, gauges) to Pushgateway"""
-    pushgateway_url = os.getenv("PUSHGATEWAY_URL", "localhost:9091")
-    
+outbox_published = Counter(
+    'outbox_published_total',
+    'Outbox entries published to the broker',
+    registry=worker_registry
+)
+
+scheduler_dispatch_lag = Histogram(
+    'scheduler_dispatch_lag_seconds',
+    'Time between a scheduled notification falling due and its move to the outbox',
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60),
+    registry=worker_registry
+)
+
+scheduled_notifications = Gauge(
+    'scheduled_notifications',
+    'Notifications waiting in the due-time index',
+    registry=worker_registry,
+    multiprocess_mode='livemax'
+)
+
+dead_letters_recorded = Counter(
+    'dead_letters_recorded_total',
+    'Deliveries that exhausted their retries',
+    ['channel'],
+    registry=worker_registry
+)
+
+dead_letters_replayed = Counter(
+    'dead_letters_replayed_total',
+    'Dead letters handed back to the channel queues',
+    ['channel'],
+    registry=worker_registry
+)
+
+circuit_breaker_state = Gauge(
+    'circuit_breaker_state',
+    'Provider circuit breaker state last seen by this process (0 closed, 1 half-open, 2 open)',
+    ['provider'],
+    registry=worker_registry,
+    multiprocess_mode='livemax'
+)
+
+circuit_breaker_trips = Counter(
+    'circuit_breaker_trips_total',
+    'Times a provider circuit breaker opened',
+    ['provider'],
+    registry=worker_registry
+)
+
+circuit_breaker_rejections = Counter(
+    'circuit_breaker_rejections_total',
+    'Sends deferred because the provider circuit breaker was open',
+    ['provider'],
+    registry=worker_registry
+)
+
+digests_sent = Counter(
+    'digests_sent_total',
+    'Combined digest messages sent, one provider call each',
+    ['channel'],
+    registry=worker_registry
+)
+
+digested_notifications = Counter(
+    'digested_notifications_total',
+    'Notifications delivered inside a digest instead of on their own',
+    ['channel'],
+    registry=worker_registry
+)
+
+# Shared by the API and the workers: exported from both registries
+user_routing_cache_requests = Counter(
+    'user_routing_cache_total',
+    'User routing lookups by the tier that answered',
+    ['source'],  # local, redis or db
+    registry=worker_registry
+)
+REGISTRY.register(user_routing_cache_requests)
+
+# API-side metrics are registered on the default registry served by /metrics
+principal_cache_requests = Counter(
+    'auth_principal_cache_total',
+    'Authenticated principal lookups by source',
+    ['result']  # hit, miss or claims
+)
+
+rate_limit_decisions = Counter(
+    'rate_limit_decisions_total',
+    'Rate limiter decisions by endpoint',
+    ['endpoint', 'decision']  # allowed, limited or error (failed open)
+)
+
+rate_limit_check_duration = Histogram(
+    'rate_limit_check_seconds',
+    'Time spent deciding whether a request is within its quota',
+    buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05)
+)
+
+def export_registry():
+    """Registry to export: the aggregate of all processes in multiprocess mode"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return worker_registry
+
+def pushgateway_url() -> str:
     # Remove http:// or https:// if present
-    pushgateway_url = pushgateway_url.replace("http://", "").replace("https://", "")
-    
-    logger.info("=" * 60)
-    logger.info("PUSH METRICS CALLED")
-    logger.info(f" Target: {pushgateway_url}")
-    logger.info(f" Registry has {len(list(worker_registry.collect()))} metric families")
-    
-    # Log current metric values
-    for metric_family in worker_registry.collect():
-        logger.info(f"   Metric: {metric_family.name}")
-        for sample in metric_family.samples:
-            logger.info(f"      {sample.name}{sample.labels} = {sample.value}")
-    
+    return os.getenv("PUSHGATEWAY_URL", "localhost:9091").replace("http://", "").replace("https://", "")
+
+def grouping_key() -> dict:
+    """This process's Pushgateway group; removed again when the process exits"""
+    return {'instance': f"{socket.gethostname()}-{os.getpid()}"}
+
+def push_metrics(registry=None):
+    """Push worker metrics to the Pushgateway once"""
     try:
-        logger.info("⏳ Pushing to Pushgateway...")
         push_to_gateway(
-            pushgateway_url, 
+            pushgateway_url(),
             job='celery_workers',
-            registry=worker_registry
+            registry=registry or worker_registry,
+            grouping_key=grouping_key()
         )
-        logger.info(" Metrics pushed to Pushgateway successfully!")
-        logger.info("=" * 60)
     except Exception as e:
-        logger.error("=" * 60)
-        logger.error(f" FAILED to push metrics!")
-        logger.error(f" Error type: {type(e).__name__}")
-        logger.error(f" Error message: {str(e)}")
-        logger.error("=" * 60)
-        import traceback
-        logger.error(traceback.format_exc())
\ No newline at end of file
+        logger.error(f"Failed to push metrics to {pushgateway_url()}: {type(e).__name__}: {str(e)}")
+
+# Process whose metrics-pusher thread is running, if any
+_pushing_pid = None
+_pushing_stopped = threading.Event()
+
+def _push_periodically(registry):
+    while not _pushing_stopped.wait(METRICS_PUSH_INTERVAL):
+        push_metrics(registry)
+
+def delete_pushed_metrics():
+    """
+    Stop pushing and delete this process's group from the Pushgateway, which
+    would otherwise keep serving its last values after the process is gone.
+    """
+    if _pushing_pid != os.getpid() or _pushing_stopped.is_set():
+        return
+    _pushing_stopped.set()
+    try:
+        delete_from_gateway(pushgateway_url(), job='celery_workers', grouping_key=grouping_key())
+    except Exception as e:
+        logger.error(f"Failed to delete metrics from {pushgateway_url()}: {type(e).__name__}: {str(e)}")
+
+def start_metrics_exporter():
+    """
+    Start exporting worker metrics from this process, off the delivery path.
+    Call once per worker (the pool parent when PROMETHEUS_MULTIPROC_DIR is set).
+    """
+    global _pushing_pid
+    registry = export_registry()
+    if WORKER_METRICS_MODE == "scrape":
+        try:
+            start_http_server(WORKER_METRICS_PORT, registry=registry)
+        except OSError as e:
+            logger.error(f"Cannot serve worker metrics on :{WORKER_METRICS_PORT} ({e}); "
+                         "set PROMETHEUS_MULTIPROC_DIR when running a process pool")
+            return
+        logger.info(f"Serving worker metrics on :{WORKER_METRICS_PORT}")
+    else:
+        _pushing_pid = os.getpid()
+        threading.Thread(
+            target=_push_periodically, args=(registry,), name="metrics-pusher", daemon=True
+        ).start()
+        # Pool children exit without running atexit hooks; see celery_app
+        atexit.register(delete_pushed_metrics)
+        logger.info(f"Pushing worker metrics every {METRICS_PUSH_INTERVAL}s")
+
+_exporter_pid = None
+
+def ensure_metrics_exporter():
+    """Start the exporter in the current process if it has not been started yet"""
+    global _exporter_pid
+    if _exporter_pid != os.getpid():
+        _exporter_pid = os.getpid()
+        start_metrics_exporter()
+
+def mark_process_dead(pid: int):
+    """Drop a finished pool child's live gauges from the multiprocess aggregate"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,69 @@
+"""
+Monthly range partitions of the notifications table (PostgreSQL).
+
+Partitions are named notifications_pYYYY_MM and cover [month start, next
+month start) in UTC. notifications_legacy holds everything created before
+partitioning was introduced.
+"""
+from sqlalchemy import text
+from datetime import datetime, timezone
+import re
+
+PARENT_TABLE = "notifications"
+PARTITION_PREFIX = "notifications_p"
+LEGACY_PARTITION = "notifications_legacy"
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+def month_start(moment: datetime, offset: int = 0) -> datetime:
+    """First instant of the month `offset` months after the one containing moment (UTC)"""
+    month_index = moment.year * 12 + moment.month - 1 + offset
+    return datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(start: datetime) -> str:
+    return f"{PARTITION_PREFIX}{start.year:04d}_{start.month:02d}"
+
+
+def ensure_partitions(conn, months_ahead: int) -> list:
+    """Create any missing partitions from the current month to months_ahead months out"""
+    now = datetime.now(timezone.utc)
+    # Months already covered (e.g. by the legacy partition) are skipped
+    bounds = [upper for _, upper, _ in attached_partitions(conn) if upper is not None]
+    covered_until = max(bounds) if bounds else None
+    created = []
+    for offset in range(months_ahead + 1):
+        start, end = month_start(now, offset), month_start(now, offset + 1)
+        if covered_until is not None and start < covered_until:
+            continue
+        name = partition_name(start)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        created.append(name)
+    return created
+
+
+def attached_partitions(conn) -> list:
+    """(name, upper bound, detach pending) of every partition still attached"""
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), i.inhdetachpending "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:parent AS regclass)"
+    ), {"parent": PARENT_TABLE}).all()
+    partitions = []
+    for name, bound, pending in rows:
+        match = _UPPER_BOUND.search(bound or "")
+        upper = datetime.fromisoformat(match.group(1)) if match else None
+        partitions.append((name, upper, pending))
+    return partitions
+
+
+def detached_partitions(conn) -> list:
+    """Former partitions that were detached but not yet archived and dropped"""
+    return conn.execute(text(
+        "SELECT c.relname FROM pg_class c "
+        "WHERE c.relkind = 'r' AND (c.relname LIKE :prefix OR c.relname = :legacy) "
+        "AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)"
+    ), {"prefix": PARTITION_PREFIX + "%", "legacy": LEGACY_PARTITION}).scalars().all()
@@ -0,0 +1,139 @@
+from fastapi import HTTPException, Request, Response, status
+from jose import JWTError, jwt
+from dotenv import load_dotenv
+from app.oauth2 import SECRET_KEY, ALGORITHM
+from app.services.redis_pubsub import get_async_redis
+from app.services.metrics import rate_limit_decisions, rate_limit_check_duration
+import math
+import os
+import time
+import logging
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Default quotas per endpoint; override with RATE_LIMIT_<ENDPOINT>, e.g.
+# RATE_LIMIT_NOTIFICATIONS_CREATE=100/minute
+DEFAULT_RATE_LIMITS = {
+    "login": "5/minute",
+    "users:create": "5/minute",
+    "users:update": "5/minute",
+    "notifications:create": "10/minute",
+    "notifications:batch": "10/minute",
+}
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Use the left-most X-Forwarded-For address for anonymous callers. Only enable
+# behind a proxy that overwrites the header.
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+RATE_LIMIT_KEY_PREFIX = "ratelimit"
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# GCRA: one key per caller holding the theoretical arrival time (TAT) in
+# microseconds. Time comes from the Redis server so every replica agrees.
+# Returns {allowed, retry_after_us, remaining}.
+GCRA_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000000 + tonumber(now_parts[2])
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - tolerance
+if now < allow_at then
+    return {0, allow_at - now, 0}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil((new_tat - now) / 1000))
+return {1, 0, math.floor((tolerance - (new_tat - now)) / interval)}
+"""
+
+
+def parse_rate(rate: str):
+    """'10/minute' -> (10, 60)"""
+    count, _, period = rate.partition("/")
+    return int(count), PERIODS[period.strip().rstrip("s")]
+
+
+def endpoint_rate(endpoint: str) -> str:
+    env_name = "RATE_LIMIT_" + endpoint.upper().replace(":", "_")
+    return os.getenv(env_name, DEFAULT_RATE_LIMITS[endpoint])
+
+
+def client_identity(request: Request) -> str:
+    """
+    Authenticated user id from the bearer token, falling back to the client
+    address for anonymous endpoints such as login and sign-up. The token is
+    only decoded here; route dependencies still do the full authentication.
+    """
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            user_id = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("user_id")
+            if user_id is not None:
+                return f"user:{user_id}"
+        except JWTError:
+            pass
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return f"ip:{forwarded.split(',')[0].strip()}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+class RateLimit:
+    """
+    FastAPI dependency enforcing one endpoint's quota across every API replica.
+    Usage: @router.post(..., dependencies=[Depends(RateLimit("notifications:create"))])
+    """
+
+    _script = None
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.rate = endpoint_rate(endpoint)
+        self.limit, period = parse_rate(self.rate)
+        # Emission interval and burst tolerance in microseconds
+        self.interval = period * 1_000_000 // self.limit
+        self.tolerance = period * 1_000_000
+
+    @classmethod
+    def script(cls):
+        if cls._script is None:
+            cls._script = get_async_redis().register_script(GCRA_SCRIPT)
+        return cls._script
+
+    async def __call__(self, request: Request, response: Response):
+        if not RATE_LIMIT_ENABLED:
+            return
+        key = f"{RATE_LIMIT_KEY_PREFIX}:{self.endpoint}:{client_identity(request)}"
+        start_time = time.perf_counter()
+        try:
+            allowed, retry_after_us, remaining = await self.script()(
+                keys=[key], args=[self.interval, self.tolerance]
+            )
+        except Exception as e:
+            # Fail open: an unavailable Redis must not take the API down with it
+            rate_limit_decisions.labels(endpoint=self.endpoint, decision="error").inc()
+            logger.warning(f"Rate limiter unavailable for {self.endpoint}: {e}")
+            return
+        finally:
+            rate_limit_check_duration.observe(time.perf_counter() - start_time)
+
+        if not allowed:
+            rate_limit_decisions.labels(endpoint=self.endpoint, decision="limited").inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Rate limit exceeded: {self.rate}",
+                headers={
+                    "Retry-After": str(math.ceil(retry_after_us / 1_000_000)),
+                    "X-RateLimit-Limit": str(self.limit),
+                    "X-RateLimit-Remaining": "0",
+                },
+            )
+        rate_limit_decisions.labels(endpoint=self.endpoint, decision="allowed").inc()
+        response.headers["X-RateLimit-Limit"] = str(self.limit)
+        response.headers["X-RateLimit-Remaining"] = str(remaining)
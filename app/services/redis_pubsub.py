@@ -1,9 +1,17 @@
 import redis
+import redis.asyncio as aioredis
 import json
+import os
 import logging
+from dotenv import load_dotenv
 
+load_dotenv()
 logger = logging.getLogger(__name__)
 
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Every per-user channel; the API's WebSocket hub pattern-subscribes to all of them
+USER_CHANNEL_PATTERN = "notifications:user:*"
+
 class RedisPubSub:
     def __init__(self, redis_url: str = "redis://localhost:6379/0"):
         self.redis = redis.from_url(redis_url, decode_responses=True)
@@ -28,4 +36,13 @@ class RedisPubSub:
         return pubsub
 
 # Global instance
-redis_pubsub = RedisPubSub()
\ No newline at end of file
+redis_pubsub = RedisPubSub(REDIS_URL)
+
+_async_redis = None
+
+def get_async_redis():
+    """Shared redis.asyncio client for the API process"""
+    global _async_redis
+    if _async_redis is None:
+        _async_redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+    return _async_redis
\ No newline at end of file
@@ -0,0 +1,107 @@
+from dotenv import load_dotenv
+import os
+import socket
+import time
+import uuid
+
+load_dotenv()
+
+# Redis list queues consumed without losing messages to a crash: a consumer
+# moves each message into its own processing list (BLMOVE) and removes it
+# (LREM) only once it is done with it. Consumers hold a lease in the queue's
+# registry while they run; a processing list whose owner's lease ran out is
+# handed back to the queue by the next consumer that renews its own.
+
+# A consumer that has not renewed its lease for this long is presumed dead
+CONSUMER_LEASE_SECONDS = float(os.getenv("CONSUMER_LEASE_SECONDS", 60))
+CONSUMER_RENEW_SECONDS = CONSUMER_LEASE_SECONDS / 4
+
+# Messages are taken from the queue's head and appended to the processing
+# list, so that list reads oldest to newest from the same side as the queue.
+# The scripts take that side (LEFT or RIGHT) as the head, and the other as the tail.
+
+# Renew a lease, then requeue the messages of every expired consumer.
+# KEYS: queue, registry. ARGV: now, consumer, lease end, processing key prefix, head, tail.
+RENEW_SCRIPT = """
+redis.call('HSET', KEYS[2], ARGV[2], ARGV[3])
+local leases = redis.call('HGETALL', KEYS[2])
+local requeued = 0
+for i = 1, #leases, 2 do
+    if tonumber(leases[i + 1]) < tonumber(ARGV[1]) then
+        local processing = ARGV[4] .. leases[i]
+        while redis.call('LMOVE', processing, KEYS[1], ARGV[6], ARGV[5]) do
+            requeued = requeued + 1
+        end
+        redis.call('HDEL', KEYS[2], leases[i])
+    end
+end
+return requeued
+"""
+
+# Move up to ARGV[1] messages from the head of the queue into the processing list.
+# KEYS: queue, processing list. ARGV: count, head, tail.
+CLAIM_SCRIPT = """
+local claimed = {}
+for i = 1, tonumber(ARGV[1]) do
+    local message = redis.call('LMOVE', KEYS[1], KEYS[2], ARGV[2], ARGV[3])
+    if not message then
+        break
+    end
+    claimed[i] = message
+end
+return claimed
+"""
+
+# Put everything in the processing list back at the head of the queue, in order.
+# KEYS: queue, processing list. ARGV: head, tail.
+REQUEUE_SCRIPT = """
+local requeued = 0
+while redis.call('LMOVE', KEYS[2], KEYS[1], ARGV[2], ARGV[1]) do
+    requeued = requeued + 1
+end
+return requeued
+"""
+
+
+def consumer_id() -> str:
+    """Unique per process, so consumers on one host never share a processing list"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def processing_key(queue: str, consumer: str) -> str:
+    return f"{queue}:processing:{consumer}"
+
+
+def registry_key(queue: str) -> str:
+    return f"{queue}:consumers"
+
+
+def tail(head: str) -> str:
+    return "RIGHT" if head == "LEFT" else "LEFT"
+
+
+def renew_lease(client, queue: str, consumer: str, head: str = "LEFT"):
+    """
+    Renew this consumer's lease and requeue what dead consumers left behind;
+    returns the number of messages requeued. Works with a sync or an asyncio
+    Redis client; await the result with the latter.
+    """
+    now = time.time()
+    return client.register_script(RENEW_SCRIPT)(
+        keys=[queue, registry_key(queue)],
+        args=[now, consumer, now + CONSUMER_LEASE_SECONDS, processing_key(queue, ""), head, tail(head)],
+    )
+
+
+def claim(client, queue: str, consumer: str, count: int, head: str = "LEFT"):
+    """Move up to count messages from the queue into this consumer's processing list"""
+    return client.register_script(CLAIM_SCRIPT)(
+        keys=[queue, processing_key(queue, consumer)], args=[count, head, tail(head)]
+    )
+
+
+def requeue(client, queue: str, consumer: str, head: str = "LEFT"):
+    """Hand this consumer's unfinished messages back to the head of the queue"""
+    return client.register_script(REQUEUE_SCRIPT)(
+        keys=[queue, processing_key(queue, consumer)], args=[head, tail(head)]
+    )
@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+from typing import Optional
+from dotenv import load_dotenv
+from app.services.redis_pubsub import get_async_redis
+import logging
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Sorted set of scheduled notification ids, scored by due time (epoch seconds).
+# It is an index over scheduled_notifications: the scheduler rebuilds it on
+# start and sweeps the table for anything it is missing.
+SCHEDULED_KEY = "notifications:scheduled"
+
+
+def due_time(scheduled_at: Optional[datetime]) -> Optional[datetime]:
+    """The UTC due time of a future send, or None to send immediately (naive means UTC)"""
+    if scheduled_at is None:
+        return None
+    if scheduled_at.tzinfo is None:
+        scheduled_at = scheduled_at.replace(tzinfo=timezone.utc)
+    if scheduled_at <= datetime.now(timezone.utc):
+        return None
+    return scheduled_at
+
+
+async def index_scheduled(entries: list):
+    """Add committed (notification_id, due_at) pairs to the due-time index"""
+    if not entries:
+        return
+    try:
+        await get_async_redis().zadd(
+            SCHEDULED_KEY, {notification_id: due_at.timestamp() for notification_id, due_at in entries}
+        )
+    except Exception as e:
+        # The scheduler's sweep of scheduled_notifications still finds them
+        logger.warning(f"Failed to index {len(entries)} scheduled notifications: {e}")
@@ -1,4 +1,10 @@
 from twilio.rest import Client
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+from app.services.throttle import TokenBucket
+from app.services.circuit_breaker import ProviderError
 import os
 from dotenv import load_dotenv
 import logging
@@ -10,13 +16,43 @@ logger = logging.getLogger(__name__)
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
+# Point at a local stand-in for load tests
+TWILIO_API_BASE = os.getenv("TWILIO_API_BASE", "https://api.twilio.com")
+
+# Keep-alive connection pool and timeouts (per process)
+TWILIO_POOL_SIZE = int(os.getenv("TWILIO_POOL_SIZE", 20))
+TWILIO_TIMEOUT = float(os.getenv("TWILIO_TIMEOUT", 10))
+# Messages per second this process may send. Twilio enforces the cap per
+# account, so with N sending processes set this to the account cap / N.
+TWILIO_MPS = float(os.getenv("TWILIO_MPS", 1))
+
+http_client = TwilioHttpClient(pool_connections=True, timeout=TWILIO_TIMEOUT)
+_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=TWILIO_POOL_SIZE)
+http_client.session.mount("https://", _adapter)
+http_client.session.mount("http://", _adapter)
+
+client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=http_client)
+client.api.base_url = TWILIO_API_BASE
+
+# Shared by every sender in this process, threads and asyncio alike
+sms_rate_limiter = TokenBucket(TWILIO_MPS)
+
+
+def is_provider_failure(exc: Exception) -> bool:
+    """Whether Twilio, not the message, is at fault: unreachable, timed out or a 5xx"""
+    if isinstance(exc, TwilioRestException):
+        return exc.status >= 500
+    return isinstance(exc, (RequestsConnectionError, Timeout))
 
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
 def send_sms(to_number: str, message: str) -> bool:
-    """Send SMS via Twilio"""
+    """
+    Send SMS via Twilio. Returns False if the message was rejected; raises
+    ProviderError if Twilio could not take it.
+    """
     
     try:
+        sms_rate_limiter.acquire()
         sms = client.messages.create(
             body=message,
             from_=TWILIO_PHONE_NUMBER,
@@ -28,4 +64,6 @@ def send_sms(to_number: str, message: str) -> bool:
     
     except Exception as e:
         logger.error(f"Failed to send SMS to {to_number}: {str(e)}")
-        return False
\ No newline at end of file
+        if is_provider_failure(e):
+            raise ProviderError(f"Twilio unavailable: {str(e)}") from e
+        return False
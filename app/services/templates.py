@@ -0,0 +1,102 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+from app import models
+from app.services.user_cache import TTLCache
+import os
+import re
+
+load_dotenv()
+
+TEMPLATE_CACHE_SIZE = int(os.getenv("TEMPLATE_CACHE_SIZE", 1000))
+
+# {{ name }} placeholders; anything else is literal text
+PLACEHOLDER = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+
+class TemplateError(ValueError):
+    pass
+
+
+def compile_text(text: str) -> tuple:
+    """Split text into alternating literals and variable names: (lit, name, lit, ...)"""
+    return tuple(PLACEHOLDER.split(text))
+
+
+def render_parts(parts: tuple, variables: dict) -> str:
+    try:
+        return "".join(
+            part if index % 2 == 0 else str(variables[part])
+            for index, part in enumerate(parts)
+        )
+    except KeyError as e:
+        raise TemplateError(f"Missing template variable {e.args[0]}")
+
+
+class CompiledTemplate:
+    """A template version parsed once; rendering is a single join"""
+
+    def __init__(self, title: str, message: str):
+        self.title_parts = compile_text(title)
+        self.message_parts = compile_text(message)
+        self.variables = frozenset(self.title_parts[1::2]) | frozenset(self.message_parts[1::2])
+
+    def missing(self, variables: dict) -> list:
+        return sorted(self.variables - set(variables or ()))
+
+    def render(self, variables: dict) -> tuple:
+        """(title, message) for one recipient"""
+        variables = variables or {}
+        return render_parts(self.title_parts, variables), render_parts(self.message_parts, variables)
+
+
+# (template_id, version) -> CompiledTemplate. Versions are immutable, so an
+# update never has to evict anything: it simply starts using a new key.
+compiled_templates = TTLCache(TEMPLATE_CACHE_SIZE, float("inf"))
+
+
+def compiled_template(db, template_id: int, version: int) -> CompiledTemplate:
+    """Compiled template version for worker code on a sync Session"""
+    key = (template_id, version)
+    compiled = compiled_templates.get(key)
+    if compiled is None:
+        row = db.get(models.TemplateVersion, key)
+        if row is None:
+            raise TemplateError(f"Template {template_id} version {version} not found")
+        compiled = CompiledTemplate(row.title, row.message)
+        compiled_templates.set(key, compiled)
+    return compiled
+
+
+async def compiled_template_async(db: AsyncSession, template_id: int, version: int) -> CompiledTemplate:
+    """Compiled template version for API code on an AsyncSession"""
+    key = (template_id, version)
+    compiled = compiled_templates.get(key)
+    if compiled is None:
+        row = await db.get(models.TemplateVersion, key)
+        if row is None:
+            raise TemplateError(f"Template {template_id} version {version} not found")
+        compiled = CompiledTemplate(row.title, row.message)
+        compiled_templates.set(key, compiled)
+    return compiled
+
+
+async def current_templates(db: AsyncSession, template_ids) -> dict:
+    """template_id -> (current version, CompiledTemplate) with one query for the versions"""
+    if not template_ids:
+        return {}
+    result = await db.execute(
+        select(models.Template.id, models.Template.version).where(models.Template.id.in_(template_ids))
+    )
+    return {
+        row.id: (row.version, await compiled_template_async(db, row.id, row.version))
+        for row in result.all()
+    }
+
+
+def notification_content(db, notification) -> tuple:
+    """(title, message) of a notification, rendering its template if it has one"""
+    if notification.template_id is None:
+        return notification.title, notification.message
+    compiled = compiled_template(db, notification.template_id, notification.template_version)
+    return compiled.render(notification.variables)
@@ -0,0 +1,340 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+import json
+import logging
+from sqlalchemy import select
+from app import models
+from app.schemas import UserRouting
+from app.services.metrics import user_routing_cache_requests
+from app.services.redis_pubsub import get_async_redis, redis_pubsub
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 60))
+
+# User routing data: active flag, preferences and contact details
+ROUTING_CACHE_SIZE = int(os.getenv("ROUTING_CACHE_SIZE", 10000))
+ROUTING_CACHE_TTL = float(os.getenv("ROUTING_CACHE_TTL", 60))
+ROUTING_REDIS_TTL = int(os.getenv("ROUTING_REDIS_TTL", 3600))
+ROUTING_KEY_PREFIX = "users:routing:"
+# Bumped by every invalidation; a reader only caches what it loaded if the
+# version is still the one it saw before going to the database
+ROUTING_VERSION_PREFIX = "users:routing-version:"
+
+# Populate a routing hash unless the user was invalidated since the reader
+# looked up the version. KEYS: routing hash, version. ARGV: version seen
+# ('' for none), ttl, then field/value pairs.
+POPULATE_SCRIPT = """
+local version = redis.call('GET', KEYS[2]) or ''
+if version ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# Every API replica listens here and drops its cached copy of the user
+USER_INVALIDATION_CHANNEL = "users:invalidate"
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed TTL"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Authenticated principals keyed by user id
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+# users:invalidated-at:<id> holds the wall-clock time of the user's last
+# invalidation, shared by every replica. Tokens issued before that time no
+# longer have their embedded claims trusted; kept as long as a token lives.
+INVALIDATED_AT_PREFIX = "users:invalidated-at:"
+INVALIDATED_AT_TTL = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30)) * 60
+
+
+# Routing data keyed by user id; process-local tier in front of the Redis hashes
+routing_cache = TTLCache(ROUTING_CACHE_SIZE, ROUTING_CACHE_TTL)
+
+
+def invalidate_user(user_id: int):
+    """Drop a user from this process's caches"""
+    principal_cache.invalidate(user_id)
+    routing_cache.invalidate(user_id)
+
+
+def routing_key(user_id: int) -> str:
+    return f"{ROUTING_KEY_PREFIX}{user_id}"
+
+
+def invalidated_at_key(user_id: int) -> str:
+    return f"{INVALIDATED_AT_PREFIX}{user_id}"
+
+
+def routing_version_key(user_id: int) -> str:
+    return f"{ROUTING_VERSION_PREFIX}{user_id}"
+
+
+def populate_routing(client, routing: UserRouting, version):
+    """
+    Cache a routing loaded from the database, unless an invalidation bumped
+    the version since it was read; returns 1 if it was cached. Works with a
+    sync or an asyncio Redis client; await the result with the latter.
+    """
+    fields = [item for pair in routing_to_hash(routing).items() for item in pair]
+    return client.register_script(POPULATE_SCRIPT)(
+        keys=[routing_key(routing.id), routing_version_key(routing.id)],
+        args=[version or "", ROUTING_REDIS_TTL, *fields],
+    )
+
+
+def routing_to_hash(routing: UserRouting) -> dict:
+    return {
+        "is_active": int(routing.is_active),
+        "preferences": json.dumps(routing.preferences),
+        "email": routing.email or "",
+        "phone": routing.phone or "",
+    }
+
+
+def routing_from_hash(user_id: int, fields: dict) -> UserRouting:
+    return UserRouting(
+        id=user_id,
+        is_active=fields["is_active"] == "1",
+        preferences=json.loads(fields["preferences"]),
+        email=fields["email"] or None,
+        phone=fields["phone"] or None,
+    )
+
+
+ROUTING_COLUMNS = (
+    models.User.id, models.User.is_active, models.User.preferences, models.User.email, models.User.phone
+)
+
+
+def routing_from_row(row) -> UserRouting:
+    return UserRouting(
+        id=row.id,
+        is_active=bool(row.is_active),
+        preferences=row.preferences,
+        email=row.email,
+        phone=row.phone,
+    )
+
+
+async def get_user_routings(db, user_ids) -> dict:
+    """
+    Read-through lookup for the API: user id -> UserRouting for the users that
+    exist. Process LRU first, then one Redis pipeline, then one DB query.
+    """
+    found = {}
+    missing = []
+    for user_id in set(user_ids):
+        routing = routing_cache.get(user_id)
+        if routing is None:
+            missing.append(user_id)
+        else:
+            found[user_id] = routing
+    user_routing_cache_requests.labels(source="local").inc(len(found))
+    if not missing:
+        return found
+
+    redis_client = get_async_redis()
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id in missing:
+            pipe.hgetall(routing_key(user_id))
+            pipe.get(routing_version_key(user_id))
+        replies = await pipe.execute()
+        cached = list(zip(replies[::2], replies[1::2]))
+    except Exception as e:
+        logger.warning(f"Routing cache unavailable: {e}")
+        cached = [({}, None)] * len(missing)
+    from_db = {}
+    for user_id, (fields, version) in zip(missing, cached):
+        if fields:
+            found[user_id] = routing_from_hash(user_id, fields)
+            routing_cache.set(user_id, found[user_id])
+            user_routing_cache_requests.labels(source="redis").inc()
+        else:
+            from_db[user_id] = version
+    if not from_db:
+        return found
+
+    result = await db.execute(select(*ROUTING_COLUMNS).where(models.User.id.in_(from_db)))
+    loaded = [routing_from_row(row) for row in result]
+    user_routing_cache_requests.labels(source="db").inc(len(from_db))
+    try:
+        populated = await asyncio.gather(
+            *(populate_routing(redis_client, routing, from_db[routing.id]) for routing in loaded)
+        )
+    except Exception as e:
+        logger.warning(f"Failed to populate routing cache: {e}")
+        populated = [0] * len(loaded)
+    for routing, cached in zip(loaded, populated):
+        # A row read before a concurrent invalidation is used once, never cached
+        if cached:
+            routing_cache.set(routing.id, routing)
+        found[routing.id] = routing
+    return found
+
+
+async def get_user_routing(db, user_id: int):
+    """UserRouting for one user, or None if the user does not exist"""
+    return (await get_user_routings(db, [user_id])).get(user_id)
+
+
+def get_user_routing_sync(db, user_id: int):
+    """Same read-through lookup for worker code on a sync Session"""
+    routing = routing_cache.get(user_id)
+    if routing is not None:
+        user_routing_cache_requests.labels(source="local").inc()
+        return routing
+    redis_client = redis_pubsub.redis
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hgetall(routing_key(user_id))
+        pipe.get(routing_version_key(user_id))
+        fields, version = pipe.execute()
+    except Exception as e:
+        logger.warning(f"Routing cache unavailable: {e}")
+        fields, version = None, None
+    if fields:
+        routing = routing_from_hash(user_id, fields)
+        user_routing_cache_requests.labels(source="redis").inc()
+    else:
+        row = db.execute(select(*ROUTING_COLUMNS).where(models.User.id == user_id)).first()
+        user_routing_cache_requests.labels(source="db").inc()
+        if row is None:
+            return None
+        routing = routing_from_row(row)
+        try:
+            cached = populate_routing(redis_client, routing, version)
+        except Exception as e:
+            logger.warning(f"Failed to populate routing cache: {e}")
+            cached = 0
+        # A row read before a concurrent invalidation is used once, never cached
+        if not cached:
+            return routing
+    routing_cache.set(user_id, routing)
+    return routing
+
+
+async def claims_trusted(user_id: int, issued_at) -> bool:
+    """
+    True when no invalidation for the user happened after the token was
+    issued. False when that cannot be checked, so the caller loads the user.
+    """
+    if issued_at is None:
+        return False
+    try:
+        invalidated_at = await get_async_redis().get(invalidated_at_key(user_id))
+    except Exception as e:
+        logger.warning(f"Invalidation watermark unavailable: {e}")
+        return False
+    return invalidated_at is None or issued_at > float(invalidated_at)
+
+
+async def broadcast_user_invalidation(user_id: int):
+    """Invalidate a user locally, in Redis and in every other API and worker process"""
+    invalidate_user(user_id)
+    try:
+        redis_client = get_async_redis()
+        # Bump the version along with the delete, so a reader still holding
+        # the old row cannot put it back
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.incr(routing_version_key(user_id))
+        pipe.expire(routing_version_key(user_id), ROUTING_REDIS_TTL)
+        pipe.delete(routing_key(user_id))
+        pipe.set(invalidated_at_key(user_id), time.time(), ex=INVALIDATED_AT_TTL)
+        pipe.publish(USER_INVALIDATION_CHANNEL, str(user_id))
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to broadcast invalidation for user {user_id}: {e}")
+
+
+async def listen_for_invalidations():
+    """Background task: apply invalidations published by any replica"""
+    while True:
+        pubsub = get_async_redis().pubsub()
+        try:
+            await pubsub.subscribe(USER_INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    invalidate_user(int(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Entries may have gone stale while disconnected
+            principal_cache.clear()
+            routing_cache.clear()
+            logger.warning(f"User invalidation listener error: {e}, reconnecting")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+
+def _listen_for_invalidations_sync():
+    while True:
+        pubsub = redis_pubsub.redis.pubsub()
+        try:
+            pubsub.subscribe(USER_INVALIDATION_CHANNEL)
+            for message in pubsub.listen():
+                if message["type"] == "message":
+                    invalidate_user(int(message["data"]))
+        except Exception as e:
+            routing_cache.clear()
+            logger.warning(f"User invalidation listener error: {e}, reconnecting")
+            time.sleep(1)
+        finally:
+            pubsub.close()
+
+
+_listener_pid = None
+
+def ensure_invalidation_listener():
+    """Worker processes: apply invalidations from a daemon thread (once per process)"""
+    global _listener_pid
+    if _listener_pid != os.getpid():
+        _listener_pid = os.getpid()
+        threading.Thread(
+            target=_listen_for_invalidations_sync, name="user-invalidations", daemon=True
+        ).start()
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import logging
+from collections import defaultdict
+from fastapi import WebSocket
+from dotenv import load_dotenv
+from app.services.redis_pubsub import get_async_redis, USER_CHANNEL_PATTERN
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Messages buffered per socket before it is treated as a slow consumer and dropped
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", 100))
+# WebSocket close code 1013: "try again later"
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# WebSocket close code 1011: the server hit an unexpected condition
+SEND_FAILED_CLOSE_CODE = 1011
+
+
+class Subscriber:
+    """One connected socket with its own bounded send queue"""
+
+    def __init__(self, websocket: WebSocket, on_send_failed):
+        self.websocket = websocket
+        self.on_send_failed = on_send_failed
+        self.queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.sender = asyncio.create_task(self._send_loop())
+
+    async def _send_loop(self):
+        try:
+            while True:
+                data = await self.queue.get()
+                await self.websocket.send_text(data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A dead socket must not keep its place in the hub
+            logger.warning(f"WebSocket send failed, dropping the socket: {e}")
+            self.on_send_failed(self)
+            await self._close_socket(SEND_FAILED_CLOSE_CODE)
+
+    def offer(self, data: str) -> bool:
+        try:
+            self.queue.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def close(self, code: int):
+        self.sender.cancel()
+        await self._close_socket(code)
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+
+class NotificationHub:
+    """
+    Per-process fan-out of Redis notifications to WebSockets: a single pattern
+    subscription for all users instead of one Redis connection per socket.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._listener = None
+
+    def start(self):
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+        for subscribers in list(self._subscribers.values()):
+            for subscriber in list(subscribers):
+                subscriber.sender.cancel()
+        self._subscribers.clear()
+
+    def register(self, user_id: int, websocket: WebSocket) -> Subscriber:
+        subscriber = Subscriber(websocket, lambda subscriber: self._discard(user_id, subscriber))
+        self._subscribers[user_id].add(subscriber)
+        return subscriber
+
+    def unregister(self, user_id: int, subscriber: Subscriber):
+        subscriber.sender.cancel()
+        self._discard(user_id, subscriber)
+
+    def _discard(self, user_id: int, subscriber: Subscriber):
+        subscribers = self._subscribers.get(user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[user_id]
+
+    def deliver(self, user_id: int, data: str):
+        """Queue a message for every socket of the user, dropping slow consumers"""
+        for subscriber in list(self._subscribers.get(user_id, ())):
+            if not subscriber.offer(data):
+                logger.warning(f"Dropping slow WebSocket consumer for user {user_id}")
+                self.unregister(user_id, subscriber)
+                asyncio.create_task(subscriber.close(SLOW_CONSUMER_CLOSE_CODE))
+
+    async def _listen(self):
+        while True:
+            pubsub = get_async_redis().pubsub()
+            try:
+                await pubsub.psubscribe(USER_CHANNEL_PATTERN)
+                logger.info(f"WebSocket hub subscribed to {USER_CHANNEL_PATTERN}")
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    try:
+                        user_id = int(message["channel"].rsplit(":", 1)[1])
+                    except (IndexError, ValueError):
+                        # Anyone can publish on the pattern; one bad channel must not stop the hub
+                        logger.warning(f"Ignoring message on malformed channel {message['channel']!r}")
+                        continue
+                    self.deliver(user_id, message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"WebSocket hub listener error: {e}, reconnecting")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+# Global instance, started from the app lifespan
+notification_hub = NotificationHub()
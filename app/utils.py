@@ -1,6 +1,49 @@
 from passlib.context import CryptContext
-pwd_context=CryptContext(schemes=["bcrypt"],deprecated="auto")
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# bcrypt work factor; hashes with any other cost are upgraded on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Threads doing bcrypt work, plus how many more jobs may wait before we shed load
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", os.cpu_count() or 2))
+HASH_QUEUE_DEPTH = int(os.getenv("HASH_QUEUE_DEPTH", 32))
+
+pwd_context=CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+
+# bcrypt releases the GIL, so a thread pool keeps it off the event loop
+_hash_pool = ThreadPoolExecutor(max_workers=HASH_POOL_SIZE, thread_name_prefix="bcrypt")
+_hash_slots = threading.BoundedSemaphore(HASH_POOL_SIZE + HASH_QUEUE_DEPTH)
+
+class HashingPoolSaturated(Exception):
+    """Raised when the hashing pool already holds HASH_POOL_SIZE + HASH_QUEUE_DEPTH jobs"""
+
 def hash(password:str):
     return pwd_context.hash(password)
 def verify(plain_password,hashed_password):
-    return pwd_context.verify(plain_password,hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password,hashed_password)
+
+async def _run_in_hash_pool(fn, *args):
+    if not _hash_slots.acquire(blocking=False):
+        raise HashingPoolSaturated()
+    future = _hash_pool.submit(fn, *args)
+    # Free the slot when the thread finishes, even if the caller went away
+    future.add_done_callback(lambda _: _hash_slots.release())
+    return await asyncio.wrap_future(future)
+
+async def hash_async(password:str):
+    return await _run_in_hash_pool(pwd_context.hash, password)
+
+async def verify_and_update_async(plain_password,hashed_password):
+    """Verify a password; also returns a new hash when the stored cost is outdated"""
+    return await _run_in_hash_pool(pwd_context.verify_and_update, plain_password, hashed_password)
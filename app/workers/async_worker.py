@@ -0,0 +1,361 @@
+"""
+Asyncio delivery engine for the I/O-bound channel queues.
+
+Run with: python -m app.workers.async_worker [queue ...]   (default: all channel queues)
+
+Consumes the same Redis queues as the Celery channel workers (deliver_<channel>
+messages) but keeps hundreds of sends in flight per process, bounded by a
+semaphore per channel. Delivery state goes through the same helpers as the
+Celery tasks, so notifications see identical status transitions.
+"""
+from app.celery_app import REDIS_URL, CHANNEL_QUEUES
+from app.database import get_worker_session
+from app import models
+from app.services import email_service, sms_service, reliable_queue
+from app.services.templates import notification_content
+from app.services.user_cache import ensure_invalidation_listener
+from app.services.backoff import decorrelated_jitter
+from app.services.digest import wants_digest, buffer_notification
+from app.services.circuit_breaker import AsyncCircuitBreaker, CircuitOpenError, ProviderError, BREAKER_PROVIDERS
+from app.services.metrics import notifications_sent, notification_duration, start_metrics_exporter
+from app.workers.notification_tasks import (
+    CHANNEL_TASKS,
+    claim_delivery,
+    release_delivery,
+    load_delivery_context,
+    mark_delivery,
+    format_email_body,
+    format_sms_body,
+    in_app_payload,
+)
+from datetime import datetime, timezone
+import aiosmtplib
+import asyncio
+import base64
+import httpx
+import json
+import os
+import random
+import sys
+import time
+import logging
+import redis.asyncio as aioredis
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Sends in flight per channel in this process
+CHANNEL_CONCURRENCY = {
+    "email": int(os.getenv("ASYNC_EMAIL_CONCURRENCY", 50)),
+    "sms": int(os.getenv("ASYNC_SMS_CONCURRENCY", 50)),
+    "push": int(os.getenv("ASYNC_PUSH_CONCURRENCY", 100)),
+    "in_app": int(os.getenv("ASYNC_IN_APP_CONCURRENCY", 200)),
+}
+# kombu pushes on the left and pops on the right
+QUEUE_HEAD = "RIGHT"
+# Wait before handing back a message whose delivery could not be recorded
+REQUEUE_DELAY_SECONDS = float(os.getenv("ASYNC_REQUEUE_DELAY_SECONDS", 1))
+
+
+def decode_task_message(raw: str):
+    """(task name, args, kwargs, headers) from a Celery protocol 2 message stored by kombu"""
+    envelope = json.loads(raw)
+    body = envelope["body"]
+    if envelope.get("properties", {}).get("body_encoding") == "base64":
+        body = base64.b64decode(body)
+    args, kwargs, _ = json.loads(body)
+    return envelope["headers"]["task"], args, kwargs, envelope["headers"]
+
+
+def is_provider_failure(exc: Exception) -> bool:
+    """Whether the SMTP server or Twilio, not the message, is at fault"""
+    # aiosmtplib's connection errors and timeouts are OSErrors
+    if isinstance(exc, (OSError, asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    if isinstance(exc, aiosmtplib.SMTPResponseException):
+        return 400 <= exc.code < 500
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return False
+
+
+class AsyncSMTPPool:
+    """Authenticated aiosmtplib sessions shared by the email sends of this process"""
+
+    def __init__(self, size: int):
+        self._idle = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(None)
+
+    async def _connect(self):
+        client = aiosmtplib.SMTP(
+            hostname=email_service.SMTP_SERVER,
+            port=email_service.SMTP_PORT,
+            timeout=email_service.SMTP_TIMEOUT,
+            start_tls=email_service.SMTP_STARTTLS,
+        )
+        await client.connect()
+        if email_service.SMTP_PASSWORD:
+            await client.login(email_service.SMTP_EMAIL, email_service.SMTP_PASSWORD)
+        return client
+
+    async def send(self, message):
+        client = await self._idle.get()
+        try:
+            if client is None or not client.is_connected:
+                client = await self._connect()
+            await client.send_message(message)
+        except Exception:
+            # Drop the session; the next send reconnects
+            if client is not None:
+                client.close()
+            client = None
+            raise
+        finally:
+            self._idle.put_nowait(client)
+
+
+class AsyncDeliveryWorker:
+    def __init__(self, queues):
+        self.queues = queues
+        # Messages being worked on are parked in this worker's own processing
+        # list so a crash does not lose them (app.services.reliable_queue)
+        self.consumer = reliable_queue.consumer_id()
+        self.semaphores = {channel: asyncio.Semaphore(CHANNEL_CONCURRENCY[channel]) for channel in queues}
+        self.redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+        self.http = httpx.AsyncClient(
+            base_url=sms_service.TWILIO_API_BASE,
+            auth=(sms_service.TWILIO_ACCOUNT_SID or "", sms_service.TWILIO_AUTH_TOKEN or ""),
+            timeout=httpx.Timeout(sms_service.TWILIO_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=sms_service.TWILIO_POOL_SIZE,
+                max_keepalive_connections=sms_service.TWILIO_POOL_SIZE,
+            ),
+        )
+        self.smtp = AsyncSMTPPool(CHANNEL_CONCURRENCY["email"])
+        # Same Redis-held breakers as the Celery channel workers
+        self.breakers = {provider: AsyncCircuitBreaker(provider, self.redis) for provider in BREAKER_PROVIDERS}
+
+    def processing_key(self, queue: str) -> str:
+        return reliable_queue.processing_key(queue, self.consumer)
+
+    async def keep_lease(self):
+        """Renew this worker's lease, requeueing what stopped workers left unfinished"""
+        while True:
+            for queue in self.queues:
+                try:
+                    requeued = await reliable_queue.renew_lease(self.redis, queue, self.consumer, QUEUE_HEAD)
+                    if requeued:
+                        logger.warning(f"Requeued {requeued} messages on {queue} left by a stopped worker")
+                except Exception as e:
+                    logger.error(f"Failed to renew lease on {queue}: {e}")
+            await asyncio.sleep(reliable_queue.CONSUMER_RENEW_SECONDS)
+
+    async def consume(self, queue: str):
+        semaphore = self.semaphores[queue]
+        logger.info(f"Consuming {queue} with up to {CHANNEL_CONCURRENCY[queue]} sends in flight")
+        while True:
+            await semaphore.acquire()
+            try:
+                raw = await self.redis.blmove(
+                    queue, self.processing_key(queue), 1, QUEUE_HEAD, reliable_queue.tail(QUEUE_HEAD)
+                )
+            except Exception as e:
+                semaphore.release()
+                logger.error(f"Failed to read {queue}: {e}")
+                await asyncio.sleep(1)
+                continue
+            if raw is None:
+                semaphore.release()
+                continue
+            asyncio.create_task(self.handle(queue, raw))
+
+    async def handle(self, queue: str, raw: str):
+        """
+        Deliver one message. It leaves the processing list once the delivery is
+        sent or has finally failed; when that outcome could not be recorded
+        (e.g. the database is down) it goes back onto the queue instead.
+        """
+        try:
+            try:
+                task_name, args, kwargs, headers = decode_task_message(raw)
+            except Exception as e:
+                logger.error(f"Discarding undecodable message on {queue}: {e}")
+                await self.acknowledge(queue, raw)
+                return
+            task = CHANNEL_TASKS.get(queue)
+            if task is None or task.name != task_name:
+                logger.error(f"Discarding unexpected task {task_name} on {queue}")
+                await self.acknowledge(queue, raw)
+                return
+            eta = headers.get("eta")
+            if eta:
+                delay = (datetime.fromisoformat(eta) - datetime.now(timezone.utc)).total_seconds()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            try:
+                await self.deliver(
+                    args[0], queue, headers.get("retries") or 0, task.max_retries,
+                    kwargs.get("prev_backoff"), kwargs.get("digest", True),
+                )
+            except Exception as e:
+                logger.error(f"Failed to handle message on {queue}, requeueing it: {e}")
+                await asyncio.sleep(REQUEUE_DELAY_SECONDS)
+                await self.requeue(queue, raw)
+                return
+            await self.acknowledge(queue, raw)
+        except Exception as e:
+            # Left in the processing list; requeued once this worker stops and its lease runs out
+            logger.error(f"Failed to acknowledge message on {queue}: {e}")
+        finally:
+            self.semaphores[queue].release()
+
+    async def acknowledge(self, queue: str, raw: str):
+        await self.redis.lrem(self.processing_key(queue), 1, raw)
+
+    async def requeue(self, queue: str, raw: str):
+        """Move one message from the processing list to the back of the queue"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key(queue), 1, raw)
+            pipe.lpush(queue, raw)
+            await pipe.execute()
+
+    async def deliver(self, notification_id: str, channel: str, retries: int, max_retries: int,
+                      backoff: float = None, digest: bool = True):
+        """Same transitions as deliver_channel: sent, or retrying with backoff, then failed"""
+        breaker = self.breakers.get(channel)
+        while True:
+            context = await asyncio.to_thread(self.load, notification_id, channel)
+            if context is None:
+                return
+            if digest and wants_digest(context["preferences"], channel):
+                await buffer_notification(self.redis, channel, context["user_id"], notification_id)
+                await asyncio.to_thread(self.release, notification_id, channel)
+                logger.info(f"Buffered {notification_id} for the {channel} digest of user {context['user_id']}")
+                return
+            channel_start = time.time()
+            try:
+                if breaker is not None:
+                    await breaker.allow()
+                try:
+                    await self.send(channel, notification_id, context)
+                except ProviderError:
+                    if breaker is not None:
+                        await breaker.record_failure()
+                    raise
+                if breaker is not None:
+                    await breaker.record_success()
+                notifications_sent.labels(channel=channel, status="success").inc()
+                notification_duration.labels(channel=channel).observe(time.time() - channel_start)
+                await asyncio.to_thread(self.record, notification_id, channel, models.NotificationStatus.SENT)
+                logger.info(f"Notification {notification_id} sent via {channel}")
+                return
+            except CircuitOpenError as exc:
+                # No send and no attempt spent while the provider is down
+                await asyncio.to_thread(self.release, notification_id, channel)
+                await asyncio.sleep(exc.retry_after + random.uniform(0, max(exc.retry_after, 1)))
+                continue
+            except Exception as exc:
+                notifications_sent.labels(channel=channel, status="failed").inc()
+                logger.warning(f"Failed to send {notification_id} via {channel}: {str(exc)}")
+                if retries >= max_retries:
+                    await asyncio.to_thread(
+                        self.record, notification_id, channel, models.NotificationStatus.FAILED,
+                        str(exc), type(exc).__name__
+                    )
+                    logger.error(f"Notification {notification_id} failed via {channel} after retries")
+                    return
+                await asyncio.to_thread(self.record, notification_id, channel, models.NotificationStatus.RETRYING, str(exc))
+                backoff = decorrelated_jitter(backoff)
+                await asyncio.sleep(backoff)
+                retries += 1
+
+    @staticmethod
+    def load(notification_id: str, channel: str):
+        # Runs in the default executor; each of its threads keeps its own session
+        db = get_worker_session()
+        if not claim_delivery(db, notification_id, channel):
+            logger.info(f"Delivery of {notification_id} via {channel} is done or being sent elsewhere")
+            return None
+        try:
+            context = load_delivery_context(db, notification_id, channel)
+            if context is None:
+                return None
+            title, message = notification_content(db, context)
+        except Exception:
+            # Give it back so the requeued message can claim it again
+            db.rollback()
+            release_delivery(db, notification_id, channel)
+            raise
+        return {
+            "user_id": context.user_id,
+            "title": title,
+            "message": message,
+            "email": context.email,
+            "phone": context.phone,
+            "preferences": context.preferences,
+        }
+
+    @staticmethod
+    def release(notification_id: str, channel: str):
+        db = get_worker_session()
+        try:
+            release_delivery(db, notification_id, channel)
+        except Exception:
+            db.rollback()
+            raise
+
+    @staticmethod
+    def record(notification_id: str, channel: str, status, error: str = None, error_class: str = None):
+        db = get_worker_session()
+        try:
+            mark_delivery(db, notification_id, channel, status, error, error_class)
+        except Exception:
+            db.rollback()
+            raise
+
+    async def send(self, channel: str, notification_id: str, context: dict):
+        """Hand one message to the channel's provider; ProviderError if the provider failed"""
+        try:
+            await self._send(channel, notification_id, context)
+        except Exception as exc:
+            if channel in BREAKER_PROVIDERS and is_provider_failure(exc):
+                raise ProviderError(f"{channel} provider unavailable: {str(exc)}") from exc
+            raise
+
+    async def _send(self, channel: str, notification_id: str, context: dict):
+        title, message = context["title"], context["message"]
+        if channel == "email":
+            await self.smtp.send(email_service.build_message(
+                context["email"], title, format_email_body(title, message)
+            ))
+        elif channel == "sms":
+            # Same per-process pacing as the threaded senders
+            await asyncio.sleep(sms_service.sms_rate_limiter.reserve())
+            response = await self.http.post(
+                f"/2010-04-01/Accounts/{sms_service.TWILIO_ACCOUNT_SID}/Messages.json",
+                data={"To": context["phone"], "From": sms_service.TWILIO_PHONE_NUMBER,
+                      "Body": format_sms_body(title, message)},
+            )
+            response.raise_for_status()
+        elif channel == "push":
+            logger.info(f"[PUSH] To user {context['user_id']}: {title}")
+        elif channel == "in_app":
+            await self.redis.publish(
+                f"notifications:user:{context['user_id']}",
+                json.dumps(in_app_payload(notification_id, title, message))
+            )
+
+    async def run(self):
+        await asyncio.gather(self.keep_lease(), *(self.consume(queue) for queue in self.queues))
+
+
+def main():
+    queues = sys.argv[1:] or list(CHANNEL_QUEUES)
+    start_metrics_exporter()
+    ensure_invalidation_listener()
+    asyncio.run(AsyncDeliveryWorker(queues).run())
+
+
+if __name__ == "__main__":
+    main()
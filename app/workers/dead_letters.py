@@ -0,0 +1,213 @@
+"""
+Replay of dead letters: deliveries that exhausted their retries.
+
+Started from POST /admin/dead-letters/replay, or by hand:
+    python -m app.workers.dead_letters summary
+    python -m app.workers.dead_letters list --channel sms --since 2026-10-01T00:00
+    python -m app.workers.dead_letters replay --channel sms --error-class TwilioRestException --rate 50
+
+A replay works in steps. Each step claims up to REPLAY_BATCH_SIZE matching
+dead letters with FOR UPDATE SKIP LOCKED, resets their deliveries to pending,
+publishes one channel task per delivery and deletes the dead letters in the
+same transaction, then waits long enough to hold the requested rate. Steps
+are skipped while a target channel queue is deeper than REPLAY_MAX_QUEUE_DEPTH,
+so a replay never buries live traffic; the channel tasks keep their own rate
+limits towards the providers. Concurrent replays do not claim the same rows.
+"""
+from app.celery_app import app, CHANNEL_QUEUES
+from app.database import SessionLocal
+from app import models
+from app.services.dead_letters import (
+    dead_letter_filters,
+    REPLAY_RATE,
+    REPLAY_BATCH_SIZE,
+    REPLAY_MAX_QUEUE_DEPTH,
+)
+from app.services.backoff import decorrelated_jitter
+from app.services.metrics import dead_letters_replayed
+from app.workers.notification_tasks import CHANNEL_TASKS, get_redis
+from sqlalchemy import delete, func, select, tuple_, update
+from datetime import datetime
+import argparse
+import json
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Wait before checking again when a channel queue is over REPLAY_MAX_QUEUE_DEPTH
+REPLAY_BACKOFF_SECONDS = 5
+
+
+def replay_batch(db, filters: list, limit: int) -> list:
+    """Hand one batch of matching dead letters back to the channel queues; returns (notification_id, channel) pairs"""
+    claimed = db.execute(
+        delete(models.DeadLetter)
+        .where(tuple_(models.DeadLetter.notification_id, models.DeadLetter.channel).in_(
+            select(models.DeadLetter.notification_id, models.DeadLetter.channel)
+            .where(*filters)
+            .order_by(models.DeadLetter.failed_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ))
+        .returning(models.DeadLetter.notification_id, models.DeadLetter.channel)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not claimed:
+        db.rollback()
+        return []
+    deliveries = [(row.notification_id, row.channel) for row in claimed]
+
+    db.execute(
+        update(models.NotificationDelivery)
+        .where(tuple_(models.NotificationDelivery.notification_id, models.NotificationDelivery.channel).in_(deliveries))
+        .values(status=models.NotificationStatus.PENDING.value, attempts=0, last_error=None)
+        .execution_options(synchronize_session=False)
+    )
+    # Failed is terminal for refresh_notification_statuses; reopen the notification
+    db.execute(
+        update(models.Notification)
+        .where(
+            models.Notification.id.in_({notification_id for notification_id, _ in deliveries}),
+            models.Notification.status == models.NotificationStatus.FAILED,
+        )
+        .values(status=models.NotificationStatus.PENDING)
+        .execution_options(synchronize_session=False)
+    )
+
+    # Published before the commit, like the outbox relay: the row locks make
+    # a fast task's status update wait for the reset above, and a failed
+    # commit keeps the dead letters for the next replay
+    with app.producer_or_acquire() as producer:
+        for notification_id, channel in deliveries:
+            CHANNEL_TASKS[channel].apply_async(args=[notification_id], producer=producer)
+    db.commit()
+
+    for _, channel in deliveries:
+        dead_letters_replayed.labels(channel=channel).inc()
+    return deliveries
+
+
+def replay_step(channel=None, error_class=None, since=None, until=None, rate=None):
+    """
+    Run one throttled step of a replay. Returns (replayed, delay): the number
+    of dead letters handed back and the seconds to wait before the next step,
+    or None once nothing matching is left.
+    """
+    rate = rate or REPLAY_RATE
+    queues = [channel] if channel else list(CHANNEL_QUEUES)
+    depth = max(get_redis().llen(queue) for queue in queues)
+    if depth > REPLAY_MAX_QUEUE_DEPTH:
+        logger.info(f"Replay paused: {depth} messages queued (limit {REPLAY_MAX_QUEUE_DEPTH})")
+        return 0, REPLAY_BACKOFF_SECONDS
+
+    limit = max(1, min(REPLAY_BATCH_SIZE, int(rate)))
+    filters = dead_letter_filters(
+        channel,
+        error_class,
+        datetime.fromisoformat(since) if since else None,
+        datetime.fromisoformat(until) if until else None,
+    )
+    db = SessionLocal()
+    try:
+        deliveries = replay_batch(db, filters, limit)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    if len(deliveries) < limit:
+        return len(deliveries), None
+    return len(deliveries), len(deliveries) / rate
+
+
+@app.task(bind=True, max_retries=5)
+def replay_dead_letters(self, channel=None, error_class=None, since=None, until=None, rate=None, prev_backoff: float = None):
+    """Replay one step, then schedule the next; since/until are ISO 8601 strings"""
+    step = dict(channel=channel, error_class=error_class, since=since, until=until, rate=rate)
+    try:
+        replayed, delay = replay_step(**step)
+    except Exception as exc:
+        backoff = decorrelated_jitter(prev_backoff)
+        logger.error(f"Dead letter replay step failed, retrying in {backoff:.1f}s: {str(exc)}")
+        raise self.retry(exc=exc, countdown=backoff, kwargs={**step, "prev_backoff": backoff})
+    if replayed:
+        logger.info(f"Replayed {replayed} dead letters")
+    if delay is not None:
+        replay_dead_letters.apply_async(kwargs=step, countdown=delay)
+    return replayed
+
+
+def list_dead_letters(db, filters: list, limit: int):
+    return db.query(models.DeadLetter).filter(*filters).order_by(
+        models.DeadLetter.failed_at.desc()
+    ).limit(limit).all()
+
+
+def summarize_dead_letters(db, filters: list):
+    """Count, oldest and newest failure per channel and error class"""
+    return db.execute(
+        select(
+            models.DeadLetter.channel,
+            models.DeadLetter.error_class,
+            func.count().label("count"),
+            func.min(models.DeadLetter.failed_at).label("oldest"),
+            func.max(models.DeadLetter.failed_at).label("newest"),
+        )
+        .where(*filters)
+        .group_by(models.DeadLetter.channel, models.DeadLetter.error_class)
+        .order_by(func.count().desc())
+    ).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.workers.dead_letters")
+    parser.add_argument("command", choices=["summary", "list", "replay"])
+    parser.add_argument("--channel", choices=CHANNEL_QUEUES)
+    parser.add_argument("--error-class")
+    parser.add_argument("--since", help="ISO 8601, inclusive (naive means UTC)")
+    parser.add_argument("--until", help="ISO 8601, exclusive (naive means UTC)")
+    parser.add_argument("--limit", type=int, default=100, help="rows shown by list")
+    parser.add_argument("--rate", type=float, default=REPLAY_RATE, help="dead letters replayed per second")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        # Runs the same throttled steps as the Celery task, in the foreground
+        total = 0
+        while True:
+            replayed, delay = replay_step(args.channel, args.error_class, args.since, args.until, args.rate)
+            total += replayed
+            if delay is None:
+                break
+            time.sleep(delay)
+        print(f"Replayed {total} dead letters")
+        return
+
+    filters = dead_letter_filters(
+        args.channel,
+        args.error_class,
+        datetime.fromisoformat(args.since) if args.since else None,
+        datetime.fromisoformat(args.until) if args.until else None,
+    )
+    db = SessionLocal()
+    try:
+        if args.command == "summary":
+            for row in summarize_dead_letters(db, filters):
+                print(f"{row.channel}\t{row.error_class}\t{row.count}\t{row.oldest}\t{row.newest}")
+        else:
+            for dead_letter in list_dead_letters(db, filters, args.limit):
+                print(json.dumps({
+                    "notification_id": dead_letter.notification_id,
+                    "channel": dead_letter.channel,
+                    "error_class": dead_letter.error_class,
+                    "error": dead_letter.error,
+                    "attempts": dead_letter.attempts,
+                    "failed_at": dead_letter.failed_at.isoformat(),
+                }))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
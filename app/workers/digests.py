@@ -0,0 +1,192 @@
+"""
+Digest flusher: sends each user's buffered notifications as one message.
+
+Run by Celery beat (see beat_schedule in app.celery_app), or once by hand:
+    python -m app.workers.digests
+
+For users with {"digest": true} in their preferences, the channel tasks do
+not send email/SMS themselves (see DIGEST_CHANNELS): they add the
+notification to a Redis sorted set per user and channel, and the buffer's
+first arrival schedules its flush DIGEST_WINDOW_SECONDS later. Each flush
+takes up to DIGEST_MAX_ITEMS notifications, sends them as one message and
+marks their deliveries sent with via_digest set.
+
+Due buffers are leased rather than popped: a flusher that dies mid-flush
+leaves the buffer in place and its lease runs out, so another flusher
+sends it. If the digest cannot be sent, its notifications are handed back
+to the channel tasks to be sent one by one with the usual retries.
+"""
+from app.celery_app import app
+from app.database import get_worker_session
+from app import models
+from app.services.circuit_breaker import circuit_breakers, CircuitOpenError, ProviderError
+from app.services.digest import (
+    DIGEST_DUE_KEY,
+    DIGEST_MAX_ITEMS,
+    DIGEST_WINDOW_SECONDS,
+    digest_key,
+    format_digest,
+    parse_digest_member,
+)
+from app.services.metrics import digests_sent, digested_notifications, notifications_sent
+from app.services.templates import notification_content
+from app.services.user_cache import get_user_routing_sync
+from app.workers.notification_tasks import (
+    CHANNEL_TASKS,
+    get_redis,
+    mark_deliveries,
+    send_channel,
+)
+from sqlalchemy import select
+from types import SimpleNamespace
+import os
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Due buffers claimed per round trip
+DIGEST_FLUSH_BATCH_SIZE = int(os.getenv("DIGEST_FLUSH_BATCH_SIZE", 500))
+# A claimed buffer not finished within this long is claimed again
+DIGEST_LEASE_SECONDS = float(os.getenv("DIGEST_LEASE_SECONDS", 120))
+
+# Lease due buffers by pushing their score past the lease; ARGV: now, limit, lease end
+CLAIM_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, member in ipairs(due) do
+    redis.call('ZADD', KEYS[1], ARGV[3], member)
+end
+return due
+"""
+
+# Drop flushed ids from the buffer, then release the lease: forget the buffer
+# if it is empty, otherwise flush the rest a window from now.
+# KEYS: buffer, due index. ARGV: member, next flush, ids...
+FINISH_SCRIPT = """
+if #ARGV > 2 then
+    redis.call('ZREM', KEYS[1], unpack(ARGV, 3))
+end
+if redis.call('ZCARD', KEYS[1]) == 0 then
+    redis.call('ZREM', KEYS[2], ARGV[1])
+else
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+end
+return 1
+"""
+
+
+def finish(redis_client, member: str, key: str, notification_ids: list):
+    redis_client.register_script(FINISH_SCRIPT)(
+        keys=[key, DIGEST_DUE_KEY],
+        args=[member, time.time() + DIGEST_WINDOW_SECONDS, *notification_ids],
+    )
+
+
+def pending_digest_rows(db, channel: str, notification_ids: list):
+    """The buffered notifications still waiting on this channel, oldest first"""
+    return db.execute(
+        select(
+            models.Notification.id,
+            models.Notification.user_id,
+            models.Notification.title,
+            models.Notification.message,
+            models.Notification.template_id,
+            models.Notification.template_version,
+            models.Notification.variables,
+        )
+        .select_from(models.NotificationDelivery)
+        .join(models.Notification, models.Notification.id == models.NotificationDelivery.notification_id)
+        .where(
+            models.NotificationDelivery.notification_id.in_(notification_ids),
+            models.NotificationDelivery.channel == channel,
+            models.NotificationDelivery.status != models.NotificationStatus.SENT.value,
+        )
+        .order_by(models.Notification.created_at, models.Notification.id)
+    ).all()
+
+
+def flush_digest(db, redis_client, member: str) -> int:
+    """Send one leased buffer; returns the number of notifications it delivered"""
+    channel, user_id = parse_digest_member(member)
+    key = digest_key(channel, user_id)
+    notification_ids = redis_client.zrange(key, 0, DIGEST_MAX_ITEMS - 1)
+    rows = pending_digest_rows(db, channel, notification_ids) if notification_ids else []
+    if not rows:
+        # Already sent, e.g. by an earlier flush that died before finishing
+        finish(redis_client, member, key, notification_ids)
+        return 0
+
+    contents = [notification_content(db, row) for row in rows]
+    # A lone notification goes out as it is
+    title, message = contents[0] if len(rows) == 1 else format_digest(contents)
+    user = get_user_routing_sync(db, user_id)
+    context = SimpleNamespace(
+        id=rows[-1].id,
+        user_id=user_id,
+        email=user.email if user else None,
+        phone=user.phone if user else None,
+    )
+
+    breaker = circuit_breakers.get(channel)
+    try:
+        if breaker is not None:
+            breaker.allow()
+        send_channel(channel, context, title, message)
+    except CircuitOpenError as exc:
+        # Keep the buffer; try again once the breaker may let sends through
+        redis_client.zadd(DIGEST_DUE_KEY, {member: time.time() + exc.retry_after})
+        logger.info(f"Deferring {channel} digest of user {user_id}: {exc}")
+        return 0
+    except Exception as exc:
+        if breaker is not None and isinstance(exc, ProviderError):
+            breaker.record_failure()
+        notifications_sent.labels(channel=channel, status="failed").inc()
+        logger.warning(f"Failed to send {channel} digest of user {user_id}, sending one by one: {str(exc)}")
+        with app.producer_or_acquire() as producer:
+            for row in rows:
+                CHANNEL_TASKS[channel].apply_async(args=[row.id], kwargs={"digest": False}, producer=producer)
+        finish(redis_client, member, key, notification_ids)
+        return 0
+    if breaker is not None:
+        breaker.record_success()
+
+    mark_deliveries(db, [row.id for row in rows], channel, models.NotificationStatus.SENT, via_digest=True)
+    finish(redis_client, member, key, notification_ids)
+
+    digests_sent.labels(channel=channel).inc()
+    digested_notifications.labels(channel=channel).inc(len(rows))
+    notifications_sent.labels(channel=channel, status="success").inc(len(rows))
+    logger.info(f"Sent {len(rows)} notifications to user {user_id} as one {channel} digest")
+    return len(rows)
+
+
+@app.task
+def flush_digests():
+    """Flush every buffer whose window has closed"""
+    redis_client = get_redis()
+    claim_due = redis_client.register_script(CLAIM_DUE_SCRIPT)
+    db = get_worker_session()
+    flushed = 0
+    while True:
+        now = time.time()
+        members = claim_due(
+            keys=[DIGEST_DUE_KEY], args=[now, DIGEST_FLUSH_BATCH_SIZE, now + DIGEST_LEASE_SECONDS]
+        )
+        for member in members:
+            try:
+                flushed += flush_digest(db, redis_client, member)
+            except Exception as e:
+                # The lease runs out and the buffer is flushed again
+                db.rollback()
+                logger.error(f"Flushing digest {member} failed: {str(e)}")
+        if len(members) < DIGEST_FLUSH_BATCH_SIZE:
+            return flushed
+
+
+def main():
+    logger.info(f"Flushed {flush_digests()} digested notifications")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Micro-batching consumer for email-only notifications.
+
+Run with: python -m app.workers.email_batcher
+
+Notification ids buffered by enqueue_notifications (EMAIL_BATCH_MODE=true)
+are collected until EMAIL_BATCH_SIZE ids arrive or EMAIL_BATCH_LINGER_MS
+passes, sent over one SMTP session and their email deliveries marked sent
+with a single UPDATE. Messages that fail are handed to send_notification so
+they retry one by one, as is the whole batch while the email circuit breaker
+is open.
+
+A batch is moved into this process's processing list rather than popped and
+removed from it once handled, so a batcher that crashes mid-batch does not
+lose it: another batcher hands it back to the queue once this one's lease
+runs out (app.services.reliable_queue). Deliveries already sent are skipped
+when it comes round again.
+"""
+from app.database import SessionLocal
+from app import models
+from app.services import reliable_queue
+from app.services.email_service import send_many
+from app.services.templates import notification_content
+from app.services.circuit_breaker import circuit_breakers, CircuitOpenError, ProviderError
+from app.services.digest import wants_digest
+from app.services.user_cache import get_user_routing_sync, ensure_invalidation_listener
+from app.services.metrics import notifications_sent, notification_duration, start_metrics_exporter
+from app.workers.notification_tasks import (
+    send_notification,
+    get_redis,
+    create_deliveries,
+    claim_deliveries,
+    release_deliveries,
+    mark_deliveries,
+    format_email_body,
+    EMAIL_BATCH_QUEUE,
+)
+from sqlalchemy import select
+import os
+import time
+import threading
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 500))
+EMAIL_BATCH_LINGER_MS = int(os.getenv("EMAIL_BATCH_LINGER_MS", 200))
+# Batches being worked on are parked in this process's processing list
+BATCHER_ID = reliable_queue.consumer_id()
+
+
+def collect_batch(redis_client, consumer: str = BATCHER_ID) -> list:
+    """Block for the first id, then fill the batch until it is full or the linger time expires"""
+    processing = reliable_queue.processing_key(EMAIL_BATCH_QUEUE, consumer)
+    first = redis_client.blmove(EMAIL_BATCH_QUEUE, processing, 1, "LEFT", "RIGHT")
+    if first is None:
+        return []
+    batch = [first]
+    deadline = time.monotonic() + EMAIL_BATCH_LINGER_MS / 1000
+
+    while len(batch) < EMAIL_BATCH_SIZE:
+        # Move whatever is already queued in one round trip
+        items = reliable_queue.claim(redis_client, EMAIL_BATCH_QUEUE, consumer, EMAIL_BATCH_SIZE - len(batch))
+        if items:
+            batch.extend(items)
+            continue
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        item = redis_client.blmove(EMAIL_BATCH_QUEUE, processing, remaining, "LEFT", "RIGHT")
+        if item is None:
+            break
+        batch.append(item)
+    return batch
+
+
+def acknowledge(redis_client, batch: list, consumer: str = BATCHER_ID):
+    """Drop a handled batch from the processing list"""
+    processing = reliable_queue.processing_key(EMAIL_BATCH_QUEUE, consumer)
+    pipe = redis_client.pipeline(transaction=False)
+    for notification_id in batch:
+        pipe.lrem(processing, 1, notification_id)
+    pipe.execute()
+
+
+def keep_lease(redis_client, consumer: str = BATCHER_ID):
+    """Renew this batcher's lease until the process exits, requeueing dead batchers' batches"""
+    while True:
+        try:
+            requeued = reliable_queue.renew_lease(redis_client, EMAIL_BATCH_QUEUE, consumer)
+            if requeued:
+                logger.warning(f"Requeued {requeued} emails left unfinished by a stopped batcher")
+        except Exception as e:
+            logger.error(f"Failed to renew email batcher lease: {e}")
+        time.sleep(reliable_queue.CONSUMER_RENEW_SECONDS)
+
+
+def retry_individually(notification_ids: list):
+    for notification_id in notification_ids:
+        send_notification.apply_async(args=[notification_id], countdown=1)
+
+
+def process_batch(notification_ids: list):
+    """Send one batch over a single SMTP session and bulk-update its statuses"""
+    breaker = circuit_breakers["email"]
+    try:
+        breaker.allow()
+    except CircuitOpenError as exc:
+        # The channel tasks defer them until the breaker lets sends through
+        logger.info(f"Handing back email batch of {len(notification_ids)}: {exc}")
+        retry_individually(notification_ids)
+        return
+    db = SessionLocal()
+    start_time = time.time()
+    claimed = []
+    try:
+        # Same delivery rows as the channel tasks, so statuses move the same
+        # way, and claimed like theirs so no delivery is sent by both
+        create_deliveries(db, notification_ids)
+        claimed = claim_deliveries(db, notification_ids, "email")
+        rows = db.execute(
+            select(
+                models.Notification.id,
+                models.Notification.title,
+                models.Notification.message,
+                models.Notification.template_id,
+                models.Notification.template_version,
+                models.Notification.variables,
+                models.Notification.user_id,
+            )
+            .select_from(models.NotificationDelivery)
+            .join(models.Notification, models.Notification.id == models.NotificationDelivery.notification_id)
+            .where(
+                models.NotificationDelivery.notification_id.in_(claimed),
+                models.NotificationDelivery.channel == "email",
+            )
+        ).all()
+
+        # Recipients come from the routing cache instead of a join on users
+        recipients = [get_user_routing_sync(db, row.user_id) for row in rows]
+        # Users in digest mode get theirs through the channel task, which buffers it
+        in_digest = [bool(user and wants_digest(user.preferences, "email")) for user in recipients]
+        if any(in_digest):
+            digest_ids = [row.id for row, digest in zip(rows, in_digest) if digest]
+            release_deliveries(db, digest_ids, "email")
+            retry_individually(digest_ids)
+            rows = [row for row, digest in zip(rows, in_digest) if not digest]
+            recipients = [user for user, digest in zip(recipients, in_digest) if not digest]
+        # Each template version is compiled once, then rendered per recipient
+        contents = [notification_content(db, row) for row in rows]
+        errors = send_many([
+            (user.email if user else None, title, format_email_body(title, message))
+            for user, (title, message) in zip(recipients, contents)
+        ])
+        # The batch is one probe of the provider: any success means it is up,
+        # and only the server's own failures count against it
+        if errors.count(None):
+            breaker.record_success()
+        elif any(isinstance(error, ProviderError) for error in errors):
+            breaker.record_failure()
+        sent_ids = [row.id for row, error in zip(rows, errors) if error is None]
+        failed_ids = [row.id for row, error in zip(rows, errors) if error is not None]
+
+        if sent_ids:
+            mark_deliveries(db, sent_ids, "email", models.NotificationStatus.SENT)
+
+        notifications_sent.labels(channel="email", status="success").inc(len(sent_ids))
+        notifications_sent.labels(channel="email", status="failed").inc(len(failed_ids))
+        notification_duration.labels(channel="email").observe(time.time() - start_time)
+
+        # Per-message failures go through the regular task and its retry policy
+        if failed_ids:
+            release_deliveries(db, failed_ids, "email")
+        retry_individually(failed_ids)
+        logger.info(f"Email batch: {len(sent_ids)} sent, {len(failed_ids)} handed back for retry")
+    except Exception:
+        # Whatever was claimed but not sent can be claimed again when handed back
+        db.rollback()
+        if claimed:
+            release_deliveries(db, claimed, "email")
+        raise
+    finally:
+        db.close()
+
+
+def main():
+    start_metrics_exporter()
+    ensure_invalidation_listener()
+    redis_client = get_redis()
+    threading.Thread(target=keep_lease, args=(redis_client,), daemon=True, name="email-batcher-lease").start()
+    logger.info(f"Email batcher {BATCHER_ID} consuming {EMAIL_BATCH_QUEUE} "
+                f"(size={EMAIL_BATCH_SIZE}, linger={EMAIL_BATCH_LINGER_MS}ms)")
+    while True:
+        batch = collect_batch(redis_client)
+        if not batch:
+            continue
+        try:
+            process_batch(batch)
+        except Exception as e:
+            logger.error(f"Email batch of {len(batch)} failed: {str(e)}")
+            try:
+                retry_individually(batch)
+            except Exception as exc:
+                # Not handed anywhere: put it back and try the batch again
+                logger.error(f"Failed to hand back email batch of {len(batch)}: {str(exc)}")
+                reliable_queue.requeue(redis_client, EMAIL_BATCH_QUEUE, BATCHER_ID)
+                time.sleep(1)
+                continue
+        acknowledge(redis_client, batch)
+
+
+if __name__ == "__main__":
+    main()
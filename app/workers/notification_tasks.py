@@ -1,118 +1,578 @@
-from app.celery_app import app
-from app.database import SessionLocal
+from app.celery_app import app, REDIS_URL, CHANNEL_RATE_LIMITS
+from app.database import get_worker_session
 from app import models
 from app.services.metrics import (
     notifications_sent, 
     notification_duration, 
     pending_notifications,
-    push_metrics  
+    task_db_duration,
+    dead_letters_recorded,
 )
+from contextlib import contextmanager
 import time
 import json
+import os
+import random
 from app.services.email_service import send_email
-import asyncio
-from datetime import datetime
+from app.services.templates import notification_content
+from app.services.user_cache import get_user_routing_sync
+from app.services.ids import created_at_bounds, created_at_range
+from app.services.backoff import decorrelated_jitter
+from app.services.circuit_breaker import circuit_breakers, CircuitOpenError, ProviderError
+from app.services.digest import wants_digest, buffer_notification
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert, select, update, literal, or_, and_, not_, case, cast, func, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 import logging
+import redis
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@app.task(bind=True, max_retries=5)
-def send_notification(self, notification_id: str):
-    """Send notification across all channels"""
+# Number of notification ids carried by a single dispatch_batch message
+DISPATCH_CHUNK_SIZE = int(os.getenv("DISPATCH_CHUNK_SIZE", 500))
+
+# Email-only notifications go to the micro-batching consumer (app.workers.email_batcher)
+EMAIL_BATCH_MODE = os.getenv("EMAIL_BATCH_MODE", "false").lower() == "true"
+EMAIL_BATCH_QUEUE = "notifications:email:batch"
+
+TERMINAL_STATUSES = (models.NotificationStatus.SENT, models.NotificationStatus.FAILED)
+# Deliveries a task may claim for sending
+CLAIMABLE_STATUSES = (models.NotificationStatus.PENDING.value, models.NotificationStatus.RETRYING.value)
+# A delivery claimed by a worker that died mid-send may be claimed again after this long
+DELIVERY_CLAIM_SECONDS = int(os.getenv("DELIVERY_CLAIM_SECONDS", 300))
+
+_redis = None
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.from_url(REDIS_URL, decode_responses=True)
+    return _redis
+
+class DBTimer:
+    """Accumulates the time one task spends in database calls"""
     
-    db = SessionLocal()
-    start_time = time.time()
+    def __init__(self):
+        self.elapsed = 0.0
     
+    @contextmanager
+    def measure(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+def create_deliveries(db, notification_ids: list):
+    """
+    Create a pending delivery row per channel where there is none yet and
+    return every (notification_id, channel) delivery still pending.
+    Notifications without a single known channel are failed.
+    """
+    rows = db.query(models.Notification.id, models.Notification.channels).filter(
+        models.Notification.id.in_(notification_ids)
+    ).all()
+    existing = {
+        (notification_id, channel): status
+        for notification_id, channel, status in db.query(
+            models.NotificationDelivery.notification_id,
+            models.NotificationDelivery.channel,
+            models.NotificationDelivery.status,
+        ).filter(models.NotificationDelivery.notification_id.in_(notification_ids))
+    }
+
+    created = [
+        (row.id, channel)
+        for row in rows for channel in row.channels
+        if channel in CHANNEL_TASKS and (row.id, channel) not in existing
+    ]
+    # Rows stored before channels were validated may name none we can send on;
+    # with no delivery to finish them they would stay pending forever
+    unroutable = [row.id for row in rows if not any(channel in CHANNEL_TASKS for channel in row.channels)]
+    if unroutable:
+        logger.warning(f"Failing {len(unroutable)} notifications without a known channel")
+        db.execute(
+            update(models.Notification)
+            .where(
+                models.Notification.id.in_(unroutable),
+                *created_at_range(models.Notification.created_at, unroutable),
+                models.Notification.status.notin_(TERMINAL_STATUSES),
+            )
+            .values(status=models.NotificationStatus.FAILED)
+            .execution_options(synchronize_session=False)
+        )
+    if created:
+        db.execute(insert(models.NotificationDelivery), [
+            {"notification_id": notification_id, "channel": channel, "status": models.NotificationStatus.PENDING.value}
+            for notification_id, channel in created
+        ])
+    db.commit()
+
+    return [
+        delivery for delivery, status in existing.items()
+        if status == models.NotificationStatus.PENDING.value and delivery[1] in CHANNEL_TASKS
+    ] + created
+
+
+def fan_out(db, notification_ids: list):
+    """
+    Queue one task per pending delivery of the notifications. The delivery
+    rows are committed before publishing, so a retry after a failed publish
+    queues the deliveries the failed attempt created too. Queueing a delivery
+    twice does not send it twice: each task claims it first (claim_delivery).
+    """
+    deliveries = create_deliveries(db, notification_ids)
+    # One producer (and broker connection) for the whole set; each task goes to its channel's queue
+    with app.producer_or_acquire() as producer:
+        for notification_id, channel in deliveries:
+            CHANNEL_TASKS[channel].apply_async(args=[notification_id], producer=producer)
+    return deliveries
+
+
+@app.task(bind=True, max_retries=5)
+def send_notification(self, notification_id: str, prev_backoff: float = None):
+    """Split a notification into per-channel delivery tasks"""
+    
+    db = get_worker_session()
+    db_timer = DBTimer()
     try:
-        # Get notification from database
-        notification = db.query(models.Notification).filter(
-            models.Notification.id == notification_id
-        ).first()
-        user_id=notification.user_id
-        #Get user details
-        user=db.query(models.User).filter(
-            models.User.id==user_id
-        ).first()
-        email=user.email
-        phone=user.phone
-        message=notification.message
-        title=notification.title
-        channels=notification.channels
+        with db_timer.measure():
+            deliveries = fan_out(db, [notification_id])
+        logger.info(f"Fanned out notification {notification_id} to {[channel for _, channel in deliveries]}")
+    except Exception as exc:
+        db.rollback()
+        backoff = decorrelated_jitter(prev_backoff)
+        logger.error(f"Fan-out of notification {notification_id} failed, retrying in {backoff:.1f}s: {str(exc)}")
+        raise self.retry(exc=exc, countdown=backoff, kwargs={"prev_backoff": backoff})
+    finally:
+        task_db_duration.labels(task="send_notification").observe(db_timer.elapsed)
 
-        
-        if not notification:
-            logger.error(f"Notification {notification_id} not found")
-            return
-        # Update gauge: increment pending
-        pending_notifications.inc()
+
+@app.task(bind=True, max_retries=5)
+def dispatch_batch(self, notification_ids: list, prev_backoff: float = None):
+    """Fan a chunk of notification ids out into per-channel delivery tasks"""
+    db = get_worker_session()
+    db_timer = DBTimer()
+    try:
+        with db_timer.measure():
+            deliveries = fan_out(db, notification_ids)
+        logger.info(f"Dispatched {len(deliveries)} deliveries for {len(notification_ids)} notifications")
+    except Exception as exc:
+        db.rollback()
+        backoff = decorrelated_jitter(prev_backoff)
+        logger.error(f"Dispatch of {len(notification_ids)} notifications failed, retrying in {backoff:.1f}s: {str(exc)}")
+        raise self.retry(exc=exc, countdown=backoff, kwargs={"prev_backoff": backoff})
+    finally:
+        task_db_duration.labels(task="dispatch_batch").observe(db_timer.elapsed)
+
+
+@app.task
+def measure_pending_notifications():
+    """
+    Set pending_notifications from the database: due notifications not yet
+    sent or failed. One writer, so no process's count can drift.
+    """
+    db = get_worker_session()
+    try:
+        pending = db.query(func.count()).select_from(models.Notification).filter(
+            # Matches the partial index ix_notifications_unfinished
+            models.Notification.status.in_([models.NotificationStatus.PENDING, models.NotificationStatus.RETRYING]),
+            or_(models.Notification.scheduled_at.is_(None), models.Notification.scheduled_at <= func.now()),
+        ).scalar()
+    finally:
+        db.rollback()
+    pending_notifications.set(pending)
+    return pending
+
+
+def refresh_notification_statuses(db, notification_ids: list):
+    """
+    Derive each notification's overall status from its channel deliveries,
+    with one UPDATE ... FROM an aggregate over all of them. Runs in the
+    caller's transaction, after its delivery update; see mark_deliveries.
+    """
+    delivery = models.NotificationDelivery
+    status_type = models.Notification.status.type
+    derived = select(
+        delivery.notification_id,
+        cast(case(
+            (func.bool_and(delivery.status == models.NotificationStatus.SENT.value),
+             models.NotificationStatus.SENT.name),
+            (func.bool_or(delivery.status == models.NotificationStatus.RETRYING.value),
+             models.NotificationStatus.RETRYING.name),
+            (and_(
+                func.bool_or(delivery.status == models.NotificationStatus.FAILED.value),
+                not_(func.bool_or(delivery.status.in_(
+                    [models.NotificationStatus.PENDING.value, models.DELIVERY_SENDING]
+                ))),
+            ), models.NotificationStatus.FAILED.name),
+        ), status_type).label("status"),
+    ).where(
+        delivery.notification_id.in_(notification_ids)
+    ).group_by(delivery.notification_id).subquery()
+
+    # Finished notifications are never moved again
+    db.execute(
+        update(models.Notification)
+        .where(
+            models.Notification.id == derived.c.notification_id,
+            *created_at_range(models.Notification.created_at, notification_ids),
+            derived.c.status.isnot(None),
+            models.Notification.status.notin_(TERMINAL_STATUSES),
+        )
+        .values(
+            status=derived.c.status,
+            sent_at=case(
+                (derived.c.status == models.NotificationStatus.SENT, literal(datetime.utcnow())),
+                else_=models.Notification.sent_at,
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def record_dead_letters(db, notification_ids: list, channel: str, error_class: str = None):
+    """
+    Keep deliveries that exhausted their retries, with their last error and
+    attempt count, for replay. One INSERT ... SELECT in the caller's
+    transaction; deliveries a duplicate run already recorded are skipped.
+    """
+    delivery = models.NotificationDelivery
+    recorded = db.execute(
+        pg_insert(models.DeadLetter).from_select(
+            ["notification_id", "channel", "error", "error_class", "attempts", "failed_at"],
+            select(
+                delivery.notification_id,
+                delivery.channel,
+                delivery.last_error,
+                literal(error_class, String),
+                delivery.attempts,
+                literal(datetime.now(timezone.utc)),
+            ).where(
+                delivery.notification_id.in_(notification_ids),
+                delivery.channel == channel,
+            )
+        )
+        .on_conflict_do_nothing()
+        .returning(models.DeadLetter.notification_id)
+    ).scalars().all()
+    if recorded:
+        dead_letters_recorded.labels(channel=channel).inc(len(recorded))
+
+
+def mark_delivery(db, notification_id: str, channel: str, status, error: str = None, error_class: str = None):
+    mark_deliveries(db, [notification_id], channel, status, error, error_class)
+
+
+def mark_deliveries(
+    db,
+    notification_ids: list,
+    channel: str,
+    status,
+    error: str = None,
+    error_class: str = None,
+    via_digest: bool = False,
+):
+    """
+    mark_delivery for several notifications on one channel: the delivery
+    update, dead letters and notification statuses in one transaction, or
+    statement by statement on an autocommit worker session.
+    """
+    # In a transaction, lock the notifications first (in id order, against
+    # deadlocks) so that finishers of other channels of the same notification
+    # run one after the other and the last one sees every final delivery
+    # status. In autocommit the delivery update is visible as soon as it ran.
+    if db.connection().get_execution_options().get("isolation_level") != "AUTOCOMMIT":
+        db.execute(
+            select(models.Notification.id)
+            .where(
+                models.Notification.id.in_(notification_ids),
+                *created_at_range(models.Notification.created_at, notification_ids),
+            )
+            .order_by(models.Notification.id)
+            .with_for_update()
+        )
+    values = {"status": status.value}
+    if status == models.NotificationStatus.SENT:
+        values["sent_at"] = datetime.utcnow()
+        if via_digest:
+            values["via_digest"] = True
+    else:
+        values["attempts"] = models.NotificationDelivery.attempts + 1
+        values["last_error"] = error
+    db.execute(
+        update(models.NotificationDelivery)
+        .where(
+            models.NotificationDelivery.notification_id.in_(notification_ids),
+            models.NotificationDelivery.channel == channel
+        )
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if status == models.NotificationStatus.FAILED:
+        record_dead_letters(db, notification_ids, channel, error_class)
+    refresh_notification_statuses(db, notification_ids)
+    db.commit()
+
+
+def claim_deliveries(db, notification_ids: list, channel: str) -> list:
+    """
+    Take deliveries for sending with one conditional UPDATE, so that of two
+    tasks for the same delivery (a republished fan-out, a redelivered
+    message) only one sends it. Returns the ids claimed; the others are
+    done or being sent by someone else.
+    """
+    stale = func.now() - timedelta(seconds=DELIVERY_CLAIM_SECONDS)
+    claimed = db.execute(
+        update(models.NotificationDelivery)
+        .where(
+            models.NotificationDelivery.notification_id.in_(notification_ids),
+            models.NotificationDelivery.channel == channel,
+            or_(
+                models.NotificationDelivery.status.in_(CLAIMABLE_STATUSES),
+                and_(
+                    models.NotificationDelivery.status == models.DELIVERY_SENDING,
+                    models.NotificationDelivery.updated_at < stale,
+                ),
+            ),
+        )
+        .values(status=models.DELIVERY_SENDING, updated_at=func.now())
+        .returning(models.NotificationDelivery.notification_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    return claimed
+
+
+def claim_delivery(db, notification_id: str, channel: str) -> bool:
+    return bool(claim_deliveries(db, [notification_id], channel))
+
+
+def release_deliveries(db, notification_ids: list, channel: str):
+    """Give claimed deliveries back unsent, e.g. when the send is deferred or left to a digest"""
+    db.execute(
+        update(models.NotificationDelivery)
+        .where(
+            models.NotificationDelivery.notification_id.in_(notification_ids),
+            models.NotificationDelivery.channel == channel,
+            models.NotificationDelivery.status == models.DELIVERY_SENDING,
+        )
+        .values(status=models.NotificationStatus.PENDING.value)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def release_delivery(db, notification_id: str, channel: str):
+    release_deliveries(db, [notification_id], channel)
+
+
+def load_delivery_context(db, notification_id: str, channel: str):
+    """
+    Everything needed to send one channel of a notification: one query of
+    just the needed notification columns, plus the recipient's contact
+    details from the routing cache. None if there is nothing left to send.
+    """
+    row = db.execute(
+        select(
+            models.Notification.id,
+            models.Notification.user_id,
+            models.Notification.title,
+            models.Notification.message,
+            models.Notification.template_id,
+            models.Notification.template_version,
+            models.Notification.variables,
+            models.Notification.channels,
+        )
+        .select_from(models.NotificationDelivery)
+        .join(models.Notification, models.Notification.id == models.NotificationDelivery.notification_id)
+        .where(
+            models.NotificationDelivery.notification_id == notification_id,
+            models.NotificationDelivery.channel == channel,
+            models.NotificationDelivery.status != models.NotificationStatus.SENT.value,
+            *created_at_bounds(models.Notification.created_at, notification_id),
+        )
+    ).first()
+    if row is None:
+        logger.info(f"Nothing to deliver for {notification_id} via {channel}")
+        return None
+    user = get_user_routing_sync(db, row.user_id)
+    return SimpleNamespace(
+        **row._mapping,
+        email=user.email if user else None,
+        phone=user.phone if user else None,
+        preferences=user.preferences if user else None,
+    )
+
+
+def send_channel(channel: str, context, title: str, message: str):
+    """Hand one message to the channel's provider; raises if it was not accepted"""
+    if channel == "email":
+        send_email_notification(context,context.email,title,message)
+    elif channel == "sms":
+        send_sms_notification(context,context.phone,message,title)
+    elif channel == "push":
+        send_push_notification(context,message,title)
+    elif channel == "in_app":
+        send_in_app_notification(context,message,title)
+
+
+def deliver_channel(task, notification_id: str, channel: str, prev_backoff: float = None, digest: bool = True):
+    """
+    Send one channel of a notification; failures only retry this channel.
+    prev_backoff is the delay before this attempt, carried between retries
+    to draw the next one. digest=False sends right away even to users in
+    digest mode (a digest that failed hands its notifications back so).
+    """
     
+    db = get_worker_session()
+    db_timer = DBTimer()
+    breaker = circuit_breakers.get(channel)
+    channel_start = time.time()
+    
+    try:
+        with db_timer.measure():
+            if not claim_delivery(db, notification_id, channel):
+                logger.info(f"Delivery of {notification_id} via {channel} is done or being sent elsewhere")
+                return
+            context = load_delivery_context(db, notification_id, channel)
+            if context is None:
+                return
+        if digest and wants_digest(context.preferences, channel):
+            # Sent later as part of one combined message (app.workers.digests)
+            buffer_notification(get_redis(), channel, context.user_id, notification_id)
+            with db_timer.measure():
+                release_delivery(db, notification_id, channel)
+            logger.info(f"Buffered {notification_id} for the {channel} digest of user {context.user_id}")
+            return {"status": "buffered", "notification_id": notification_id, "channel": channel}
+        with db_timer.measure():
+            # Literal content, or the pinned template version rendered for this recipient
+            title, message = notification_content(db, context)
         
-        logger.info(f"Sending notification {notification_id} via {channels}")
-        
-        # Send to each channel
-        for channel in channels:
-            channel_start = time.time()
-            try:
-                if channel == "email":
-                    send_email_notification(notification,email,title,message)
-                elif channel == "sms":
-                    send_sms_notification(notification,phone,message,title)
-                elif channel == "push":
-                    send_push_notification(notification,message,title)
-                elif channel == "in_app":
-                 send_in_app_notification(notification,message,title)
-                notifications_sent.labels(channel=channel, status="success").inc()
-                notification_duration.labels(channel=channel).observe(time.time() - channel_start)
-            except Exception as channel_error:
-                notifications_sent.labels(channel=channel, status="failed").inc()
-                logger.warning(f"Failed to send via {channel}: {str(channel_error)}")
-                raise channel_error
-                
-        
-        # Mark as sent
-        # Push metrics after processing all channels
-         
-        notification.status = "sent"
-        notification.sent_at = datetime.utcnow()
-        db.commit()
-        # Update gauge: decrement pending
-        pending_notifications.dec()
-        
-        # Push ALL metrics to Pushgateway
-        push_metrics()
-        
+        if breaker is not None:
+            breaker.allow()
+        try:
+            send_channel(channel, context, title, message)
+        except ProviderError:
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        notifications_sent.labels(channel=channel, status="success").inc()
+        notification_duration.labels(channel=channel).observe(time.time() - channel_start)
         
-        logger.info(f"Notification {notification.id} sent successfully")
-        return {"status": "sent", "notification_id": notification_id}
+        with db_timer.measure():
+            mark_delivery(db, notification_id, channel, models.NotificationStatus.SENT)
+        logger.info(f"Notification {notification_id} sent via {channel}")
+        return {"status": "sent", "notification_id": notification_id, "channel": channel}
+    
+    except CircuitOpenError as exc:
+        # The provider is down: no send, no attempt spent. Come back once the
+        # breaker may let sends through, spread so deferred tasks do not return together.
+        delay = exc.retry_after + random.uniform(0, max(exc.retry_after, 1))
+        logger.info(f"Deferring {channel} for {notification_id} by {delay:.1f}s: {exc}")
+        with db_timer.measure():
+            release_delivery(db, notification_id, channel)
+        task.apply_async(
+            args=[notification_id], kwargs={"prev_backoff": prev_backoff, "digest": digest},
+            countdown=delay, retries=task.request.retries,
+        )
+        return {"status": "deferred", "notification_id": notification_id, "channel": channel}
     
     except Exception as exc:
-        logger.error(f"Notification {notification.id} failed: {str(exc)}")
-        notifications_sent.labels(channel="unknown", status="failed").inc()
-        pending_notifications.dec()
-        logger.info("[ERROR PATH] About to push metrics...")
-        push_metrics()  # ← Push metrics even on failure
-        logger.info(" [ERROR PATH] Returned from push_metrics()")
+        db.rollback()
+        notifications_sent.labels(channel=channel, status="failed").inc()
+        logger.warning(f"Failed to send {notification_id} via {channel}: {str(exc)}")
         
-        if self.request.retries < self.max_retries:
-            backoff = 2 ** self.request.retries
-            logger.info(f"Retrying in {backoff}s")
-            raise self.retry(exc=exc, countdown=backoff)
+        if task.request.retries < task.max_retries:
+            with db_timer.measure():
+                mark_delivery(db, notification_id, channel, models.NotificationStatus.RETRYING, str(exc))
+            backoff = decorrelated_jitter(prev_backoff)
+            logger.info(f"Retrying {channel} for {notification_id} in {backoff:.1f}s")
+            raise task.retry(exc=exc, countdown=backoff, kwargs={"prev_backoff": backoff, "digest": digest})
         else:
-            notification.status = "failed"
-            notifications_sent.labels(channel="unknown", status="failed").inc()
-            db.commit()
-            logger.error(f"Notification {notification.id} failed after retries")
+            with db_timer.measure():
+                mark_delivery(
+                    db, notification_id, channel, models.NotificationStatus.FAILED, str(exc), type(exc).__name__
+                )
+            logger.error(f"Notification {notification_id} failed via {channel} after retries")
     
     finally:
-        db.close()
+        task_db_duration.labels(task=f"deliver_{channel}").observe(db_timer.elapsed)
+
+
+@app.task(bind=True, max_retries=5, rate_limit=CHANNEL_RATE_LIMITS["email"])
+def deliver_email(self, notification_id: str, prev_backoff: float = None, digest: bool = True):
+    return deliver_channel(self, notification_id, "email", prev_backoff, digest)
+
+@app.task(bind=True, max_retries=5, rate_limit=CHANNEL_RATE_LIMITS["sms"])
+def deliver_sms(self, notification_id: str, prev_backoff: float = None, digest: bool = True):
+    return deliver_channel(self, notification_id, "sms", prev_backoff, digest)
+
+@app.task(bind=True, max_retries=5, rate_limit=CHANNEL_RATE_LIMITS["push"])
+def deliver_push(self, notification_id: str, prev_backoff: float = None, digest: bool = True):
+    return deliver_channel(self, notification_id, "push", prev_backoff, digest)
+
+@app.task(bind=True, max_retries=5, rate_limit=CHANNEL_RATE_LIMITS["in_app"])
+def deliver_in_app(self, notification_id: str, prev_backoff: float = None, digest: bool = True):
+    return deliver_channel(self, notification_id, "in_app", prev_backoff, digest)
+
+CHANNEL_TASKS = {
+    "email": deliver_email,
+    "sms": deliver_sms,
+    "push": deliver_push,
+    "in_app": deliver_in_app,
+}
+
+
+def enqueue_notifications(notifications: list):
+    """
+    Queue (notification_id, channels) pairs. Email-only notifications are
+    buffered for the email batcher when EMAIL_BATCH_MODE is on; the rest
+    are published with one broker message per chunk instead of one per id.
+    """
+    batched = []
+    notification_ids = []
+    for notification_id, channels in notifications:
+        if EMAIL_BATCH_MODE and list(channels) == ["email"]:
+            batched.append(notification_id)
+        else:
+            notification_ids.append(notification_id)
+    
+    if batched:
+        get_redis().rpush(EMAIL_BATCH_QUEUE, *batched)
+    if len(notification_ids) == 1:
+        send_notification.delay(notification_ids[0])
+        return
+    for start in range(0, len(notification_ids), DISPATCH_CHUNK_SIZE):
+        dispatch_batch.delay(notification_ids[start:start + DISPATCH_CHUNK_SIZE])
+
+
+def format_email_body(title, message):
+    return f"{title}\n\n{message}"
+
+
+def format_sms_body(title, message):
+    return f"{title}\n{message}"
+
+
+def in_app_payload(notification_id, title, message):
+    return {
+        "type": "notification",
+        "title": title,
+        "message": message,
+        "notification_id": notification_id
+    }
 
 
 def send_email_notification(notification,email,title,message):
     """Send email notification""" 
     to_email = email
     subject = title
-    body = f"{title}\n\n{message}"
+    body = format_email_body(title, message)
     success = send_email(to_email, subject, body)
     if success:
         logger.info(f"[EMAIL] Sent to {to_email}")
@@ -123,7 +583,7 @@ def send_sms_notification(notification,phone,message,title):
     """Send SMS notification"""
     from app.services.sms_service import send_sms
     to_number = phone # Test number format
-    message = f"{title}\n{message}"
+    message = format_sms_body(title, message)
     success = send_sms(to_number, message)
     if success:
         logger.info(f"[SMS] Sent to {to_number}")
@@ -132,18 +592,13 @@ def send_sms_notification(notification,phone,message,title):
 
 def send_push_notification(notification,message,title):
     """Send push notification - placeholder"""
-    logger.info(f"[PUSH] To user {notification.user_id}: {notification.title}")
+    logger.info(f"[PUSH] To user {notification.user_id}: {title}")
     # TODO: Implement actual push sending
 
 def send_in_app_notification(notification,message,title):
     """Send in-app notification via Redis Pub/Sub"""
     from app.services.redis_pubsub import redis_pubsub
-    message = {
-        "type": "notification",
-        "title": title,
-        "message": message,
-        "notification_id": notification.id
-    }
+    message = in_app_payload(notification.id, title, message)
     
     # Publish to user's channel
     redis_pubsub.publish_notification(notification.user_id, message)
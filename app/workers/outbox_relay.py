@@ -0,0 +1,86 @@
+"""
+Outbox relay: publishes notifications committed by the API to the broker.
+
+Run with: python -m app.workers.outbox_relay   (several relays may run side by side)
+
+The API writes an outbox row in the same transaction as each notification,
+so a notification is queued if and only if it was committed. Each relay
+claims up to OUTBOX_BATCH_SIZE rows with FOR UPDATE SKIP LOCKED, publishes
+them in bulk through enqueue_notifications and deletes them in the same
+transaction. A crash between publish and commit republishes the batch:
+fan_out then queues the deliveries still pending a second time, and each
+channel task claims its delivery before sending (claim_delivery), so only
+one copy sends it.
+"""
+from app.database import SessionLocal
+from app import models
+from app.services.metrics import outbox_lag, outbox_publish_delay, outbox_published, start_metrics_exporter
+from app.workers.notification_tasks import enqueue_notifications
+from datetime import datetime, timezone
+import os
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 1000))
+# Sleep between polls while the outbox is empty
+OUTBOX_POLL_INTERVAL_MS = int(os.getenv("OUTBOX_POLL_INTERVAL_MS", 100))
+
+
+def relay_batch(db) -> int:
+    """Publish one batch of outbox entries; returns how many were published"""
+    entries = db.query(models.OutboxEntry).order_by(
+        models.OutboxEntry.id
+    ).limit(OUTBOX_BATCH_SIZE).with_for_update(skip_locked=True).all()
+    if not entries:
+        db.rollback()
+        return 0
+
+    # Read before the commit: afterwards the deleted entries can no longer be loaded
+    created = [entry.created_at for entry in entries]
+    enqueue_notifications([(entry.notification_id, entry.channels) for entry in entries])
+    db.query(models.OutboxEntry).filter(
+        models.OutboxEntry.id.in_([entry.id for entry in entries])
+    ).delete(synchronize_session=False)
+    db.commit()
+
+    now = datetime.now(timezone.utc)
+    for created_at in created:
+        outbox_publish_delay.observe((now - created_at).total_seconds())
+    outbox_published.inc(len(created))
+    return len(created)
+
+
+def update_lag(db):
+    """Export the age of the oldest entry still waiting (0 when the outbox is empty)"""
+    oldest = db.query(models.OutboxEntry.created_at).order_by(models.OutboxEntry.id).limit(1).scalar()
+    db.rollback()
+    outbox_lag.set((datetime.now(timezone.utc) - oldest).total_seconds() if oldest else 0)
+
+
+def main():
+    start_metrics_exporter()
+    logger.info(f"Outbox relay running (batch={OUTBOX_BATCH_SIZE}, poll={OUTBOX_POLL_INTERVAL_MS}ms)")
+    db = SessionLocal()
+    try:
+        while True:
+            try:
+                published = relay_batch(db)
+                update_lag(db)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Outbox relay batch failed: {str(e)}")
+                time.sleep(1)
+                continue
+            if published:
+                logger.info(f"Published {published} outbox entries")
+            if published < OUTBOX_BATCH_SIZE:
+                time.sleep(OUTBOX_POLL_INTERVAL_MS / 1000)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
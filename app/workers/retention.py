@@ -0,0 +1,128 @@
+"""
+Partition maintenance and retention for the notifications table.
+
+Run by Celery beat (see beat_schedule in app.celery_app), or once by hand:
+    python -m app.workers.retention [maintain|archive]
+
+maintain_partitions keeps PARTITION_MONTHS_AHEAD months of empty partitions
+ready. archive_expired_partitions detaches every partition whose range ended
+more than NOTIFICATION_RETENTION_DAYS ago, writes it to
+NOTIFICATION_ARCHIVE_DIR/<partition>.ndjson.gz, removes the delivery,
+idempotency and dead-letter rows that point at it and drops it. Each step is safe to
+re-run: a partition detached by an interrupted run is picked up again.
+"""
+from app.celery_app import app
+from app.database import engine
+from app.services.partitions import (
+    ensure_partitions,
+    attached_partitions,
+    detached_partitions,
+    PARENT_TABLE,
+)
+from sqlalchemy import text
+from datetime import datetime, timedelta, timezone
+import gzip
+import json
+import os
+import sys
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", 3))
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 365))
+NOTIFICATION_ARCHIVE_DIR = os.getenv("NOTIFICATION_ARCHIVE_DIR", "archive")
+# Rows fetched per round trip while archiving
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 10000))
+
+
+def autocommit_connection():
+    # DETACH ... CONCURRENTLY cannot run inside a transaction block
+    return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def archive_and_drop(name: str) -> str:
+    """
+    Archive one detached partition, then drop it, in a single transaction:
+    the streaming read needs a server-side cursor, which only exists inside
+    one, and a failed archive drops nothing.
+    """
+    with engine.begin() as conn:
+        path = archive_table(conn, name)
+        drop_archived(conn, name)
+    return path
+
+
+def archive_table(conn, name: str) -> str:
+    """Stream a detached partition to a gzipped NDJSON file; returns its path"""
+    os.makedirs(NOTIFICATION_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(NOTIFICATION_ARCHIVE_DIR, f"{name}.ndjson.gz")
+    partial = path + ".partial"
+    rows = 0
+    # Statement-level option: Connection.execution_options would stream every later statement too
+    result = conn.execute(text(f"SELECT * FROM {name}").execution_options(yield_per=ARCHIVE_BATCH_SIZE))
+    with gzip.open(partial, "wt", encoding="utf-8") as archive:
+        for partition in result.partitions():
+            for row in partition:
+                archive.write(json.dumps(dict(row._mapping), default=str))
+                archive.write("\n")
+            rows += len(partition)
+        archive.flush()
+        os.fsync(archive.fileno())
+    # Only a complete file ever carries the final name
+    os.replace(partial, path)
+    logger.info(f"Archived {rows} rows of {name} to {path}")
+    return path
+
+
+def drop_archived(conn, name: str):
+    """Remove what still references the archived notifications, then the table itself"""
+    for table in ("notification_deliveries", "idempotency_keys", "dead_letters"):
+        conn.execute(text(
+            f"DELETE FROM {table} t USING {name} n WHERE t.notification_id = n.id"
+        ))
+    conn.execute(text(f"DROP TABLE {name}"))
+
+
+@app.task
+def maintain_partitions():
+    with autocommit_connection() as conn:
+        created = ensure_partitions(conn, PARTITION_MONTHS_AHEAD)
+    if created:
+        logger.info(f"Created partitions {created}")
+    return created
+
+
+@app.task
+def archive_expired_partitions():
+    cutoff = datetime.now(timezone.utc) - timedelta(days=NOTIFICATION_RETENTION_DAYS)
+    archived = []
+    with autocommit_connection() as conn:
+        for name, upper, detach_pending in attached_partitions(conn):
+            if detach_pending:
+                # An earlier concurrent detach was interrupted
+                conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name} FINALIZE"))
+            elif upper is not None and upper <= cutoff:
+                conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name} CONCURRENTLY"))
+            else:
+                continue
+            logger.info(f"Detached {name}")
+        for name in detached_partitions(conn):
+            archive_and_drop(name)
+            archived.append(name)
+    return archived
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "maintain"
+    if command == "maintain":
+        logger.info(f"Created partitions: {maintain_partitions()}")
+    elif command == "archive":
+        logger.info(f"Archived partitions: {archive_expired_partitions()}")
+    else:
+        sys.exit(f"Unknown command {command}; use maintain or archive")
+
+
+if __name__ == "__main__":
+    main()
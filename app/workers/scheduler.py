@@ -0,0 +1,157 @@
+"""
+Scheduler for notifications with a future scheduled_at.
+
+Run with: python -m app.workers.scheduler
+
+Scheduled notifications are written to scheduled_notifications (same
+transaction as the notification) and indexed in a Redis sorted set scored by
+due time. Every SCHEDULER_POLL_INTERVAL_MS the scheduler atomically pops up to
+SCHEDULER_BATCH_SIZE due ids and moves them to the outbox in one transaction;
+the outbox relay publishes them from there. Nothing waits inside the broker,
+so millions of future sends cost a sorted-set member and a row each.
+
+The table is the source of truth: on start the index is rebuilt from it, and
+a periodic sweep moves rows that are due but missing from the index (e.g. the
+API's ZADD failed). DELETE ... RETURNING on the table makes each move happen
+once even with several schedulers running.
+"""
+from app.database import SessionLocal
+from app import models
+from app.services.metrics import scheduler_dispatch_lag, scheduled_notifications, start_metrics_exporter
+from app.services.schedule import SCHEDULED_KEY
+from app.workers.notification_tasks import get_redis
+from sqlalchemy import delete, insert, select
+from datetime import datetime, timedelta, timezone
+import os
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", 1000))
+SCHEDULER_POLL_INTERVAL_MS = int(os.getenv("SCHEDULER_POLL_INTERVAL_MS", 200))
+# How often to look for due rows the index does not know about, and how
+# overdue they must be (so rows the index is about to pop are left alone)
+SCHEDULER_SWEEP_INTERVAL = float(os.getenv("SCHEDULER_SWEEP_INTERVAL", 30))
+SCHEDULER_SWEEP_GRACE = float(os.getenv("SCHEDULER_SWEEP_GRACE", 5))
+# Rows read per round trip while rebuilding the index
+SCHEDULER_REBUILD_CHUNK = int(os.getenv("SCHEDULER_REBUILD_CHUNK", 10000))
+
+# Pop due members atomically so concurrent schedulers never claim the same id
+CLAIM_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+
+def rebuild_index(db, redis_client):
+    """Re-add every waiting row to the index; ZADD is idempotent, so this is safe to repeat"""
+    total = 0
+    result = db.execute(
+        select(models.ScheduledNotification.notification_id, models.ScheduledNotification.due_at)
+        .execution_options(yield_per=SCHEDULER_REBUILD_CHUNK)
+    )
+    for rows in result.partitions():
+        redis_client.zadd(SCHEDULED_KEY, {row.notification_id: row.due_at.timestamp() for row in rows})
+        total += len(rows)
+    db.rollback()
+    logger.info(f"Rebuilt scheduled index with {total} notifications")
+
+
+def move_to_outbox(db, notification_ids: list) -> int:
+    """Move still-waiting notifications to the outbox; ids already moved are skipped"""
+    claimed = db.execute(
+        delete(models.ScheduledNotification)
+        .where(models.ScheduledNotification.notification_id.in_(notification_ids))
+        .returning(models.ScheduledNotification.notification_id, models.ScheduledNotification.due_at)
+    ).all()
+    if not claimed:
+        db.rollback()
+        return 0
+    db.execute(
+        insert(models.OutboxEntry).from_select(
+            ["notification_id", "channels"],
+            select(models.Notification.id, models.Notification.channels)
+            .where(models.Notification.id.in_([row.notification_id for row in claimed]))
+        )
+    )
+    db.commit()
+
+    now = datetime.now(timezone.utc)
+    for row in claimed:
+        scheduler_dispatch_lag.observe(max(0.0, (now - row.due_at).total_seconds()))
+    return len(claimed)
+
+
+def dispatch_due(db, redis_client, claim_due) -> int:
+    """Pop one batch of due ids from the index and move them to the outbox"""
+    notification_ids = claim_due(keys=[SCHEDULED_KEY], args=[time.time(), SCHEDULER_BATCH_SIZE])
+    if not notification_ids:
+        return 0
+    try:
+        return move_to_outbox(db, notification_ids)
+    except Exception:
+        db.rollback()
+        # Put them back so the next poll retries them
+        redis_client.zadd(SCHEDULED_KEY, {notification_id: 0 for notification_id in notification_ids})
+        raise
+
+
+def sweep(db) -> int:
+    """Move rows that are overdue but were never (or no longer) indexed"""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=SCHEDULER_SWEEP_GRACE)
+    moved = 0
+    while True:
+        notification_ids = db.execute(
+            select(models.ScheduledNotification.notification_id)
+            .where(models.ScheduledNotification.due_at <= cutoff)
+            .order_by(models.ScheduledNotification.due_at)
+            .limit(SCHEDULER_BATCH_SIZE)
+        ).scalars().all()
+        if not notification_ids:
+            db.rollback()
+            break
+        count = move_to_outbox(db, notification_ids)
+        moved += count
+        if count < SCHEDULER_BATCH_SIZE:
+            break
+    if moved:
+        logger.warning(f"Sweep moved {moved} overdue notifications missing from the index")
+    return moved
+
+
+def main():
+    start_metrics_exporter()
+    redis_client = get_redis()
+    claim_due = redis_client.register_script(CLAIM_DUE_SCRIPT)
+    db = SessionLocal()
+    try:
+        rebuild_index(db, redis_client)
+        next_sweep = time.monotonic() + SCHEDULER_SWEEP_INTERVAL
+        logger.info(f"Scheduler running (batch={SCHEDULER_BATCH_SIZE}, poll={SCHEDULER_POLL_INTERVAL_MS}ms)")
+        while True:
+            try:
+                dispatched = dispatch_due(db, redis_client, claim_due)
+                if dispatched:
+                    logger.info(f"Moved {dispatched} due notifications to the outbox")
+                if time.monotonic() >= next_sweep:
+                    sweep(db)
+                    scheduled_notifications.set(redis_client.zcard(SCHEDULED_KEY))
+                    next_sweep = time.monotonic() + SCHEDULER_SWEEP_INTERVAL
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Scheduler iteration failed: {str(e)}")
+                time.sleep(1)
+                continue
+            if dispatched < SCHEDULER_BATCH_SIZE:
+                time.sleep(SCHEDULER_POLL_INTERVAL_MS / 1000)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Shared fixtures.
+
+Database tests run against a schema built by the Alembic migrations, never
+create_all, so they exercise what production actually runs on. Point
+TEST_DATABASE_URL at an empty, disposable PostgreSQL database to enable
+them; they are skipped otherwise. Redis is replaced by fakeredis.
+"""
+import os
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+# Settings are read when the app modules are imported, so set them first
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL or "postgresql://localhost/notifyx_test"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+import fakeredis
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    """One in-memory Redis behind every sync and asyncio client the app uses"""
+    from app.services import redis_pubsub
+    from app.services.circuit_breaker import circuit_breakers
+    from app.workers import notification_tasks
+
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(redis_pubsub.redis_pubsub, "redis", client)
+    monkeypatch.setattr(redis_pubsub, "_async_redis", fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(notification_tasks, "_redis", client)
+    for breaker in circuit_breakers.values():
+        monkeypatch.setattr(breaker, "_client", client)
+        monkeypatch.setattr(breaker, "_scripts", None)
+    return server
+
+
+@pytest.fixture(scope="session")
+def migrated_engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from app.database import engine
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    command.upgrade(config, "head")
+    return engine
+
+
+@pytest.fixture
+def db(migrated_engine):
+    """Session on the migrated schema; every table is emptied afterwards"""
+    from app.database import SessionLocal
+
+    session = SessionLocal()
+    yield session
+    session.close()
+    with migrated_engine.begin() as conn:
+        tables = conn.execute(text(
+            "SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename <> 'alembic_version'"
+        )).scalars().all()
+        conn.execute(text(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE"))
+
+
+class AsyncSessionShim:
+    """Just enough of an AsyncSession over a sync Session for read-only lookups"""
+
+    def __init__(self, session):
+        self.session = session
+
+    async def execute(self, statement):
+        return self.session.execute(statement)
+
+
+@pytest.fixture
+def async_db(db):
+    return AsyncSessionShim(db)
+
+
+@pytest.fixture
+def user(db):
+    from app import models
+
+    user = models.User(email="user@example.com", password="x", phone="+15550100")
+    db.add(user)
+    db.commit()
+    return user
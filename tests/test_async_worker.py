@@ -0,0 +1,93 @@
+import asyncio
+import base64
+import json
+
+import fakeredis
+
+from app.services import reliable_queue
+from app.workers import async_worker
+from app.workers.notification_tasks import CHANNEL_TASKS
+
+
+def task_message(notification_id):
+    body = json.dumps([[notification_id], {}, {}]).encode()
+    return json.dumps({
+        "body": base64.b64encode(body).decode(),
+        "headers": {"task": CHANNEL_TASKS["push"].name, "retries": 0},
+        "properties": {"body_encoding": "base64"},
+    })
+
+
+def handle(redis_server, deliver):
+    """Run one message through AsyncDeliveryWorker.handle; returns (queue, processing list)"""
+    async def run():
+        worker = async_worker.AsyncDeliveryWorker(["push"])
+        worker.redis = fakeredis.FakeAsyncRedis(server=redis_server, decode_responses=True)
+        worker.deliver = deliver
+        raw = task_message("n1")
+        await worker.redis.lpush("push", raw)
+        await worker.redis.blmove("push", worker.processing_key("push"), 1, "RIGHT", "LEFT")
+        await worker.semaphores["push"].acquire()
+        await worker.handle("push", raw)
+        return await worker.redis.lrange("push", 0, -1), await worker.redis.lrange(worker.processing_key("push"), 0, -1)
+    return asyncio.run(run())
+
+
+def test_delivered_message_is_acknowledged(redis_server):
+    delivered = []
+
+    async def deliver(notification_id, *args):
+        delivered.append(notification_id)
+
+    assert handle(redis_server, deliver) == ([], [])
+    assert delivered == ["n1"]
+
+
+def test_message_goes_back_when_its_delivery_cannot_be_recorded(redis_server, monkeypatch):
+    monkeypatch.setattr(async_worker, "REQUEUE_DELAY_SECONDS", 0)
+
+    async def deliver(notification_id, *args):
+        raise ConnectionError("database unavailable")
+
+    queue, processing = handle(redis_server, deliver)
+    assert len(queue) == 1
+    assert json.loads(queue[0])["headers"]["task"] == CHANNEL_TASKS["push"].name
+    assert processing == []
+
+
+def test_workers_on_one_queue_keep_their_messages_and_leases_apart(redis_server):
+    async def run():
+        workers = [async_worker.AsyncDeliveryWorker(["push"]) for _ in range(2)]
+
+        async def deliver(notification_id, *args):
+            await asyncio.Event().wait()  # Still sending when the test looks
+        for worker in workers:
+            worker.redis = fakeredis.FakeAsyncRedis(server=redis_server, decode_responses=True)
+            worker.semaphores["push"] = asyncio.Semaphore(1)
+            worker.deliver = deliver
+        redis_client = workers[0].redis
+        await redis_client.lpush("push", task_message("n1"), task_message("n2"))
+
+        consumers = [asyncio.create_task(worker.consume("push")) for worker in workers]
+        while await redis_client.llen("push"):
+            await asyncio.sleep(0.01)
+        for consumer in consumers:
+            consumer.cancel()
+
+        first, second = workers
+        assert first.processing_key("push") != second.processing_key("push")
+        held = [await redis_client.lrange(worker.processing_key("push"), 0, -1) for worker in workers]
+        assert sorted(len(messages) for messages in held) == [1, 1]
+
+        # Renewing one lease leaves the other worker's messages alone
+        for worker in workers:
+            assert await reliable_queue.renew_lease(redis_client, "push", worker.consumer, async_worker.QUEUE_HEAD) == 0
+        assert set(await redis_client.hkeys(reliable_queue.registry_key("push"))) == {first.consumer, second.consumer}
+
+        # Once the second worker's lease has run out, the first hands back only its messages
+        await redis_client.hset(reliable_queue.registry_key("push"), second.consumer, 0)
+        assert await reliable_queue.renew_lease(redis_client, "push", first.consumer, async_worker.QUEUE_HEAD) == 1
+        assert await redis_client.lrange("push", 0, -1) == held[1]
+        assert await redis_client.lrange(first.processing_key("push"), 0, -1) == held[0]
+        assert await redis_client.hkeys(reliable_queue.registry_key("push")) == [first.consumer]
+    asyncio.run(run())
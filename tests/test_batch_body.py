@@ -0,0 +1,40 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException, Request
+
+from app.routers import notifications
+
+
+def read(pending, headers=()):
+    """read_batch_items over a body sent in chunks; pending keeps the chunks left unread"""
+    async def receive():
+        chunk = pending.pop(0)
+        return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+    scope = {"type": "http", "headers": [(name.encode(), value.encode()) for name, value in headers]}
+    return asyncio.run(notifications.read_batch_items(Request(scope, receive)))
+
+
+def test_body_within_the_cap_is_parsed(monkeypatch):
+    monkeypatch.setattr(notifications, "BATCH_MAX_BYTES", 64)
+    items = read([b'{"a": 1}\n', b'{"a": 2}\n'], [("content-type", "application/x-ndjson")])
+    assert items == [{"a": 1}, {"a": 2}]
+
+
+def test_oversized_body_is_refused_without_reading_it_all(monkeypatch):
+    monkeypatch.setattr(notifications, "BATCH_MAX_BYTES", 64)
+    chunk = json.dumps([{"a": "x" * 40}]).encode()
+
+    chunks = [chunk] * 10
+    with pytest.raises(HTTPException) as exc:
+        read(chunks)
+    assert exc.value.status_code == 413
+    assert len(chunks) == 8
+
+    # A declared length over the cap is refused before any of the body is read
+    chunks = [chunk] * 10
+    with pytest.raises(HTTPException) as exc:
+        read(chunks, [("content-length", str(len(chunk) * 10))])
+    assert exc.value.status_code == 413
+    assert len(chunks) == 10
@@ -0,0 +1,175 @@
+import smtplib
+import time
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from requests.exceptions import ConnectTimeout
+from twilio.base.exceptions import TwilioRestException
+
+from app import models
+from app.services import circuit_breaker, email_service, sms_service
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, ProviderError
+from app.services.ids import uuid7
+from app.workers import notification_tasks
+
+
+@pytest.fixture
+def breakers(redis_server, monkeypatch):
+    """The sms breaker as seen by two worker processes sharing one Redis"""
+    monkeypatch.setattr(circuit_breaker, "BREAKER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(circuit_breaker, "BREAKER_OPEN_SECONDS", 0.2)
+    monkeypatch.setattr(circuit_breaker, "BREAKER_PROBE_SECONDS", 0.2)
+    return [
+        CircuitBreaker("sms", fakeredis.FakeRedis(server=redis_server, decode_responses=True))
+        for _ in range(2)
+    ]
+
+
+def state(breaker):
+    return breaker.client().hget(breaker.key, "state") or "closed"
+
+
+def test_failures_across_workers_open_the_breaker_for_all(breakers):
+    worker_a, worker_b = breakers
+    worker_a.record_failure()
+    worker_b.record_failure()
+    worker_a.allow()
+    worker_b.record_failure()
+
+    assert state(worker_a) == "open"
+    for breaker in breakers:
+        with pytest.raises(CircuitOpenError) as exc:
+            breaker.allow()
+        assert 0 < exc.value.retry_after <= 0.2
+
+
+def test_success_resets_the_failure_count(breakers):
+    worker_a, worker_b = breakers
+    worker_a.record_failure()
+    worker_a.record_failure()
+    worker_b.record_success()
+    worker_a.record_failure()
+
+    assert state(worker_a) == "closed"
+
+
+def test_one_probe_at_a_time_after_cooling_down(breakers):
+    worker_a, worker_b = breakers
+    for _ in range(3):
+        worker_a.record_failure()
+    time.sleep(0.25)
+
+    worker_a.allow()
+    assert state(worker_a) == "half_open"
+    with pytest.raises(CircuitOpenError):
+        worker_b.allow()
+
+    worker_a.record_success()
+    assert state(worker_b) == "closed"
+    worker_b.allow()
+
+
+def test_failed_probe_reopens_at_once(breakers):
+    worker_a, worker_b = breakers
+    for _ in range(3):
+        worker_a.record_failure()
+    time.sleep(0.25)
+    worker_b.allow()
+
+    worker_b.record_failure()
+
+    assert state(worker_a) == "open"
+    with pytest.raises(CircuitOpenError):
+        worker_a.allow()
+
+
+def test_late_success_leaves_an_open_breaker_open(breakers):
+    worker_a, worker_b = breakers
+    for _ in range(3):
+        worker_a.record_failure()
+
+    worker_b.record_success()
+
+    assert state(worker_a) == "open"
+
+
+class Retry(Exception):
+    pass
+
+
+class FakeTask:
+    """Enough of a bound Celery task for deliver_channel"""
+    max_retries = 5
+
+    def __init__(self):
+        self.request = SimpleNamespace(retries=0)
+        self.deferred = []
+
+    def retry(self, exc, countdown, kwargs):
+        return Retry(countdown)
+
+    def apply_async(self, args, kwargs, countdown, retries):
+        self.deferred.append((args[0], countdown))
+
+
+@pytest.fixture
+def sms_deliveries(db, user, redis_server, monkeypatch):
+    """Ids of notifications with a pending sms delivery, delivered on the test's session"""
+    ids = [uuid7() for _ in range(4)]
+    db.add_all([
+        models.Notification(id=notification_id, user_id=user.id, title="t", message="m", channels=["sms"])
+        for notification_id in ids
+    ])
+    db.commit()
+    notification_tasks.create_deliveries(db, ids)
+    monkeypatch.setattr(notification_tasks, "get_worker_session", lambda: db)
+    return ids
+
+
+def test_provider_outage_trips_the_breaker_shared_by_workers(breakers, sms_deliveries, monkeypatch):
+    attempts = []
+
+    def twilio_down(notification, phone, message, title):
+        attempts.append(notification.id)
+        raise ProviderError("Twilio unavailable: HTTP 503")
+    monkeypatch.setattr(notification_tasks, "send_sms_notification", twilio_down)
+
+    # Deliveries alternate between two workers until the failures add up
+    for notification_id, breaker in zip(sms_deliveries[:3], breakers * 2):
+        monkeypatch.setitem(notification_tasks.circuit_breakers, "sms", breaker)
+        with pytest.raises(Retry):
+            notification_tasks.deliver_channel(FakeTask(), notification_id, "sms")
+    assert state(breakers[0]) == "open"
+
+    # The other worker now defers without calling the provider or spending an attempt
+    monkeypatch.setitem(notification_tasks.circuit_breakers, "sms", breakers[1])
+    task = FakeTask()
+    result = notification_tasks.deliver_channel(task, sms_deliveries[3], "sms")
+
+    assert result["status"] == "deferred"
+    assert [notification_id for notification_id, _ in task.deferred] == [sms_deliveries[3]]
+    assert attempts == sms_deliveries[:3]
+
+
+def test_recipient_errors_do_not_trip_the_breaker(breakers, sms_deliveries, monkeypatch):
+    def no_phone(notification, phone, message, title):
+        raise ValueError("Failed to send SMS to None")
+    monkeypatch.setattr(notification_tasks, "send_sms_notification", no_phone)
+    monkeypatch.setitem(notification_tasks.circuit_breakers, "sms", breakers[0])
+
+    for notification_id in sms_deliveries:
+        with pytest.raises(Retry):
+            notification_tasks.deliver_channel(FakeTask(), notification_id, "sms")
+
+    assert state(breakers[0]) == "closed"
+    assert breakers[1].client().hget(breakers[1].key, "failures") is None
+
+
+def test_only_provider_side_errors_count():
+    assert sms_service.is_provider_failure(TwilioRestException(503, "/Messages.json"))
+    assert sms_service.is_provider_failure(ConnectTimeout())
+    assert not sms_service.is_provider_failure(TwilioRestException(400, "/Messages.json", "Invalid 'To' number"))
+    assert email_service.is_provider_failure(smtplib.SMTPServerDisconnected())
+    assert email_service.is_provider_failure(smtplib.SMTPResponseException(421, b"Service not available"))
+    assert not email_service.is_provider_failure(smtplib.SMTPRecipientsRefused({"x@example.com": (550, b"No such user")}))
@@ -0,0 +1,29 @@
+import pytest
+
+from app.services import backoff
+from app.workers import dead_letters
+
+
+class Retry(Exception):
+    pass
+
+
+def test_failed_replay_step_retries_with_jitter_and_keeps_its_filters(monkeypatch):
+    def failing_step(**step):
+        raise ConnectionError("database unavailable")
+    monkeypatch.setattr(dead_letters, "replay_step", failing_step)
+    retries = []
+
+    def retry(exc, countdown, kwargs):
+        retries.append((countdown, kwargs))
+        return Retry()
+    monkeypatch.setattr(dead_letters.replay_dead_letters, "retry", retry)
+
+    with pytest.raises(Retry):
+        dead_letters.replay_dead_letters.run(channel="sms", error_class="ProviderError", prev_backoff=10)
+
+    (countdown, kwargs), = retries
+    assert backoff.RETRY_BASE_SECONDS <= countdown <= 30
+    assert kwargs == dict(
+        channel="sms", error_class="ProviderError", since=None, until=None, rate=None, prev_backoff=countdown,
+    )
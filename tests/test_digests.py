@@ -0,0 +1,114 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import models
+from app.services import digest
+from app.services.ids import uuid7
+from app.services.user_cache import routing_cache
+from app.workers import digests, notification_tasks
+
+
+@pytest.fixture
+def digest_user(db, user, redis_server, monkeypatch):
+    user.preferences = {"email": True, "digest": True}
+    db.commit()
+    routing_cache.clear()
+    monkeypatch.setattr(notification_tasks, "get_worker_session", lambda: db)
+    monkeypatch.setattr(digests, "get_worker_session", lambda: db)
+    yield user
+    routing_cache.clear()
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+    monkeypatch.setattr(digests, "send_channel", lambda channel, context, title, message: sent.append((title, message)))
+    return sent
+
+
+def buffer(db, user, count):
+    """Run the email task for count new notifications; returns their ids"""
+    task = SimpleNamespace(request=SimpleNamespace(retries=0), max_retries=5)
+    notification_ids = []
+    for index in range(count):
+        notification = models.Notification(
+            id=uuid7(), user_id=user.id, title=f"t{index}", message=f"m{index}", channels=["email"]
+        )
+        db.add(notification)
+        db.commit()
+        notification_tasks.create_deliveries(db, [notification.id])
+        assert notification_tasks.deliver_channel(task, notification.id, "email")["status"] == "buffered"
+        notification_ids.append(notification.id)
+    return notification_ids
+
+
+def statuses(db, notification_ids):
+    return [
+        db.query(models.NotificationDelivery.status).filter_by(notification_id=notification_id).scalar()
+        for notification_id in notification_ids
+    ]
+
+
+def make_due(redis_client, user):
+    member = digest.digest_member("email", user.id)
+    redis_client.zadd(digest.DIGEST_DUE_KEY, {member: 0})
+    return member
+
+
+def test_buffered_notifications_wait_for_the_first_arrivals_window(db, digest_user, sent):
+    start = time.time()
+    notification_ids = buffer(db, digest_user, 3)
+    redis_client = notification_tasks.get_redis()
+
+    assert redis_client.zrange(digest.digest_key("email", digest_user.id), 0, -1) == notification_ids
+    # Scheduled by the first arrival only
+    due_at = redis_client.zscore(digest.DIGEST_DUE_KEY, digest.digest_member("email", digest_user.id))
+    assert start + digest.DIGEST_WINDOW_SECONDS <= due_at <= time.time() + digest.DIGEST_WINDOW_SECONDS
+    # Released back to pending, and nothing flushed before the window closes
+    assert statuses(db, notification_ids) == ["pending"] * 3
+    assert digests.flush_digests() == 0
+    assert sent == []
+
+
+def test_a_due_buffer_is_leased_to_one_flusher(digest_user):
+    redis_client = notification_tasks.get_redis()
+    claim_due = redis_client.register_script(digests.CLAIM_DUE_SCRIPT)
+    member = make_due(redis_client, digest_user)
+    now = time.time()
+
+    assert claim_due(keys=[digest.DIGEST_DUE_KEY], args=[now, 10, now + digests.DIGEST_LEASE_SECONDS]) == [member]
+    assert claim_due(keys=[digest.DIGEST_DUE_KEY], args=[now, 10, now + digests.DIGEST_LEASE_SECONDS]) == []
+    # A flusher that dies leaves the buffer to whoever claims it once the lease is over
+    later = now + digests.DIGEST_LEASE_SECONDS
+    assert claim_due(keys=[digest.DIGEST_DUE_KEY], args=[later, 10, later + 1]) == [member]
+
+
+def test_flush_sends_one_message_and_finishes_the_buffer(db, digest_user, sent):
+    notification_ids = buffer(db, digest_user, 3)
+    redis_client = notification_tasks.get_redis()
+    member = make_due(redis_client, digest_user)
+
+    assert digests.flush_digests() == 3
+
+    assert sent == [digest.format_digest([(f"t{index}", f"m{index}") for index in range(3)])]
+    assert statuses(db, notification_ids) == ["sent"] * 3
+    assert db.query(models.NotificationDelivery).filter_by(via_digest=True).count() == 3
+    assert {status for status, in db.query(models.Notification.status)} == {models.NotificationStatus.SENT}
+    assert not redis_client.exists(digest.digest_key("email", digest_user.id))
+    assert redis_client.zscore(digest.DIGEST_DUE_KEY, member) is None
+
+
+def test_flush_leaves_the_rest_for_the_next_window(db, digest_user, sent, monkeypatch):
+    monkeypatch.setattr(digests, "DIGEST_MAX_ITEMS", 2)
+    notification_ids = buffer(db, digest_user, 3)
+    redis_client = notification_tasks.get_redis()
+    member = make_due(redis_client, digest_user)
+    start = time.time()
+
+    assert digests.flush_digests() == 2
+
+    assert statuses(db, notification_ids) == ["sent", "sent", "pending"]
+    assert redis_client.zrange(digest.digest_key("email", digest_user.id), 0, -1) == notification_ids[2:]
+    assert redis_client.zscore(digest.DIGEST_DUE_KEY, member) >= start + digest.DIGEST_WINDOW_SECONDS
@@ -0,0 +1,56 @@
+from app import models
+from app.services import reliable_queue
+from app.services.ids import uuid7
+from app.workers import email_batcher
+from app.workers.notification_tasks import EMAIL_BATCH_QUEUE, get_redis
+
+
+def test_batch_of_a_dead_batcher_is_requeued(redis_server):
+    client = get_redis()
+    client.rpush(EMAIL_BATCH_QUEUE, "n1", "n2", "n3")
+    assert email_batcher.collect_batch(client, "dead") == ["n1", "n2", "n3"]
+    # It dies holding the batch and its lease runs out
+    client.hset(reliable_queue.registry_key(EMAIL_BATCH_QUEUE), "dead", 0)
+    assert client.llen(EMAIL_BATCH_QUEUE) == 0
+
+    assert reliable_queue.renew_lease(client, EMAIL_BATCH_QUEUE, "alive") == 3
+
+    assert client.lrange(EMAIL_BATCH_QUEUE, 0, -1) == ["n1", "n2", "n3"]
+    assert client.llen(reliable_queue.processing_key(EMAIL_BATCH_QUEUE, "dead")) == 0
+
+
+def test_acknowledged_batch_leaves_the_processing_list(redis_server):
+    client = get_redis()
+    client.rpush(EMAIL_BATCH_QUEUE, "n1", "n2")
+    batch = email_batcher.collect_batch(client, "batcher")
+
+    email_batcher.acknowledge(client, batch, "batcher")
+
+    assert client.llen(reliable_queue.processing_key(EMAIL_BATCH_QUEUE, "batcher")) == 0
+    assert reliable_queue.renew_lease(client, EMAIL_BATCH_QUEUE, "other") == 0
+
+
+def test_process_batch_marks_deliveries(db, user, redis_server, monkeypatch):
+    handed_back = []
+    monkeypatch.setattr(email_batcher, "retry_individually", handed_back.extend)
+    monkeypatch.setattr(email_batcher, "send_many", lambda messages: [None, ValueError("no recipient")])
+    ids = [uuid7(), uuid7()]
+    db.add_all([
+        models.Notification(id=notification_id, user_id=user.id, title="t", message="m", channels=["email"])
+        for notification_id in ids
+    ])
+    db.commit()
+
+    email_batcher.process_batch(ids)
+
+    statuses = dict(db.query(models.NotificationDelivery.notification_id, models.NotificationDelivery.status))
+    assert statuses == {ids[0]: models.NotificationStatus.SENT.value, ids[1]: models.NotificationStatus.PENDING.value}
+    assert db.query(models.Notification.status).filter_by(id=ids[0]).scalar() == models.NotificationStatus.SENT
+    assert handed_back == [ids[1]]
+
+    # Coming round again (e.g. requeued after a crash) does not send it twice
+    monkeypatch.setattr(email_batcher, "send_many", lambda messages: [None] * len(messages))
+    email_batcher.process_batch(ids)
+    assert dict(db.query(models.NotificationDelivery.notification_id, models.NotificationDelivery.status)) == {
+        ids[0]: models.NotificationStatus.SENT.value, ids[1]: models.NotificationStatus.SENT.value
+    }
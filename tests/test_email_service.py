@@ -0,0 +1,54 @@
+import smtplib
+
+import pytest
+
+from app.services import email_service
+
+
+class FakeSMTP:
+    instances = []
+    fail_login = True
+
+    def __init__(self, host, port, timeout):
+        self.closed = False
+        FakeSMTP.instances.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        if FakeSMTP.fail_login:
+            raise smtplib.SMTPAuthenticationError(535, b"Authentication failed")
+
+    def quit(self):
+        self.closed = True
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    FakeSMTP.instances = []
+    FakeSMTP.fail_login = True
+    monkeypatch.setattr(email_service.smtplib, "SMTP", FakeSMTP)
+    monkeypatch.setattr(email_service, "SMTP_PASSWORD", "secret")
+    return FakeSMTP
+
+
+def test_failed_login_leaves_no_session_behind(smtp):
+    conn = email_service.PooledSMTPConnection()
+
+    with pytest.raises(smtplib.SMTPAuthenticationError):
+        conn.open()
+
+    assert conn.server is None
+    assert smtp.instances[0].closed
+
+
+def test_session_is_opened_again_after_a_failed_login(smtp):
+    conn = email_service.PooledSMTPConnection()
+    with pytest.raises(smtplib.SMTPAuthenticationError):
+        conn.ensure_alive()
+
+    smtp.fail_login = False
+    conn.ensure_alive()
+
+    assert conn.server is smtp.instances[1]
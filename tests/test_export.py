@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app import models, schemas
+from app.database import async_engine
+from app.routers import notifications
+from app.services.ids import uuid7
+
+
+def export(current_user, **filters):
+    """The NDJSON export as a list of records"""
+    async def run():
+        try:
+            response = await notifications.export_notifications(
+                user_id=filters.get("user_id"), status=None, since=None, until=None,
+                format="ndjson", current_user=current_user,
+            )
+            return [chunk async for chunk in response.body_iterator]
+        finally:
+            await async_engine.dispose()
+    return [json.loads(line) for line in "".join(asyncio.run(run())).splitlines()]
+
+
+@pytest.fixture
+def two_users(db, user):
+    other = models.User(email="other@example.com", password="x")
+    db.add(other)
+    db.commit()
+    for owner in (user, other):
+        db.add(models.Notification(id=uuid7(), user_id=owner.id, title="t", message="m", channels=["email"]))
+    db.commit()
+    return user, other
+
+
+def test_users_export_only_their_own_notifications(two_users):
+    user, other = two_users
+
+    records = export(schemas.Principal(id=user.id))
+
+    assert [record["user_id"] for record in records] == [user.id]
+    with pytest.raises(HTTPException) as exc:
+        export(schemas.Principal(id=user.id), user_id=other.id)
+    assert exc.value.status_code == 403
+
+
+def test_admins_export_everyone(two_users, monkeypatch):
+    user, other = two_users
+    monkeypatch.setattr(notifications, "ADMIN_USER_IDS", {user.id})
+
+    assert sorted(record["user_id"] for record in export(schemas.Principal(id=user.id))) == [user.id, other.id]
+    assert [record["user_id"] for record in export(schemas.Principal(id=user.id), user_id=other.id)] == [other.id]
@@ -0,0 +1,154 @@
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+
+from app import models
+from app.services.ids import uuid7
+from app.workers import notification_tasks
+
+
+class FakeTask:
+    def __init__(self, channel, published, fail=False):
+        self.channel = channel
+        self.published = published
+        self.fail = fail
+
+    def apply_async(self, args, producer=None):
+        if self.fail:
+            raise ConnectionError("broker unavailable")
+        self.published.append((args[0], self.channel))
+
+
+@pytest.fixture
+def published(monkeypatch):
+    published = []
+    monkeypatch.setattr(notification_tasks.app, "producer_or_acquire", lambda: nullcontext())
+    for channel in notification_tasks.CHANNEL_TASKS:
+        monkeypatch.setitem(notification_tasks.CHANNEL_TASKS, channel, FakeTask(channel, published))
+    return published
+
+
+def add_notification(db, user, channels):
+    notification = models.Notification(id=uuid7(), user_id=user.id, title="t", message="m", channels=channels)
+    db.add(notification)
+    db.commit()
+    return notification.id
+
+
+def test_retry_republishes_deliveries_left_pending(db, user, published):
+    notification_id = add_notification(db, user, ["email", "sms"])
+    notification_tasks.CHANNEL_TASKS["sms"].fail = True
+    with pytest.raises(ConnectionError):
+        notification_tasks.fan_out(db, [notification_id])
+    db.rollback()
+    assert db.query(models.NotificationDelivery).count() == 2
+
+    notification_tasks.CHANNEL_TASKS["sms"].fail = False
+    published.clear()
+    notification_tasks.fan_out(db, [notification_id])
+
+    assert sorted(published) == [(notification_id, "email"), (notification_id, "sms")]
+    assert db.query(models.NotificationDelivery).count() == 2
+
+
+def test_finished_deliveries_are_not_republished(db, user, published):
+    notification_id = add_notification(db, user, ["email", "sms"])
+    notification_tasks.fan_out(db, [notification_id])
+    db.query(models.NotificationDelivery).filter_by(channel="email").update(
+        {"status": models.NotificationStatus.SENT.value}
+    )
+    db.commit()
+    published.clear()
+
+    notification_tasks.fan_out(db, [notification_id])
+
+    assert published == [(notification_id, "sms")]
+
+
+def test_a_delivery_is_claimed_by_one_task_at_a_time(db, user):
+    notification_id = add_notification(db, user, ["email"])
+    notification_tasks.create_deliveries(db, [notification_id])
+
+    assert notification_tasks.claim_delivery(db, notification_id, "email")
+    assert not notification_tasks.claim_delivery(db, notification_id, "email")
+    notification_tasks.release_delivery(db, notification_id, "email")
+    assert notification_tasks.claim_delivery(db, notification_id, "email")
+
+    # A claim held by a worker that died is taken over once it is stale
+    db.query(models.NotificationDelivery).update({
+        "updated_at": text(f"now() - interval '{notification_tasks.DELIVERY_CLAIM_SECONDS + 1} seconds'")
+    }, synchronize_session=False)
+    db.commit()
+    assert notification_tasks.claim_delivery(db, notification_id, "email")
+
+    notification_tasks.mark_delivery(db, notification_id, "email", models.NotificationStatus.SENT)
+    assert not notification_tasks.claim_delivery(db, notification_id, "email")
+
+
+def test_republished_delivery_is_sent_once(db, user, redis_server, monkeypatch):
+    notification_id = add_notification(db, user, ["push"])
+    notification_tasks.create_deliveries(db, [notification_id])
+    monkeypatch.setattr(notification_tasks, "get_worker_session", lambda: db)
+    task = SimpleNamespace(request=SimpleNamespace(retries=0), max_retries=5)
+    sends, duplicates = [], []
+
+    def send_push(notification, message, title):
+        sends.append(notification.id)
+        # A second copy of the task runs while the first is still sending
+        duplicates.append(notification_tasks.deliver_channel(task, notification_id, "push"))
+    monkeypatch.setattr(notification_tasks, "send_push_notification", send_push)
+
+    result = notification_tasks.deliver_channel(task, notification_id, "push")
+
+    assert result["status"] == "sent"
+    assert sends == [notification_id]
+    assert duplicates == [None]
+
+
+def test_mark_deliveries_settles_every_notification_at_once(db, user):
+    ids = [add_notification(db, user, ["email", "sms"]) for _ in range(3)]
+    notification_tasks.create_deliveries(db, ids)
+
+    notification_tasks.mark_deliveries(db, ids, "email", models.NotificationStatus.SENT)
+    notification_tasks.mark_deliveries(db, ids[:2], "sms", models.NotificationStatus.SENT)
+    notification_tasks.mark_deliveries(db, ids[2:], "sms", models.NotificationStatus.FAILED, "bounced", "ProviderError")
+    # A duplicate run records no second dead letter
+    notification_tasks.mark_deliveries(db, ids[2:], "sms", models.NotificationStatus.FAILED, "bounced", "ProviderError")
+
+    statuses = dict(db.query(models.Notification.id, models.Notification.status).all())
+    assert [statuses[notification_id] for notification_id in ids] == [
+        models.NotificationStatus.SENT, models.NotificationStatus.SENT, models.NotificationStatus.FAILED,
+    ]
+    assert db.query(models.Notification.sent_at).filter_by(id=ids[0]).scalar() is not None
+    dead_letters = db.query(models.DeadLetter).all()
+    assert [(letter.notification_id, letter.channel, letter.error) for letter in dead_letters] == [
+        (ids[2], "sms", "bounced"),
+    ]
+    assert dead_letters[0].attempts == 1
+
+
+def test_notification_without_a_known_channel_is_failed(db, user, published):
+    notification_id = add_notification(db, user, ["fax"])
+
+    notification_tasks.fan_out(db, [notification_id])
+
+    assert published == []
+    assert db.query(models.Notification.status).filter_by(id=notification_id).scalar() == models.NotificationStatus.FAILED
+
+
+def test_pending_gauge_counts_due_unfinished_notifications(db, user, monkeypatch):
+    monkeypatch.setattr(notification_tasks, "get_worker_session", lambda: db)
+    due, sent = add_notification(db, user, ["email"]), add_notification(db, user, ["email"])
+    notification_tasks.create_deliveries(db, [due, sent])
+    notification_tasks.mark_delivery(db, sent, "email", models.NotificationStatus.SENT)
+    db.add(models.Notification(
+        id=uuid7(), user_id=user.id, title="t", message="m", channels=["email"],
+        scheduled_at=datetime.now(timezone.utc) + timedelta(hours=1),
+    ))
+    db.commit()
+
+    assert notification_tasks.measure_pending_notifications() == 1
+    assert notification_tasks.pending_notifications.collect()[0].samples[0].value == 1
@@ -0,0 +1,32 @@
+import asyncio
+
+from app.services import idempotency
+from app.services.redis_pubsub import get_async_redis
+
+
+def ttl(user_id, key):
+    return asyncio.run(get_async_redis().ttl(idempotency.redis_key(user_id, key)))
+
+
+def test_in_progress_claim_expires_quickly(redis_server):
+    assert asyncio.run(idempotency.claim(1, "abc")) is None
+    assert asyncio.run(idempotency.claim(1, "abc")) == idempotency.IN_PROGRESS
+    assert 0 < ttl(1, "abc") <= idempotency.IDEMPOTENCY_LOCK_TTL
+    # Other users' keys are separate
+    assert asyncio.run(idempotency.claim(2, "abc")) is None
+
+
+def test_stored_response_is_kept_and_replayed(redis_server):
+    asyncio.run(idempotency.claim(1, "abc"))
+    asyncio.run(idempotency.store_response(1, "abc", '{"id": "n1"}'))
+
+    assert ttl(1, "abc") > idempotency.IDEMPOTENCY_LOCK_TTL
+    assert ttl(1, "abc") <= idempotency.IDEMPOTENCY_KEY_TTL
+    assert asyncio.run(idempotency.claim(1, "abc")) == '{"id": "n1"}'
+
+
+def test_released_claim_can_be_taken_again(redis_server):
+    asyncio.run(idempotency.claim(1, "abc"))
+    asyncio.run(idempotency.release(1, "abc"))
+
+    assert asyncio.run(idempotency.claim(1, "abc")) is None
@@ -0,0 +1,68 @@
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, text
+
+from app import models
+from app.services import ids
+
+
+def uuid7_at(moment: datetime) -> str:
+    """A version 7 id carrying the given time"""
+    milliseconds = int(moment.timestamp() * 1000)
+    return str(uuid.UUID(int=(milliseconds << 80) | (0x7 << 76) | (0b10 << 62) | uuid.uuid4().int >> 66))
+
+
+def test_ids_are_time_ordered_and_carry_their_time():
+    before = datetime.now(timezone.utc) - timedelta(milliseconds=1)
+    generated = [ids.uuid7() for _ in range(1000)]
+
+    assert generated == sorted(generated)
+    assert len(set(generated)) == len(generated)
+    assert before <= ids.id_time(generated[0]) <= datetime.now(timezone.utc)
+    assert ids.id_time(str(uuid.uuid4())) is None
+    assert ids.id_time("not-an-id") is None
+
+
+def lookup(db, notification_id):
+    """Fetch by id with the implied created_at bounds; returns the row and the partitions the plan touches"""
+    query = select(models.Notification.id).where(
+        models.Notification.id == notification_id,
+        *ids.created_at_bounds(models.Notification.created_at, notification_id),
+    )
+    compiled = query.compile(db.bind, compile_kwargs={"literal_binds": True})
+    plan = "\n".join(db.execute(text(f"EXPLAIN {compiled}")).scalars())
+    partitions = set(re.findall(r" on (notifications_\w+)", plan))
+    return db.execute(query).scalar(), partitions
+
+
+def test_lookup_by_v7_id_touches_one_partition(db, user):
+    created_at = datetime.now(timezone.utc) + timedelta(days=45)
+    notification_id = uuid7_at(created_at)
+    db.add(models.Notification(
+        id=notification_id, user_id=user.id, title="t", message="m", channels=["email"], created_at=created_at,
+    ))
+    db.commit()
+
+    found, partitions = lookup(db, notification_id)
+
+    assert found == notification_id
+    assert len(partitions) == 1
+
+
+def test_lookup_by_legacy_v4_id_still_finds_the_row(db, user):
+    notification_id = str(uuid.uuid4())
+    db.add(models.Notification(
+        id=notification_id, user_id=user.id, title="t", message="m", channels=["email"],
+        created_at=datetime.now(timezone.utc) + timedelta(days=45),
+    ))
+    db.commit()
+
+    assert ids.created_at_bounds(models.Notification.created_at, notification_id) == []
+    assert ids.created_at_range(models.Notification.created_at, [ids.uuid7(), notification_id]) == []
+    found, partitions = lookup(db, notification_id)
+
+    assert found == notification_id
+    # No time in the id, so every partition is searched
+    assert len(partitions) > 1
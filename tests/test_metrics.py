@@ -0,0 +1,21 @@
+import os
+
+from app.services import metrics
+
+
+def test_a_process_deletes_its_pushgateway_group_once(monkeypatch):
+    deleted = []
+    monkeypatch.setattr(metrics, "delete_from_gateway", lambda url, job, grouping_key: deleted.append(grouping_key))
+    monkeypatch.setattr(metrics, "_pushing_stopped", metrics.threading.Event())
+
+    # Nothing was pushed from this process
+    monkeypatch.setattr(metrics, "_pushing_pid", None)
+    metrics.delete_pushed_metrics()
+    assert deleted == []
+
+    monkeypatch.setattr(metrics, "_pushing_pid", os.getpid())
+    metrics.delete_pushed_metrics()
+    metrics.delete_pushed_metrics()
+
+    assert deleted == [metrics.grouping_key()]
+    assert metrics._pushing_stopped.is_set()
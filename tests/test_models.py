@@ -0,0 +1,40 @@
+import asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+from app import models
+from app.database import ASYNC_DATABASE_URL
+from app.services.ids import uuid7
+
+
+def test_notification_round_trip_through_asyncpg(user):
+    """The API's driver reads and writes the migrated enum and uuid types"""
+    async def round_trip():
+        engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+        try:
+            async with AsyncSession(engine) as db:
+                notification_id = uuid7()
+                db.add(models.Notification(
+                    id=notification_id, user_id=user.id, title="t", message="m", channels=["email"],
+                    status=models.NotificationStatus.PENDING,
+                ))
+                await db.commit()
+                result = await db.execute(
+                    select(models.Notification).where(models.Notification.id == notification_id)
+                )
+                return notification_id, result.scalars().one()
+        finally:
+            await engine.dispose()
+
+    notification_id, notification = asyncio.run(round_trip())
+    assert notification.id == notification_id
+    assert notification.status == models.NotificationStatus.PENDING
+
+
+def test_notification_status_update_through_psycopg2(db, user):
+    notification = models.Notification(id=uuid7(), user_id=user.id, title="t", message="m", channels=["sms"])
+    db.add(notification)
+    db.commit()
+    notification.status = models.NotificationStatus.SENT
+    db.commit()
+    assert db.execute(select(models.Notification.status)).scalar() == models.NotificationStatus.SENT
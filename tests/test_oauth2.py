@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app import models, oauth2
+from app.services import user_cache
+
+
+@pytest.fixture
+def embedded_claims(monkeypatch, redis_server):
+    monkeypatch.setattr(oauth2, "JWT_EMBED_PRINCIPAL", True)
+    user_cache.principal_cache.clear()
+    yield
+    user_cache.principal_cache.clear()
+
+
+def authenticate(token, async_db):
+    return asyncio.run(oauth2.get_current_user(token=token, db=async_db))
+
+
+def token_for(user):
+    return oauth2.create_access_token({"user_id": user.id, **oauth2.principal_claims(user)})
+
+
+def test_claims_are_trusted_until_the_user_is_invalidated(db, async_db, user, embedded_claims):
+    token = token_for(user)
+    assert authenticate(token, async_db).id == user.id
+
+    db.query(models.User).filter_by(id=user.id).update({"is_active": False})
+    db.commit()
+    asyncio.run(user_cache.broadcast_user_invalidation(user.id))
+
+    # The watermark lives in Redis, so no process-local state is needed to see it
+    assert not asyncio.run(user_cache.claims_trusted(user.id, oauth2.verify_access_token(token, None).issued_at))
+    with pytest.raises(HTTPException) as exc:
+        authenticate(token, async_db)
+    assert exc.value.detail == "Inactive user"
+
+
+def test_inactive_users_are_refused_on_every_path(db, async_db, user, embedded_claims, monkeypatch):
+    db.query(models.User).filter_by(id=user.id).update({"is_active": False})
+    db.commit()
+    db.refresh(user)
+    token = token_for(user)
+
+    def assert_refused():
+        with pytest.raises(HTTPException) as exc:
+            authenticate(token, async_db)
+        assert exc.value.status_code == 401
+
+    assert_refused()  # from the embedded claims
+    monkeypatch.setattr(oauth2, "JWT_EMBED_PRINCIPAL", False)
+    assert_refused()  # from the database
+    assert user_cache.principal_cache.get(user.id) is not None
+    assert_refused()  # from the principal cache
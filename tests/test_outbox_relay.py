@@ -0,0 +1,44 @@
+from app import models
+from app.services.ids import uuid7
+from app.services.metrics import worker_registry
+from app.workers import outbox_relay
+
+
+def published_total():
+    return worker_registry.get_sample_value("outbox_published_total") or 0
+
+
+def delay_count():
+    return worker_registry.get_sample_value("outbox_publish_delay_seconds_count") or 0
+
+
+def test_relay_batch_publishes_deletes_and_records_delay(db, monkeypatch):
+    published = []
+    monkeypatch.setattr(outbox_relay, "enqueue_notifications", published.extend)
+    entries = [(uuid7(), ["email"]), (uuid7(), ["sms", "push"])]
+    db.add_all([models.OutboxEntry(notification_id=nid, channels=channels) for nid, channels in entries])
+    db.commit()
+    published_before, delays_before = published_total(), delay_count()
+
+    assert outbox_relay.relay_batch(db) == 2
+
+    assert published == entries
+    assert db.query(models.OutboxEntry).count() == 0
+    assert published_total() - published_before == 2
+    assert delay_count() - delays_before == 2
+    # Nothing left: the next poll publishes nothing
+    assert outbox_relay.relay_batch(db) == 0
+
+
+def test_relay_batch_keeps_entries_when_publishing_fails(db, monkeypatch):
+    def broker_down(notifications):
+        raise ConnectionError("broker unavailable")
+    monkeypatch.setattr(outbox_relay, "enqueue_notifications", broker_down)
+    db.add(models.OutboxEntry(notification_id=uuid7(), channels=["email"]))
+    db.commit()
+
+    try:
+        outbox_relay.relay_batch(db)
+    except ConnectionError:
+        db.rollback()
+    assert db.query(models.OutboxEntry).count() == 1
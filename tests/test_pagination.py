@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app import models
+from app.pagination import decode_cursor, encode_cursor, notification_page
+from app.services.ids import uuid7
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 10, 18, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    notification_id = uuid7()
+
+    cursor = encode_cursor(created_at, notification_id)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, notification_id)
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(encode_cursor(created_at, "not-an-id"))
+    assert exc.value.status_code == 400
+
+
+def test_pages_walk_the_history_newest_first_without_gaps(db, async_db, user):
+    now = datetime.now(timezone.utc)
+    # Pairs share a created_at, so ties must be broken by id
+    notifications = [
+        models.Notification(
+            id=uuid7(), user_id=user.id, title="t", message="m", channels=["email"],
+            created_at=now - timedelta(minutes=index // 2),
+        )
+        for index in range(7)
+    ]
+    db.add_all(notifications)
+    db.commit()
+    expected = [
+        notification.id for notification in
+        sorted(notifications, key=lambda n: (n.created_at, n.id), reverse=True)
+    ]
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = asyncio.run(notification_page(async_db, user.id, cursor, limit=3))
+        seen += [notification.id for notification in page["items"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == expected
+    assert pages == 3
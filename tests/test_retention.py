@@ -0,0 +1,55 @@
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, text
+from app import models
+from app.services.ids import uuid7
+from app.services.partitions import LEGACY_PARTITION, attached_partitions, detached_partitions
+from app.workers import retention
+
+
+def test_archive_expired_partitions_archives_then_drops(db, user, tmp_path, monkeypatch, request):
+    monkeypatch.setattr(retention, "NOTIFICATION_ARCHIVE_DIR", str(tmp_path))
+    with retention.autocommit_connection() as conn:
+        bounds = dict((name, upper) for name, upper, _ in attached_partitions(conn))
+    # Expire the legacy partition (the oldest) but not the month after it
+    legacy_end = bounds[LEGACY_PARTITION]
+    now = datetime.now(timezone.utc)
+    monkeypatch.setattr(retention, "NOTIFICATION_RETENTION_DAYS", -((legacy_end - now).days + 1))
+    old_id, current_id = uuid7(), uuid7()
+    db.add_all([
+        models.Notification(
+            id=old_id, user_id=user.id, title="old", message="m", channels=["email"],
+            created_at=datetime.now(timezone.utc) - timedelta(days=400),
+        ),
+        models.Notification(
+            id=current_id, user_id=user.id, title="new", message="m", channels=["email"],
+            created_at=legacy_end + timedelta(days=1),
+        ),
+        models.NotificationDelivery(notification_id=old_id, channel="email"),
+        models.NotificationDelivery(notification_id=current_id, channel="email"),
+    ])
+    db.commit()
+
+    def restore_legacy_partition():
+        # Later tests still need somewhere to put rows created this month
+        db.rollback()
+        with retention.autocommit_connection() as conn:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {LEGACY_PARTITION} PARTITION OF notifications "
+                f"FOR VALUES FROM (MINVALUE) TO ('{legacy_end.isoformat()}')"
+            ))
+    request.addfinalizer(restore_legacy_partition)
+
+    archived = retention.archive_expired_partitions()
+
+    assert archived == [LEGACY_PARTITION]
+    with gzip.open(tmp_path / f"{LEGACY_PARTITION}.ndjson.gz", "rt", encoding="utf-8") as archive:
+        rows = [json.loads(line) for line in archive]
+    assert [row["id"] for row in rows] == [old_id]
+    with retention.autocommit_connection() as conn:
+        assert LEGACY_PARTITION not in [name for name, _, _ in attached_partitions(conn)]
+        assert detached_partitions(conn) == []
+        assert conn.execute(text(f"SELECT to_regclass('{LEGACY_PARTITION}')")).scalar() is None
+    assert db.execute(select(models.NotificationDelivery.notification_id)).scalars().all() == [current_id]
+    assert db.execute(select(models.Notification.id)).scalars().all() == [current_id]
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+
+from app import models
+from app.services.schedule import SCHEDULED_KEY
+from app.services.ids import uuid7
+from app.workers import scheduler
+
+
+def schedule(db, user, due_at):
+    notification = models.Notification(
+        id=uuid7(), user_id=user.id, title="t", message="m", channels=["email"], scheduled_at=due_at
+    )
+    db.add(notification)
+    db.add(models.ScheduledNotification(notification_id=notification.id, due_at=due_at))
+    db.commit()
+    return notification.id
+
+
+def outbox(db):
+    return sorted(notification_id for notification_id, in db.query(models.OutboxEntry.notification_id))
+
+
+def test_only_due_notifications_move_to_the_outbox(db, user, redis_server):
+    redis_client = scheduler.get_redis()
+    claim_due = redis_client.register_script(scheduler.CLAIM_DUE_SCRIPT)
+    now = datetime.now(timezone.utc)
+    due = sorted(schedule(db, user, now - timedelta(seconds=seconds)) for seconds in (1, 60))
+    later = schedule(db, user, now + timedelta(hours=1))
+    scheduler.rebuild_index(db, redis_client)
+    assert redis_client.zcard(SCHEDULED_KEY) == 3
+
+    assert scheduler.dispatch_due(db, redis_client, claim_due) == 2
+
+    assert outbox(db) == due
+    assert [row.notification_id for row in db.query(models.ScheduledNotification)] == [later]
+    assert redis_client.zrange(SCHEDULED_KEY, 0, -1) == [later]
+    # Nothing else is due yet
+    assert scheduler.dispatch_due(db, redis_client, claim_due) == 0
+
+
+def test_a_notification_moves_once(db, user, redis_server):
+    redis_client = scheduler.get_redis()
+    claim_due = redis_client.register_script(scheduler.CLAIM_DUE_SCRIPT)
+    notification_id = schedule(db, user, datetime.now(timezone.utc) - timedelta(seconds=1))
+    scheduler.rebuild_index(db, redis_client)
+    assert scheduler.dispatch_due(db, redis_client, claim_due) == 1
+
+    # Indexed again, e.g. by a rebuild racing the move
+    redis_client.zadd(SCHEDULED_KEY, {notification_id: 0})
+
+    assert scheduler.dispatch_due(db, redis_client, claim_due) == 0
+    assert outbox(db) == [notification_id]
+
+
+def test_sweep_moves_overdue_rows_missing_from_the_index(db, user, redis_server):
+    now = datetime.now(timezone.utc)
+    overdue = schedule(db, user, now - timedelta(seconds=scheduler.SCHEDULER_SWEEP_GRACE + 60))
+    # Due, but still within the grace the index gets to pop it
+    schedule(db, user, now - timedelta(seconds=scheduler.SCHEDULER_SWEEP_GRACE / 2))
+
+    assert scheduler.sweep(db) == 1
+    assert outbox(db) == [overdue]
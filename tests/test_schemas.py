@@ -0,0 +1,16 @@
+from typing import get_args
+
+import pytest
+from pydantic import ValidationError
+
+from app import schemas
+from app.workers.notification_tasks import CHANNEL_TASKS
+
+
+def test_only_deliverable_channels_are_accepted():
+    assert set(get_args(schemas.Channel)) == set(CHANNEL_TASKS)
+    notification = {"user_id": 1, "title": "t", "message": "m"}
+
+    assert schemas.NotificationCreate(**notification, channels=["email", "in_app"]).channels == ["email", "in_app"]
+    with pytest.raises(ValidationError):
+        schemas.NotificationCreate(**notification, channels=["email", "fax"])
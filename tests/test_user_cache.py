@@ -0,0 +1,47 @@
+import asyncio
+
+from app import models
+from app.services import user_cache
+
+
+def test_a_row_read_before_an_invalidation_is_not_cached(db, user, redis_server, monkeypatch):
+    user_cache.routing_cache.clear()
+    user_id = user.id
+    execute = db.execute
+
+    def racing_execute(statement, *args, **kwargs):
+        monkeypatch.setattr(db, "execute", execute)
+        stale = execute(statement, *args, **kwargs).freeze()
+        # The user is deactivated between the reader's query and its cache write
+        db.query(models.User).filter_by(id=user_id).update({"is_active": False})
+        db.commit()
+        asyncio.run(user_cache.broadcast_user_invalidation(user_id))
+        return stale()
+    monkeypatch.setattr(db, "execute", racing_execute)
+
+    assert user_cache.get_user_routing_sync(db, user_id).is_active
+
+    redis_client = user_cache.redis_pubsub.redis
+    assert not redis_client.exists(user_cache.routing_key(user_id))
+    assert user_cache.routing_cache.get(user_id) is None
+    assert not user_cache.get_user_routing_sync(db, user_id).is_active
+    assert redis_client.hget(user_cache.routing_key(user_id), "is_active") == "0"
+
+
+def test_routings_are_cached_until_invalidated(db, async_db, user, redis_server):
+    user_cache.routing_cache.clear()
+
+    async def lookup():
+        return await user_cache.get_user_routings(async_db, [user.id])
+
+    assert asyncio.run(lookup())[user.id].email == "user@example.com"
+    user_cache.routing_cache.clear()
+    # Served from Redis, without touching the database
+    db.query(models.User).filter_by(id=user.id).update({"email": "new@example.com"})
+    db.commit()
+    assert asyncio.run(lookup())[user.id].email == "user@example.com"
+
+    asyncio.run(user_cache.broadcast_user_invalidation(user.id))
+
+    assert asyncio.run(lookup())[user.id].email == "new@example.com"
+
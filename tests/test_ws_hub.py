@@ -0,0 +1,64 @@
+import asyncio
+
+from app.services import ws_hub
+from app.services.redis_pubsub import get_async_redis
+
+
+class FakeSocket:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+        self.closed_with = None
+
+    async def send_text(self, data):
+        if self.fail:
+            raise RuntimeError("socket is gone")
+        self.sent.append(data)
+
+    async def close(self, code):
+        self.closed_with = code
+
+
+async def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition never held")
+
+
+def test_failed_send_drops_and_closes_the_socket():
+    async def run():
+        hub = ws_hub.NotificationHub()
+        socket = FakeSocket(fail=True)
+        subscriber = hub.register(1, socket)
+
+        hub.deliver(1, "hello")
+        await wait_for(lambda: subscriber.sender.done())
+
+        assert 1 not in hub._subscribers
+        assert socket.closed_with == ws_hub.SEND_FAILED_CLOSE_CODE
+        # The endpoint still unregisters on disconnect; that is harmless now
+        hub.unregister(1, subscriber)
+    asyncio.run(run())
+
+
+def test_malformed_channel_does_not_stop_the_listener(redis_server):
+    async def run():
+        hub = ws_hub.NotificationHub()
+        socket = FakeSocket()
+        hub.register(7, socket)
+        hub.start()
+        try:
+            redis_client = get_async_redis()
+            while not await redis_client.pubsub_numpat():
+                await asyncio.sleep(0.01)
+            await redis_client.publish("notifications:user:not-a-number", "bad")
+            await redis_client.publish("notifications:user:7", "good")
+            await wait_for(lambda: socket.sent)
+
+            assert socket.sent == ["good"]
+            assert not hub._listener.done()
+        finally:
+            await hub.stop()
+    asyncio.run(run())